@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""autocomplete.py
+
+Udacity conference server-side Python App Engine autocomplete;
+    prefix index over distinct cities, topics and speakers, answered
+    with one key-range scan and cached per prefix in memcache
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import AutocompleteTerm
+
+MEMCACHE_AUTOCOMPLETE_PREFIX = 'AUTOCOMPLETE:'
+AUTOCOMPLETE_CACHE_SECONDS = 600
+
+# change ids remembered per term; retries come well within this many changes
+APPLIED_CHANGES_KEPT = 500
+
+
+def _termId(field, value):
+    return u'%s:%s' % (field, value.lower())
+
+
+def countChanges(field, oldValues, newValues):
+    """Return {field: {value: delta}} for values added to or removed from an entity."""
+    deltas = {}
+    for value in oldValues:
+        if value:
+            deltas[value] = deltas.get(value, 0) - 1
+    for value in newValues:
+        if value:
+            deltas[value] = deltas.get(value, 0) + 1
+    deltas = dict((value, delta) for value, delta in deltas.items() if delta)
+    return {field: deltas} if deltas else {}
+
+
+@ndb.transactional()
+def _updateTerm(field, value, delta, changeId):
+    term = ndb.Key(AutocompleteTerm, _termId(field, value)).get()
+    if not term:
+        term = AutocompleteTerm(id=_termId(field, value), value=value)
+    if changeId:
+        # task delivery is at least once; apply each change once
+        if changeId in term.applied:
+            return
+        term.applied = (term.applied + [changeId])[-APPLIED_CHANGES_KEPT:]
+    term.count += delta
+    if term.count > 0:
+        term.put()
+    else:
+        term.key.delete()
+
+
+def updateCounts(changes, changeId=None):
+    """Apply {field: {value: delta}} to the index and drop cached prefixes;
+    terms that already applied changeId are left as they are."""
+    for field, deltas in changes.items():
+        for value, delta in deltas.items():
+            _updateTerm(field, value, delta, changeId)
+            lowered = value.lower()
+            memcache.delete_multi([_termId(field, lowered[:i])
+                for i in range(len(lowered) + 1)],
+                key_prefix=MEMCACHE_AUTOCOMPLETE_PREFIX)
+
+
+def suggest(field, prefix, limit):
+    """Return [(value, count)] of indexed values of field starting with prefix."""
+    cacheKey = _termId(field, prefix)
+    cached = memcache.get(cacheKey, key_prefix=MEMCACHE_AUTOCOMPLETE_PREFIX)
+    # cached as (limit, suggestions); a bigger limit answers a smaller one
+    if cached is not None and cached[0] >= limit:
+        return cached[1][:limit]
+
+    # term ids sort as 'field:value', so a prefix is one key range
+    start = ndb.Key(AutocompleteTerm, cacheKey)
+    end = ndb.Key(AutocompleteTerm, cacheKey + u'\ufffd')
+    terms = AutocompleteTerm.query(AutocompleteTerm.key >= start,
+        AutocompleteTerm.key < end).fetch(limit)
+    suggestions = [(term.value, term.count) for term in terms]
+
+    memcache.set(cacheKey, (limit, suggestions), time=AUTOCOMPLETE_CACHE_SECONDS,
+        key_prefix=MEMCACHE_AUTOCOMPLETE_PREFIX)
+    return suggestions
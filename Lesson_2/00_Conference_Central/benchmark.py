@@ -0,0 +1,733 @@
+#!/usr/bin/env python
+
+"""benchmark.py
+
+Udacity conference server-side Python App Engine offline benchmark;
+    boots ConferenceApi against the testbed service stubs, seeds
+    conferences, sessions and profiles and drives every endpoint,
+    reporting latency percentiles, RPC counts and entities read
+
+usage:
+    benchmark.py --sdk PATH [--conferences N] [--sessions M] [--profiles K]
+                 [--iterations I] [--imports R] [--search-documents D]
+                 [--out baseline.json] [--compare baseline.json]
+                 [--tolerance 0.25]
+
+--imports times R cold imports, each in a fresh interpreter, of the API
+(conference.api) and of the task/cron handlers (main.app).
+
+--search-documents adds D synthetic sessions (default 100000) to the
+search index and measures search queries per second at that size.
+
+It also compares encode/decode throughput and size of the memcache
+form codec against pickle, and the index rows a put writes with every
+property indexed against the indexing policy of indexpolicy.py.
+
+With --compare, exits 1 when an endpoint's p95 latency, RPCs per call
+or entities read per call regress by more than --tolerance.
+
+"""
+
+import argparse
+import bisect
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CITIES = ['London', 'Paris', 'Berlin', 'Tokyo', 'Chicago', 'San Francisco', 'Sydney', 'Toronto']
+TOPICS = ['Medical Innovations', 'Programming Languages', 'Web Technologies',
+    'Movie Making', 'Health and Nutrition', 'Cloud Computing', 'Machine Learning']
+SPEAKERS = ['Ada Lovelace', 'Grace Hopper', 'Alan Turing', 'Barbara Liskov',
+    'Donald Knuth', 'Margaret Hamilton', 'Edsger Dijkstra', 'Frances Allen']
+SESSION_TYPES = ['lecture', 'workshop', 'keynote', 'panel']
+WORDS = ['kubernetes', 'scaling', 'datastore', 'latency', 'python', 'caching',
+    'queues', 'search', 'indexes', 'serverless', 'security', 'design']
+
+
+def _bootstrapSdk(sdk):
+    """Put the App Engine SDK and its bundled libraries on sys.path."""
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+
+# WSGI apps of app.yaml, imported in a fresh interpreter to time instance startup
+HANDLER_SETS = [('conference', 'api'), ('main', 'app')]
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, %(sdk)r)
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, %(app)r)
+start = time.time()
+getattr(__import__(%(module)r), %(attr)r)
+print('%%f %%d %%d' %% ((time.time() - start) * 1000, len(sys.modules), 'endpoints' in sys.modules))
+"""
+
+
+def importTimes(sdk, repeat):
+    """Return {handler set: import stats} over repeat cold imports."""
+    results = {}
+    for module, attr in HANDLER_SETS:
+        script = IMPORT_SCRIPT % {'sdk': sdk, 'app': APP_DIR, 'module': module, 'attr': attr}
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.check_output([sys.executable, '-c', script], cwd=APP_DIR)
+            elapsedMs, modules, endpointsLoaded = output.split()[-3:]
+            timings.append(float(elapsedMs))
+        results['%s.%s' % (module, attr)] = {
+            'p50Ms': round(_percentile(timings, 50), 3),
+            'maxMs': round(max(timings), 3),
+            'modules': int(modules),
+            'endpointsLoaded': endpointsLoaded == '1',
+        }
+    return results
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class RpcCounter(object):
+    """apiproxy post-call hook counting RPCs and datastore entities read."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = defaultdict(int)
+        self.entities = 0
+
+    def __call__(self, service, call, request, response):
+        self.calls['%s.%s' % (service, call)] += 1
+        if service == 'datastore_v3':
+            if call == 'Get':
+                self.entities += response.entity_size()
+            elif call in ('RunQuery', 'Next'):
+                self.entities += response.result_size()
+
+
+class Benchmark(object):
+    """Seeded ConferenceApi running on the testbed service stubs."""
+
+    def __init__(self, conferences, sessions, profiles, seed):
+        self.rng = random.Random(seed)
+        self.sizes = {'conferences': conferences, 'sessions': sessions, 'profiles': profiles}
+        self._activateStubs()
+
+        import conference
+        from conference import ConferenceApi
+        self.conference = conference
+        self.api = ConferenceApi()
+        # watchConferences would otherwise wait LONG_POLL_SECONDS per call
+        conference.LONG_POLL_SECONDS = 0
+
+        self.counter = RpcCounter()
+        from google.appengine.api import apiproxy_stub_map
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('benchmark', self.counter)
+
+        self._seed(conferences, sessions, profiles)
+
+    def _activateStubs(self):
+        from google.appengine.datastore import datastore_stub_util
+        from google.appengine.ext import testbed
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        # root_path picks up queue.yaml for the confirmation-emails pull queue
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        self.testbed.init_mail_stub()
+        self.testbed.init_urlfetch_stub()
+        self.testbed.init_user_stub()
+        self.testbed.init_app_identity_stub()
+
+    def login(self, email):
+        """Make endpoints.get_current_user() return email."""
+        os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+        os.environ['ENDPOINTS_AUTH_DOMAIN'] = 'example.com'
+        os.environ['USER_EMAIL'] = email
+
+    # - - - seeding - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _seed(self, conferences, sessions, profiles):
+        from datetime import date, datetime, timedelta
+
+        from google.appengine.ext import ndb
+
+        import autocomplete
+        import facets
+        import search
+        from models import Conference, Profile, Session
+
+        rng = self.rng
+        self.emails = ['user%d@example.com' % i for i in range(profiles)]
+        self.profiles = [Profile(key=ndb.Key(Profile, email), displayName=email.split('@')[0],
+            mainEmail=email, teeShirtSize='NOT_SPECIFIED') for email in self.emails]
+        organizers = self.profiles[:max(profiles // 10, 1)]
+
+        self.confs = []
+        for i in range(conferences):
+            organizer = organizers[i % len(organizers)]
+            c_id = Conference.allocate_ids(size=1, parent=organizer.key)[0]
+            start = date(2016, 1, 1) + timedelta(days=rng.randint(0, 364))
+            maxAttendees = rng.choice([0, 5, 50, 200, 1000])
+            self.confs.append(Conference(key=ndb.Key(Conference, c_id, parent=organizer.key),
+                name='%s Conference %d' % (rng.choice(TOPICS), i),
+                description=' '.join(rng.sample(WORDS, 6)),
+                organizerUserId=organizer.key.id(),
+                topics=rng.sample(TOPICS, rng.randint(1, 3)),
+                city=rng.choice(CITIES),
+                startDate=start, month=start.month, endDate=start + timedelta(days=2),
+                maxAttendees=maxAttendees, seatsAvailable=maxAttendees))
+
+        # every conference is registered by a few profiles; some sell out
+        registrations = []
+        for prof in self.profiles:
+            for conf in rng.sample(self.confs, min(3, len(self.confs))):
+                if conf.seatsAvailable > 0:
+                    conf.seatsAvailable -= 1
+                    prof.conferenceKeysToAttend.append(conf.key.urlsafe())
+                    registrations.append(self.conference.ConferenceApi._registration(prof, conf))
+        self.soldOut = [conf for conf in self.confs if conf.seatsAvailable <= 0]
+        self.open = [conf for conf in self.confs if conf.seatsAvailable > 0]
+
+        self.sessions = []
+        for i in range(sessions):
+            conf = self.confs[i % len(self.confs)]
+            s_id = Session.allocate_ids(size=1, parent=conf.key)[0]
+            self.sessions.append(Session(key=ndb.Key(Session, s_id, parent=conf.key),
+                sessionName='%s %d' % (' '.join(rng.sample(WORDS, 2)).title(), i),
+                highlights=rng.sample(WORDS, 3),
+                speaker=rng.choice(SPEAKERS),
+                duration=rng.choice([30, 45, 60, 90]),
+                typeOfSession=rng.choice(SESSION_TYPES),
+                dateTime=datetime(2016, conf.month or 1, 1, rng.randint(8, 18))))
+
+        for prof in self.profiles:
+            prof.wishlist = [session.key.urlsafe()
+                for session in rng.sample(self.sessions, min(3, len(self.sessions)))]
+
+        for i in range(0, len(self.confs), 500):
+            ndb.put_multi(self.confs[i:i + 500])
+        self.registrations = registrations
+        for entities in (self.profiles, self.sessions, registrations):
+            for i in range(0, len(entities), 500):
+                ndb.put_multi(entities[i:i + 500])
+
+        # derived indexes, built directly rather than through the task queue
+        facetChanges = {}
+        autocompleteChanges = {}
+        merge = self.conference.ConferenceApi._mergeChanges
+        byOrganizer = defaultdict(list)
+        for conf in self.confs:
+            merge(facetChanges, facets.countChanges(None, conf))
+            merge(autocompleteChanges, autocomplete.countChanges('city', [], [conf.city]))
+            merge(autocompleteChanges, autocomplete.countChanges('topics', [], conf.topics))
+            byOrganizer[conf.key.parent()].append(conf)
+        for session in self.sessions:
+            merge(autocompleteChanges, autocomplete.countChanges('speaker', [], [session.speaker]))
+        facets.updateCounts(facetChanges)
+        autocomplete.updateCounts(autocompleteChanges)
+        for confs in byOrganizer.values():
+            ndb.transaction(lambda: self.conference.ConferenceApi._updateOrganizerSummary(confs))
+        for entity in self.confs + self.sessions:
+            search.indexDocument(entity.key.urlsafe())
+
+    # - - - scenarios - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _pick(self, items, i, stride=7):
+        return items[(i * stride) % len(items)]
+
+    def _attendee(self, i):
+        return self.emails[i % len(self.emails)]
+
+    def _organizer(self, conf):
+        return conf.organizerUserId
+
+    def scenarios(self):
+        """Return [(endpoint, call(i) -> response)], in run order; pairs
+        such as register/unregister use the same (user, conference) per i."""
+        c = self.conference
+        m = sys.modules['models']
+        api = self.api
+        rng = self.rng
+
+        def conf(i):
+            return self._pick(self.confs, i)
+
+        def openConf(i):
+            return self._pick(self.open or self.confs, i)
+
+        def soldOut(i):
+            return self._pick(self.soldOut or self.confs, i)
+
+        def session(i):
+            return self._pick(self.sessions, i)
+
+        def as_user(email, call):
+            self.login(email)
+            return call()
+
+        def confGet(wsck):
+            return c.CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=wsck)
+
+        def confConditionalGet(wsck):
+            return c.CONF_CONDITIONAL_GET_REQUEST.combined_message_class(websafeConferenceKey=wsck)
+
+        def queryFilters(i):
+            fields = rng.sample(['CITY', 'TOPIC', 'MONTH', 'MAX_ATTENDEES'], rng.randint(0, 2))
+            values = {'CITY': rng.choice(CITIES), 'TOPIC': rng.choice(TOPICS),
+                'MONTH': str(rng.randint(1, 12)), 'MAX_ATTENDEES': '10'}
+            return m.ConferenceQueryForms(filters=[m.ConferenceQueryForm(field=field,
+                operator='GT' if field == 'MAX_ATTENDEES' else 'EQ', value=values[field])
+                for field in fields])
+
+        def wsck(i):
+            return conf(i).key.urlsafe()
+
+        return [
+            ('getProfile', lambda i: as_user(self._attendee(i),
+                lambda: api.getProfile(c.message_types.VoidMessage()))),
+            ('saveProfile', lambda i: as_user(self._attendee(i),
+                lambda: api.saveProfile(m.ProfileMiniForm(displayName='user %d' % i)))),
+            ('createConference', lambda i: as_user(self._attendee(i),
+                lambda: api.createConference(m.ConferenceForm(name='Bench %d' % i,
+                    city=rng.choice(CITIES), topics=[rng.choice(TOPICS)],
+                    startDate='2016-06-01', endDate='2016-06-02', maxAttendees=100)))),
+            ('importConferences', lambda i: as_user(self._attendee(i),
+                lambda: api.importConferences(m.ConferenceForms(items=[
+                    m.ConferenceForm(name='Import %d-%d' % (i, j), city=rng.choice(CITIES))
+                    for j in range(10)])))),
+            ('updateConference', lambda i: as_user(self._organizer(conf(i)),
+                lambda: api.updateConference(c.CONF_POST_REQUEST.combined_message_class(
+                    websafeConferenceKey=wsck(i), description='updated %d' % i)))),
+            ('getConference', lambda i: api.getConference(confConditionalGet(wsck(i)))),
+            ('getOrganizerDashboard', lambda i: as_user(self._organizer(conf(i)),
+                lambda: api.getOrganizerDashboard(c.message_types.VoidMessage()))),
+            ('getConferenceFacets', lambda i: api.getConferenceFacets(m.ConferenceQueryForms(
+                filters=[m.ConferenceQueryForm(field='CITY', operator='EQ',
+                    value=rng.choice(CITIES))]))),
+            ('queryConferences', lambda i: api.queryConferences(queryFilters(i))),
+            ('getConferencesCreated', lambda i: as_user(self._organizer(conf(i)),
+                lambda: api.getConferencesCreated(c.message_types.VoidMessage()))),
+            ('getConferencesToAttend', lambda i: as_user(self._attendee(i),
+                lambda: api.getConferencesToAttend(c.message_types.VoidMessage()))),
+            ('filterPlayground', lambda i: api.filterPlayground(c.message_types.VoidMessage())),
+            ('getConferenceAttendees', lambda i: as_user(self._organizer(conf(i)),
+                lambda: api.getConferenceAttendees(c.ATTENDEES_GET_REQUEST.combined_message_class(
+                    websafeConferenceKey=wsck(i))))),
+            ('registerForConference', lambda i: as_user(self._attendee(i),
+                lambda: api.registerForConference(confGet(openConf(i).key.urlsafe())))),
+            ('unregisterFromConference', lambda i: as_user(self._attendee(i),
+                lambda: api.unregisterFromConference(confGet(openConf(i).key.urlsafe())))),
+            ('holdSeat', lambda i: as_user(self._attendee(i),
+                lambda: api.holdSeat(confGet(openConf(i + 1).key.urlsafe())))),
+            ('confirmSeatHold', lambda i: as_user(self._attendee(i),
+                lambda: api.confirmSeatHold(confGet(openConf(i + 1).key.urlsafe())))),
+            ('joinWaitlist', lambda i: as_user(self._attendee(i),
+                lambda: api.joinWaitlist(confGet(soldOut(i).key.urlsafe())))),
+            ('getWaitlistPosition', lambda i: as_user(self._attendee(i),
+                lambda: api.getWaitlistPosition(confGet(soldOut(i).key.urlsafe())))),
+            ('leaveWaitlist', lambda i: as_user(self._attendee(i),
+                lambda: api.leaveWaitlist(confGet(soldOut(i).key.urlsafe())))),
+            ('watchConferences', lambda i: api.watchConferences(m.ConferenceWatchForm(
+                items=[m.ConferenceVersionForm(websafeConferenceKey=wsck(i), version=0)]))),
+            ('createSession', lambda i: as_user(self._organizer(conf(i)),
+                lambda: api.createSession(c.SESS_POST_REQUEST.combined_message_class(
+                    websafeConferenceKey=wsck(i), sessionName='Bench session %d' % i,
+                    speaker=rng.choice(SPEAKERS), duration=60, typeOfSession='lecture',
+                    dateTime='2016-06-01 10:00')))),
+            ('getConferenceSessions', lambda i: api.getConferenceSessions(confConditionalGet(wsck(i)))),
+            ('getConferenceSessionsByType', lambda i: api.getConferenceSessionsByType(
+                c.SESS_STR_POST_REQUEST.combined_message_class(
+                    websafeConferenceKey=wsck(i), data=rng.choice(SESSION_TYPES)))),
+            ('getSessionsBySpeaker', lambda i: api.getSessionsBySpeaker(
+                m.StringMessage(data=rng.choice(SPEAKERS)))),
+            ('queryConferenceSessions', lambda i: api.queryConferenceSessions(
+                c.SESS_QUERY_REQUEST.combined_message_class(websafeConferenceKey=wsck(i),
+                    filters=[m.SessionQueryForm(field='DURATION', operator='GTEQ', value='45')]))),
+            ('addSessionToWishlist', lambda i: as_user(self._attendee(i),
+                lambda: api.addSessionToWishlist(c.WISH_GET_REQUEST.combined_message_class(
+                    websafeSessionKey=session(i + 1).key.urlsafe())))),
+            ('getSessionsInWishlist', lambda i: as_user(self._attendee(i),
+                lambda: api.getSessionsInWishlist(c.message_types.VoidMessage()))),
+            ('deleteSessionInWishlist', lambda i: as_user(self._attendee(i),
+                lambda: api.deleteSessionInWishlist(c.WISH_GET_REQUEST.combined_message_class(
+                    websafeSessionKey=session(i + 1).key.urlsafe())))),
+            ('getAutocomplete', lambda i: api.getAutocomplete(m.AutocompleteForm(
+                field=rng.choice(['CITY', 'TOPIC', 'SPEAKER']), prefix=rng.choice('abcdgmpst')))),
+            ('searchConferences', lambda i: api.searchConferences(m.SearchForm(
+                query=' '.join(rng.sample(WORDS, 2))))),
+            ('searchSessions', lambda i: api.searchSessions(m.SearchForm(
+                query=' '.join(rng.sample(WORDS, 2))))),
+            ('getFeaturedSpeaker', lambda i: api.getFeaturedSpeaker(confGet(wsck(i)))),
+            ('getAnnouncement', lambda i: api.getAnnouncement(
+                c.ANNOUNCEMENT_GET_REQUEST.combined_message_class())),
+            ('getSpeakerAnnouncements', lambda i: as_user(self._attendee(i),
+                lambda: api.getSpeakerAnnouncements(c.message_types.VoidMessage()))),
+        ]
+
+    # - - - measuring - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def measure(self, call, iterations, clearMemcache=False):
+        """Run call(i) iterations times as separate requests; return stats."""
+        import endpoints
+        from google.appengine.api import memcache
+        from google.appengine.ext import ndb
+
+        latencies = []
+        rpcs = defaultdict(int)
+        entities = 0
+        errors = 0
+        for i in range(iterations):
+            # each call is a new request: nothing in the in-context cache
+            ndb.get_context().clear_cache()
+            if clearMemcache:
+                memcache.flush_all()
+            self.counter.reset()
+            start = time.time()
+            try:
+                call(i)
+            except endpoints.ServiceException:
+                errors += 1
+            latencies.append((time.time() - start) * 1000)
+            for name, count in self.counter.calls.items():
+                rpcs[name] += count
+            entities += self.counter.entities
+
+        total = sum(latencies)
+        return {
+            'calls': iterations,
+            'errors': errors,
+            'p50Ms': round(_percentile(latencies, 50), 3),
+            'p95Ms': round(_percentile(latencies, 95), 3),
+            'p99Ms': round(_percentile(latencies, 99), 3),
+            'callsPerSecond': round(iterations / (total / 1000), 1) if total else None,
+            'rpcsPerCall': round(sum(rpcs.values()) / float(iterations), 2),
+            'rpcs': dict((name, round(count / float(iterations), 2))
+                for name, count in sorted(rpcs.items())),
+            'entitiesReadPerCall': round(entities / float(iterations), 2),
+        }
+
+    def run(self, iterations):
+        results = {'sizes': self.sizes, 'iterations': iterations, 'endpoints': {}}
+        for name, call in self.scenarios():
+            results['endpoints'][name] = self.measure(call, iterations)
+
+        # QUERY vs KEYS_THEN_GET retrieval of list endpoints, cold and warm memcache
+        c = self.conference
+        strategies = {}
+        saved = dict(c.LIST_STRATEGIES)
+        calls = dict(self.scenarios())
+        for endpoint in ('queryConferences', 'getConferencesCreated'):
+            for strategy in (c.QUERY, c.KEYS_THEN_GET):
+                c.LIST_STRATEGIES[endpoint] = strategy
+                for cache in ('cold', 'warm'):
+                    strategies['%s/%s/%s' % (endpoint, strategy, cache)] = self.measure(
+                        calls[endpoint], iterations, clearMemcache=(cache == 'cold'))
+        c.LIST_STRATEGIES.update(saved)
+        results['listStrategies'] = strategies
+        results['firstRequest'] = self.firstRequest(iterations)
+        results['indexWrites'] = self.indexWrites()
+        return results
+
+    def firstRequest(self, iterations):
+        """First getAnnouncement + getConference of a most viewed conference
+        on a new instance, without and with the /_ah/warmup priming."""
+        import hotcache
+        from google.appengine.ext import ndb
+
+        c = self.conference
+        # views of the getConference scenario decide what warmup primes
+        hotcache.flushViews()
+        hot = hotcache.topViewed(c.WARMUP_CONFERENCES)
+
+        def firstCalls(i):
+            self.api.getAnnouncement(c.ANNOUNCEMENT_GET_REQUEST.combined_message_class())
+            self.api.getConference(c.CONF_CONDITIONAL_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=hot[i % len(hot)]))
+
+        stats = {}
+        for mode in ('cold', 'warm'):
+            latencies = []
+            rpcs = 0
+            for i in range(iterations):
+                # a new instance: empty process caches and converter plans
+                hotcache.clear()
+                c.CONVERTER_PLANS.clear()
+                ndb.get_context().clear_cache()
+                if mode == 'warm':
+                    c.ConferenceApi._warmup()
+                    ndb.get_context().clear_cache()
+                self.counter.reset()
+                start = time.time()
+                firstCalls(i)
+                latencies.append((time.time() - start) * 1000)
+                rpcs += sum(self.counter.calls.values())
+            stats[mode] = {
+                'p50Ms': round(_percentile(latencies, 50), 3),
+                'p95Ms': round(_percentile(latencies, 95), 3),
+                'rpcsPerCall': round(rpcs / float(iterations), 2),
+            }
+        return stats
+
+    def indexWrites(self):
+        """Index rows per put of the seeded entities of each kind, with
+        every property indexed (ndb's default) and under the policy."""
+        import indexpolicy
+
+        stats = {}
+        for kind, entities in (('Conference', self.confs), ('Session', self.sessions),
+                ('Profile', self.profiles), ('Registration', self.registrations)):
+            if not entities:
+                continue
+            everything = indexpolicy.defaultIndexed(type(entities[0]))
+            stats[kind] = {
+                'allIndexedRowsPerPut': round(sum(indexpolicy.indexRows(entity, everything)
+                    for entity in entities) / float(len(entities)), 2),
+                'rowsPerPut': round(sum(indexpolicy.indexRows(entity)
+                    for entity in entities) / float(len(entities)), 2),
+            }
+        return stats
+
+    def searchAtScale(self, documents, iterations):
+        """Queries per second, latency and index keys read by search()
+        over documents synthetic sessions, written straight into the
+        index rather than through indexDocument, which would take hours
+        on the stubs."""
+        import search
+        from google.appengine.ext import ndb
+        from models import SearchDocument, SearchEntry, SearchStats, SearchTermCount, Session
+
+        rng = random.Random(documents)
+        # a few very common words and a long tail, like real text
+        vocabulary = WORDS + ['term%d' % i for i in range(5000)]
+        cumulative = _cumulative([1.0 / (rank + 1) for rank in range(len(vocabulary))])
+        parent = self.confs[0].key
+
+        def words(n):
+            return [vocabulary[_weightedIndex(rng, cumulative)] for _ in range(n)]
+
+        termCounts = defaultdict(int)
+        statsCounts = defaultdict(int)
+        batch = []
+        for i in range(documents):
+            session = Session(key=ndb.Key(Session, 10 ** 9 + i, parent=parent),
+                sessionName=' '.join(words(3)), highlights=words(4),
+                speaker=rng.choice(SPEAKERS))
+            websafeKey = session.key.urlsafe()
+            tf = search._termFrequencies(session)
+            shard = search._shardOf(websafeKey)
+            batch.extend(SearchEntry(id=search._entryId('Session', term, count, websafeKey))
+                for term, count in tf.items())
+            batch.append(SearchDocument(id=websafeKey, terms=tf.keys(), counts=tf.values()))
+            for term in tf:
+                termCounts[search._counterKeys(SearchTermCount,
+                    search._termId('Session', term))[shard]] += 1
+            statsCounts[search._counterKeys(SearchStats, 'Session')[shard]] += 1
+            if len(batch) >= 500:
+                ndb.put_multi(batch, use_cache=False, use_memcache=False)
+                batch = []
+        counters = [SearchTermCount(key=key, documents=count) for key, count in termCounts.items()]
+        # add to the shards the seeded sessions already counted
+        for key, count in statsCounts.items():
+            stats = key.get() or SearchStats(key=key)
+            stats.documents += count
+            counters.append(stats)
+        for i in range(0, len(batch + counters), 500):
+            ndb.put_multi((batch + counters)[i:i + 500], use_cache=False, use_memcache=False)
+
+        stats = {}
+        for name, size in (('oneTerm', 1), ('twoTerms', 2), ('threeTerms', 3)):
+            latencies = []
+            keysRead = 0
+            for i in range(iterations):
+                query = ' '.join(words(size))
+                ndb.get_context().clear_cache()
+                self.counter.reset()
+                start = time.time()
+                search.search('Session', query, 0, 20)
+                latencies.append((time.time() - start) * 1000)
+                keysRead += self.counter.entities
+            seconds = sum(latencies) / 1000.0
+            stats[name] = {
+                'documents': documents,
+                'queriesPerSecond': round(iterations / seconds, 1) if seconds else None,
+                'p50Ms': round(_percentile(latencies, 50), 3),
+                'p95Ms': round(_percentile(latencies, 95), 3),
+                'keysReadPerQuery': round(keysRead / float(iterations), 1),
+            }
+        return stats
+
+
+def _cumulative(weights):
+    """Running totals of weights, for _weightedIndex."""
+    totals = []
+    for weight in weights:
+        totals.append((totals[-1] if totals else 0) + weight)
+    return totals
+
+
+def _weightedIndex(rng, cumulative):
+    """Index drawn with probability proportional to its weight."""
+    return bisect.bisect(cumulative, rng.random() * cumulative[-1])
+
+
+def codecThroughput(iterations, sessions=300):
+    """Encode/decode rate and size of a rendered conference and a big
+    agenda with formcodec, against pickling the form objects."""
+    import cPickle as pickle
+
+    import formcodec
+    from models import ConferenceForm, SessionForm, SessionForms
+
+    rng = random.Random(0)
+    forms = {
+        'conference': ConferenceForm(name='Cloud Computing Conference',
+            description=' '.join(rng.choice(WORDS) for _ in range(400)),
+            organizerUserId='user0@example.com', topics=TOPICS[:3], city='London',
+            startDate='2016-06-01', endDate='2016-06-03', month=6,
+            maxAttendees=500, seatsAvailable=20, websafeKey='a' * 40,
+            organizerDisplayName='user0'),
+        'agenda': SessionForms(items=[SessionForm(sessionName='Session %d' % i,
+            highlights=[' '.join(rng.sample(WORDS, 8)) for _ in range(4)],
+            speaker=rng.choice(SPEAKERS), duration=60, typeOfSession='lecture',
+            dateTime='2016-06-01 10:00:00') for i in range(sessions)]),
+    }
+    codecs = {
+        'formcodec': (formcodec.encode, lambda form, data: formcodec.decode(type(form), data)),
+        'pickle': (lambda form: pickle.dumps(form, pickle.HIGHEST_PROTOCOL),
+            lambda form, data: pickle.loads(data)),
+    }
+
+    results = {}
+    for formName, form in forms.items():
+        for codecName, (encode, decode) in codecs.items():
+            try:
+                data = encode(form)
+            except Exception as e:
+                results['%s/%s' % (formName, codecName)] = {'error': str(e)}
+                continue
+            start = time.time()
+            for _ in range(iterations):
+                encode(form)
+            encodeSeconds = time.time() - start
+            start = time.time()
+            for _ in range(iterations):
+                decode(form, data)
+            decodeSeconds = time.time() - start
+            results['%s/%s' % (formName, codecName)] = {
+                'bytes': len(data),
+                'encodesPerSecond': round(iterations / encodeSeconds, 1) if encodeSeconds else None,
+                'decodesPerSecond': round(iterations / decodeSeconds, 1) if decodeSeconds else None,
+            }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return descriptions of endpoints regressing against baseline."""
+    regressions = []
+    for name, base in sorted(baseline.get('endpoints', {}).items()):
+        current = results['endpoints'].get(name)
+        if not current:
+            continue
+        for metric in ('p95Ms', 'rpcsPerCall', 'entitiesReadPerCall'):
+            if current[metric] > base[metric] * (1 + tolerance) + 0.5:
+                regressions.append('%s %s: %s -> %s' % (name, metric, base[metric], current[metric]))
+    for kind, base in sorted(baseline.get('indexWrites', {}).items()):
+        current = results.get('indexWrites', {}).get(kind)
+        if current and current['rowsPerPut'] > base['rowsPerPut'] * (1 + tolerance):
+            regressions.append('%s index rows per put: %s -> %s' % (kind,
+                base['rowsPerPut'], current['rowsPerPut']))
+    for name, base in sorted(baseline.get('imports', {}).items()):
+        current = results.get('imports', {}).get(name)
+        if current and current['p50Ms'] > base['p50Ms'] * (1 + tolerance) + 0.5:
+            regressions.append('import %s p50Ms: %s -> %s' % (name, base['p50Ms'], current['p50Ms']))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark ConferenceApi on service stubs.')
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'),
+        help='path to the App Engine Python SDK (default: $APPENGINE_SDK)')
+    parser.add_argument('--conferences', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--profiles', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=858)
+    parser.add_argument('--imports', type=int, default=5,
+        help='cold imports timed per handler set; 0 to skip')
+    parser.add_argument('--search-documents', type=int, default=100000,
+        help='synthetic sessions in the search index at scale; 0 to skip')
+    parser.add_argument('--out', help='write results as JSON baseline')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+    if not args.sdk:
+        parser.error('--sdk or $APPENGINE_SDK is required')
+
+    _bootstrapSdk(args.sdk)
+    benchmark = Benchmark(args.conferences, args.sessions, args.profiles, args.seed)
+    results = benchmark.run(args.iterations)
+    if args.search_documents:
+        # last: the synthetic sessions would skew every other scenario
+        results['searchAtScale'] = benchmark.searchAtScale(args.search_documents, args.iterations)
+    if args.imports:
+        results['imports'] = importTimes(args.sdk, args.imports)
+    results['codec'] = codecThroughput(args.iterations * 10)
+
+    for name, stats in sorted(results['endpoints'].items()):
+        print('%-28s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  rpcs %6.2f  read %7.2f  errors %d' % (
+            name, stats['p50Ms'], stats['p95Ms'], stats['p99Ms'],
+            stats['rpcsPerCall'], stats['entitiesReadPerCall'], stats['errors']))
+    for name, stats in sorted(results['listStrategies'].items()):
+        print('%-45s p50 %8.2fms  p95 %8.2fms' % (name, stats['p50Ms'], stats['p95Ms']))
+    for mode, stats in sorted(results['firstRequest'].items()):
+        print('first request, %-30s p50 %8.2fms  p95 %8.2fms  rpcs %6.2f' % (mode,
+            stats['p50Ms'], stats['p95Ms'], stats['rpcsPerCall']))
+    for kind, stats in sorted(results['indexWrites'].items()):
+        print('index rows per %-14s all indexed %8.2f  policy %8.2f' % (kind,
+            stats['allIndexedRowsPerPut'], stats['rowsPerPut']))
+    for name, stats in sorted(results.get('searchAtScale', {}).items()):
+        print('search %-21s %8.1f queries/s  p50 %8.2fms  p95 %8.2fms  keys read %8.1f' % (
+            name, stats['queriesPerSecond'] or 0, stats['p50Ms'], stats['p95Ms'],
+            stats['keysReadPerQuery']))
+    for name, stats in sorted(results['codec'].items()):
+        if 'error' in stats:
+            print('codec %-22s error: %s' % (name, stats['error']))
+        else:
+            print('codec %-22s %8d bytes  encode %10.1f/s  decode %10.1f/s' % (name,
+                stats['bytes'], stats['encodesPerSecond'] or 0, stats['decodesPerSecond'] or 0))
+    for name, stats in sorted(results.get('imports', {}).items()):
+        print('import %-21s p50 %8.2fms  max %8.2fms  modules %4d  endpoints %s' % (name,
+            stats['p50Ms'], stats['maxMs'], stats['modules'], 'yes' if stats['endpointsLoaded'] else 'no'))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -12,18 +12,25 @@ created by wesc on 2014 apr 21
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import httplib
 import logging
 
 from datetime import datetime
+from datetime import timedelta
+import hashlib
 import json
+import operator
 import os
+import threading
 import time
+import uuid
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
 
+from google.appengine.api import datastore_errors
 from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 from google.appengine.api import memcache
@@ -37,8 +44,32 @@ from models import TeeShirtSize
 from models import Conference
 from models import ConferenceForm
 from models import ConferenceForms
+from models import ConferenceImportResultForm
 from models import ConferenceQueryForm
 from models import ConferenceQueryForms
+from models import ConferenceWatchForm
+from models import ConferenceChangeForm
+from models import ConferenceChangeForms
+from models import ConferenceFacetForm
+from models import ConferenceFacetForms
+from models import ConferenceSummary
+from models import ConferenceSummaryForm
+from models import OrganizerSummary
+from models import OrganizerDashboardForm
+from models import PendingCountChanges
+from models import Registration
+from models import AttendeeForm
+from models import AttendeeForms
+from models import WaitlistEntry
+from models import WaitlistPositionForm
+from models import SeatHold
+from models import SeatHoldForm
+from models import SearchForm
+from models import ConferenceSearchForms
+from models import SessionSearchForms
+from models import AutocompleteForm
+from models import AutocompleteItemForm
+from models import AutocompleteForms
 
 from models import Session
 from models import SessionForm
@@ -46,19 +77,68 @@ from models import SessionForms
 from models import SessionQueryForm
 from models import SessionQueryForms
 
+from models import SpeakerAnnouncementForm
+from models import SpeakerAnnouncementForms
+
 from models import BooleanMessage
-from models import ConflictException
 from models import StringMessage
+from models import AnnouncementForm
 
 from settings import WEB_CLIENT_ID
 
 from utils import getUserId
 
+import autocomplete
+import facets
+import formcodec
+import hotcache
+import logic
+from logic import CONF_FIELDS
+from logic import CONFIRMATION_EMAIL_QUEUE
+from logic import MEMCACHE_ANNOUNCEMENTS_KEY
+from logic import MEMCACHE_CONFERENCE_VERSION_PREFIX
+from logic import OPERATORS
+from logic import ORGANIZER_SUMMARY_ID
+from logic import SESS_FIELDS
+import metrics
+import planner
+import search
+import slowqueries
+import wishlist
+
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 
-MEMCACHE_ANNOUNCEMENTS_KEY = 'RECENT ANNOUNCEMENTS'
-MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY = 'SPEAKER ANNOUNCEMENTS'
+# most per-conference rows the dashboard lists; its totals cover them all
+ORGANIZER_DASHBOARD_LIMIT = 500
+LONG_POLL_SECONDS = 15
+LONG_POLL_INTERVAL = 0.5
+LONG_POLL_MAX_INTERVAL = 2
+# long polls one instance holds open, well under the 10 concurrent
+# requests of a threadsafe instance; past it, calls check once and tell
+# the client to come back after LONG_POLL_RETRY_SECONDS
+LONG_POLL_MAX_WAITERS = 4
+LONG_POLL_RETRY_SECONDS = 5
+SEAT_HOLD_SECONDS = 120
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+ATTENDEES_PAGE_SIZE = 100
+IMPORT_MAX_CONFERENCES = 5000
+# a chunk commits its conferences, their dashboard rows, the totals and
+# the pending count changes; kept well under 500 mutations per commit
+IMPORT_CHUNK_SIZE = 200
+TASK_BATCH_SIZE = 100
+# ConferenceForm fields set by the server only
+CONF_OUTBOUND_FIELDS = ('revision', 'etag', 'unchanged', 'watchVersion')
+WARMUP_CONFERENCES = 20
+CONFERENCE_FORM_CACHE_SECONDS = 60
+ANNOUNCEMENT_CACHE_SECONDS = 60
+MEMCACHE_CONFERENCE_FORM_PREFIX = 'CONFERENCE FORM:'
+MEMCACHE_AGENDA_PREFIX = 'AGENDA:'
+AGENDA_CACHE_SECONDS = 600
+# after an agenda changes, memcache refuses re-adds this long, so a
+# reader that queried before the change can't cache the old agenda
+AGENDA_LOCK_SECONDS = 2
 
 DEFAULTS = {
     "city": "Default City",
@@ -67,38 +147,58 @@ DEFAULTS = {
     "topics": [ "Default", "Topic" ],
 }
 
-OPERATORS = {
-            'EQ':   '=',
-            'GT':   '>',
-            'GTEQ': '>=',
-            'LT':   '<',
-            'LTEQ': '<=',
-            'NE':   '!='
-            }
-
-CONF_FIELDS =    {
+AUTOCOMPLETE_FIELDS = {
             'CITY': 'city',
             'TOPIC': 'topics',
-            'MONTH': 'month',
-            'MAX_ATTENDEES': 'maxAttendees',
+            'SPEAKER': 'speaker',
             }
 
-# TODO: define allowed session filters
-SESS_FIELDS = {
-            'SESSION_NAME': 'sessionName',
-            'HIGHLIGHTS': 'highlights',
-            'SPEAKER': 'speaker',
-            'DURATION': 'duration',
-            'TYPE_OF_SESSION': 'typeOfSession',
-            'DATE_TIME': 'dateTIme',
+AUTOCOMPLETE_LIMIT = 10
+
+# retrieval strategy of list endpoints: QUERY streams entities from the
+# query; KEYS_THEN_GET runs a keys-only query and batch-gets the entities,
+# which ndb serves from its in-context and memcache entity caches
+QUERY = 'query'
+KEYS_THEN_GET = 'keysThenGet'
+
+LIST_STRATEGIES = {
+            'queryConferences': KEYS_THEN_GET,
+            'getConferencesCreated': KEYS_THEN_GET,
+            'getConferenceSessions': QUERY,
+            'getConferenceSessionsByType': QUERY,
+            'getSessionsBySpeaker': QUERY,
+            'queryConferenceSessions': QUERY,
             }
 
+class ConflictException(endpoints.ServiceException):
+    """ConflictException -- exception mapped to HTTP 409 response"""
+    http_status = httplib.CONFLICT
+
+# (form class, model class) -> [(field name, converter)]; see _converterPlan
+CONVERTER_PLANS = {}
+
+# watchConferences long polls waiting in this instance
+_longPollLock = threading.Lock()
+_longPollWaiters = [0]
+
 # ResourceContainers support path arguments.
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,# a message passed in as the first argument
     websafeConferenceKey=messages.StringField(1), # parameter to add to URL passed in as second argument
 )
 
+# conditional reads: ifNoneMatch is the etag of the copy the client holds
+CONF_CONDITIONAL_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+
+ANNOUNCEMENT_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ifNoneMatch=messages.StringField(1),
+)
+
 CONF_POST_REQUEST = endpoints.ResourceContainer(
     ConferenceForm,
     websafeConferenceKey=messages.StringField(1),
@@ -119,6 +219,13 @@ SESS_QUERY_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+ATTENDEES_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+)
+
 WISH_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeSessionKey=messages.StringField(1),
@@ -135,17 +242,40 @@ class ConferenceApi(remote.Service):
 
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
+    @staticmethod
+    def _converterPlan(formClass, modelClass):
+        """Return [(field name, converter)] copying a modelClass entity
+        into a formClass message; built once per instance.
+        """
+        plan = CONVERTER_PLANS.get((formClass, modelClass))
+        if plan is not None:
+            return plan
+
+        plan = []
+        for field in formClass.all_fields():
+            name = field.name
+            if hasattr(modelClass, name):
+                # convert t-shirt string to Enum, dates to strings; just copy others
+                if name == 'teeShirtSize':
+                    convert = lambda entity, name=name: getattr(TeeShirtSize, getattr(entity, name))
+                elif name.endswith('Date') or name == 'dateTime':
+                    convert = lambda entity, name=name: str(getattr(entity, name))
+                else:
+                    convert = operator.attrgetter(name)
+            elif name == 'websafeKey':
+                convert = lambda entity: entity.key.urlsafe()
+            else:
+                continue
+            plan.append((name, convert))
+        CONVERTER_PLANS[(formClass, modelClass)] = plan
+        return plan
+
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
         # copy relevant fields from Profile to ProfileForm
         pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
+        for name, convert in self._converterPlan(ProfileForm, Profile):
+            setattr(pf, name, convert(prof))
         pf.check_initialized()
         return pf
 
@@ -187,19 +317,27 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
-            for field in ('displayName', 'teeShirtSize'):
-                if hasattr(save_request, field):
-                    val = getattr(save_request, field)
-                    if val:
-                        setattr(prof, field, str(val))
-            prof.put()
-
-        # return ProfileForm
+            # transactional, so the put can't undo a concurrent wishlist flush
+            @ndb.transactional()
+            def save():
+                current = prof.key.get()
+                for field in ('displayName', 'teeShirtSize'):
+                    if hasattr(save_request, field):
+                        val = getattr(save_request, field)
+                        if val:
+                            setattr(current, field, str(val))
+                current.put()
+                return current
+            prof = save()
+
+        # return ProfileForm, showing wishlist changes not yet flushed
+        prof.wishlist = wishlist.merged(prof)
         return self._copyProfileToForm(prof)
 
 
     @endpoints.method(message_types.VoidMessage, ProfileForm,
             path='profile', http_method='GET', name='getProfile')
+    @metrics.instrumented
     def getProfile(self, request):
         """Return user profile."""
         return self._doProfile()
@@ -209,28 +347,33 @@ class ConferenceApi(remote.Service):
     # 2. pass request to _doProfile function
     @endpoints.method(ProfileMiniForm, ProfileForm,
             path='profile', http_method='POST', name='saveProfile')
+    @metrics.instrumented
     def saveProfile(self, request):
         return self._doProfile(save_request = request)
 
     @endpoints.method(WISH_GET_REQUEST, ProfileForm, path='addSessionToWishlist/{websafeSessionKey}',
         http_method='POST', name='addSessionToWishlist')
+    @metrics.instrumented
     def addSessionToWishlist(self, request):
         # i think keys in wishlist should be websafe
         profile = self._getProfileFromUser()
+        profile.wishlist = wishlist.merged(profile)
 
         if request.websafeSessionKey in profile.wishlist:
             raise endpoints.BadRequestException('This item is already in your wishlist.')
 
+        # buffered; a task writes the profile once per WISHLIST_FLUSH_SECONDS
+        wishlist.record(profile.key.id(), wishlist.ADD, request.websafeSessionKey)
         profile.wishlist.append(request.websafeSessionKey)
-        profile.put()
 
         return self._copyProfileToForm(profile)
 
     @endpoints.method(message_types.VoidMessage, StringMessage, path='getSessionsInWishlist',
         http_method='POST', name='getSessionsInWishlist')
+    @metrics.instrumented
     def getSessionsInWishlist(self, request):
         profile = self._getProfileFromUser()
-        formattedWishlist = ', '.join(item for item in profile.wishlist)
+        formattedWishlist = ', '.join(item for item in wishlist.merged(profile))
         if formattedWishlist == "":
             formattedWishlist = "You have no items in your wishlist."
 
@@ -238,15 +381,16 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(WISH_GET_REQUEST, ProfileForm, path='deleteSessionInWishlist/{websafeSessionKey}',
         http_method='POST', name='deleteSessionInWishlist')
+    @metrics.instrumented
     def deleteSessionInWishlist(self, request):
         profile = self._getProfileFromUser()
+        profile.wishlist = wishlist.merged(profile)
 
         if request.websafeSessionKey not in profile.wishlist:
             raise endpoints.BadRequestException('Unable to delete because this item was not in your wishlist.')
 
-        index = profile.wishlist.index(request.websafeSessionKey)
-        profile.wishlist.pop(index)
-        profile.put()
+        wishlist.record(profile.key.id(), wishlist.REMOVE, request.websafeSessionKey)
+        profile.wishlist.remove(request.websafeSessionKey)
 
         return self._copyProfileToForm(profile)
 
@@ -256,29 +400,19 @@ class ConferenceApi(remote.Service):
     def _copyConferenceToForm(self, conf, displayName):
         """Copy relevant fields from Conference to ConferenceForm."""
         cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
+        for name, convert in self._converterPlan(ConferenceForm, Conference):
+            setattr(cf, name, convert(conf))
         if displayName:
             setattr(cf, 'organizerDisplayName', displayName)
+        cf.etag = self._etag([conf], displayName or '')
         cf.check_initialized()
         return cf
 
 
-    def _createConferenceObject(self, request):
-        """Create or update Conference object, returning ConferenceForm/request."""
-        # preload necessary data items
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
-
+    def _conferenceData(self, request):
+        """Validate ConferenceForm and return Conference properties dict,
+        filling in DEFAULTS (both data model & outbound Message).
+        """
         if not request.name:
             raise endpoints.BadRequestException("Conference 'name' field required")
 
@@ -286,6 +420,8 @@ class ConferenceApi(remote.Service):
         data = {field.name: getattr(request, field.name) for field in request.all_fields()}
         del data['websafeKey']
         del data['organizerDisplayName']
+        for field in CONF_OUTBOUND_FIELDS:
+            del data[field]
 
         # add default values for those missing (both data model & outbound Message)
         for df in DEFAULTS:
@@ -294,19 +430,34 @@ class ConferenceApi(remote.Service):
                 setattr(request, df, DEFAULTS[df])
 
         # convert dates from strings to Date objects; set month based on start_date
-        if data['startDate']:
-            data['startDate'] = datetime.strptime(data['startDate'][:10], "%Y-%m-%d").date()
-            data['month'] = data['startDate'].month
-        else:
-            data['month'] = 0
-        if data['endDate']:
-            data['endDate'] = datetime.strptime(data['endDate'][:10], "%Y-%m-%d").date()
+        try:
+            if data['startDate']:
+                data['startDate'] = datetime.strptime(data['startDate'][:10], "%Y-%m-%d").date()
+                data['month'] = data['startDate'].month
+            else:
+                data['month'] = 0
+            if data['endDate']:
+                data['endDate'] = datetime.strptime(data['endDate'][:10], "%Y-%m-%d").date()
+        except ValueError:
+            raise endpoints.BadRequestException("Conference dates must be YYYY-MM-DD")
 
         # set seatsAvailable to be same as maxAttendees on creation
         # both for data model & outbound Message
         if data["maxAttendees"] > 0:
             data["seatsAvailable"] = data["maxAttendees"]
             setattr(request, "seatsAvailable", data["maxAttendees"])
+        return data
+
+
+    def _createConferenceObject(self, request):
+        """Create or update Conference object, returning ConferenceForm/request."""
+        # preload necessary data items
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = getUserId(user)
+
+        data = self._conferenceData(request)
 
         # make Profile Key from user ID
         p_key = ndb.Key(Profile, user_id)
@@ -319,19 +470,125 @@ class ConferenceApi(remote.Service):
 
         # create Conference & return (modified) ConferenceForm
         conference = Conference(**data)
-        conference.put()
+
+        @ndb.transactional()
+        def putConference():
+            conference.put()
+            self._updateOrganizerSummary([conference])
+            # queued with the put, so the index and counters can't miss a
+            # conference; three of the five tasks a transaction may add
+            taskqueue.add(params={'websafeKey': c_key.urlsafe()},
+                url='/tasks/index_document', transactional=True)
+            changes = autocomplete.countChanges('city', [], [data['city']])
+            changes.update(autocomplete.countChanges('topics', [], data['topics']))
+            self._updateAutocomplete(changes, transactional=True)
+            self._updateFacets(facets.countChanges(None, conference), transactional=True)
+        putConference()
+        logic.allocateSeatTokens(conference.key)
 
         # create Conference, send email to organizer confirming
         # creation of Conference & return (modified) ConferenceForm
         # TODO 2: add confirmation email sending task to queue
-        taskqueue.add(params={'email': user.email(),
-            'conferenceInfo': repr(request)},
-            url='/tasks/send_confirmation_email'
-        )
+        # emails are leased from a pull queue and sent in batches
+        # by the /crons/send_confirmation_emails worker
+        taskqueue.Queue(CONFIRMATION_EMAIL_QUEUE).add(taskqueue.Task(
+            payload=json.dumps({
+                'email': user.email(),
+                'conference': {
+                    'name': request.name,
+                    'city': request.city,
+                    'topics': request.topics,
+                    'startDate': request.startDate,
+                    'endDate': request.endDate,
+                    'maxAttendees': request.maxAttendees,
+                },
+            }),
+            method='PULL'))
 
         return request
 
-    @ndb.transactional()
+    @staticmethod
+    def _mergeChanges(total, changes):
+        """Sum nested {key: {value: delta}} count changes into total."""
+        for key, deltas in changes.items():
+            merged = total.setdefault(key, {})
+            for value, delta in deltas.items():
+                merged[value] = merged.get(value, 0) + delta
+        return total
+
+    def _importConferences(self, request):
+        """Create many conferences for the user in put_multi chunks."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = getUserId(user)
+        if len(request.items) > IMPORT_MAX_CONFERENCES:
+            raise endpoints.BadRequestException(
+                'At most %d conferences can be imported at once.' % IMPORT_MAX_CONFERENCES)
+
+        start = time.time()
+        valid = []
+        errors = []
+        for i, form in enumerate(request.items):
+            try:
+                valid.append(self._conferenceData(form))
+            except endpoints.BadRequestException as e:
+                errors.append('item %d: %s' % (i, e.message))
+
+        # allocate all Conference IDs of the organizer in one block
+        p_key = ndb.Key(Profile, user_id)
+        conferences = []
+        if valid:
+            first, last = Conference.allocate_ids(size=len(valid), parent=p_key)
+            for c_id, data in zip(range(first, last + 1), valid):
+                data['key'] = ndb.Key(Conference, c_id, parent=p_key)
+                data['organizerUserId'] = user_id
+                conferences.append(Conference(**data))
+
+        for i in range(0, len(conferences), IMPORT_CHUNK_SIZE):
+            chunk = conferences[i:i + IMPORT_CHUNK_SIZE]
+
+            facetChanges = {}
+            autocompleteChanges = {}
+            for conf in chunk:
+                self._mergeChanges(facetChanges, facets.countChanges(None, conf))
+                self._mergeChanges(autocompleteChanges,
+                    autocomplete.countChanges('city', [], [conf.city]))
+                self._mergeChanges(autocompleteChanges,
+                    autocomplete.countChanges('topics', [], conf.topics))
+            # a chunk's changes can exceed the 100KB task limit; they are
+            # stored with the chunk and split into tasks by the queued task
+            pending = PendingCountChanges(parent=p_key,
+                facets=facetChanges, autocomplete=autocompleteChanges)
+
+            @ndb.transactional()
+            def putChunk():
+                ndb.put_multi(chunk + [pending])
+                self._updateOrganizerSummary(chunk)
+                taskqueue.add(params={'websafeKey': pending.key.urlsafe()},
+                    url='/tasks/queue_count_changes', transactional=True)
+            putChunk()
+
+            indexTasks = [taskqueue.Task(params={'websafeKey': conf.key.urlsafe()},
+                url='/tasks/index_document') for conf in chunk]
+            for j in range(0, len(indexTasks), TASK_BATCH_SIZE):
+                taskqueue.Queue().add(indexTasks[j:j + TASK_BATCH_SIZE])
+
+        seconds = time.time() - start
+        rate = len(conferences) / seconds if seconds else 0.0
+        logging.info('imported %d conferences in %.2fs (%.1f conferences/sec)',
+            len(conferences), seconds, rate)
+
+        # one summary email instead of one per conference
+        taskqueue.add(params={'email': user.email(),
+            'imported': len(conferences),
+            'failed': len(errors)},
+            url='/tasks/send_import_summary_email')
+
+        return ConferenceImportResultForm(imported=len(conferences), errors=errors,
+            seconds=seconds, conferencesPerSecond=rate)
+
+    @ndb.transactional(xg=True)
     def _updateConferenceObject(self, request):
         user = endpoints.get_current_user()
         if not user:
@@ -353,12 +610,16 @@ class ConferenceApi(remote.Service):
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
+        oldConf = Conference(city=conf.city, topics=list(conf.topics), month=conf.month)
+        oldCity, oldTopics = conf.city, list(conf.topics)
+        oldSeats = conf.seatsAvailable or 0
+
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
             data = getattr(request, field.name)
             # only copy fields where we get data
-            if data not in (None, []):
+            if data not in (None, []) and field.name not in CONF_OUTBOUND_FIELDS:
                 # special handling for dates (convert string to Date)
                 if field.name in ('startDate', 'endDate'):
                     data = datetime.strptime(data, "%Y-%m-%d").date()
@@ -366,29 +627,62 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
+        # keep the seat token pool in step with seatsAvailable
+        if not logic.adjustSeatTokens(request.websafeConferenceKey,
+                (conf.seatsAvailable or 0) - oldSeats):
+            raise ConflictException(
+                "Seats on hold can't be taken away; try again once they expire.")
         conf.put()
+        self._updateOrganizerSummary([conf])
+        ndb.get_context().call_on_commit(
+            lambda: self._bumpConferenceVersion(request.websafeConferenceKey))
+        taskqueue.add(params={'websafeKey': request.websafeConferenceKey},
+            url='/tasks/index_document', transactional=True)
+        changes = autocomplete.countChanges('city', [oldCity], [conf.city])
+        changes.update(autocomplete.countChanges('topics', oldTopics, conf.topics))
+        self._updateAutocomplete(changes, transactional=True)
+        self._updateFacets(facets.countChanges(oldConf, conf), transactional=True)
         prof = ndb.Key(Profile, user_id).get()
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
 
-    def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Conference.query()
+    def _getQuery(self, request, endpoint):
+        """Return conferences matching the submitted filters."""
         inequality_filter, filters = self._formatFilters(request.filters)
 
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Conference.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
-
         for filtr in filters:
             if filtr["field"] in ["month", "maxAttendees"]:
                 filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+
+        # sorted on inequality filter first, if exists, then by name
+        return self._runPlannedQuery(Conference, filters, 'name', endpoint)
+
+
+    @staticmethod
+    def _fetchList(query, endpoint):
+        """Return entities of a list endpoint's query, using the
+        retrieval strategy configured for endpoint in LIST_STRATEGIES.
+        """
+        # planner fallbacks are already in-memory lists
+        if LIST_STRATEGIES.get(endpoint) != KEYS_THEN_GET or not isinstance(query, ndb.Query):
+            return query
+        return [entity for entity in ndb.get_multi(query.fetch(keys_only=True)) if entity]
+
+
+    @staticmethod
+    def _runPlannedQuery(model, filters, order, endpoint, ancestor=None):
+        """Run a query through the planner, mapping its errors, and
+        return its entities; records the query if it was slow.
+        """
+        start = time.time()
+        try:
+            queryPlan, entities, scanned = planner.execute(model, filters, order, ancestor=ancestor)
+        except planner.QueryTooBroadError as e:
+            raise endpoints.BadRequestException(str(e) + ' Add more filters.')
+        entities = list(ConferenceApi._fetchList(entities, endpoint))
+        slowqueries.record(endpoint, queryPlan, filters, order, len(entities),
+            len(entities) if scanned is None else scanned, time.time() - start)
+        return entities
 
 
     def _formatFilters(self, filters):
@@ -421,39 +715,184 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
             http_method='POST', name='createConference')
+    @metrics.instrumented
     def createConference(self, request):
         """Create new conference."""
         return self._createConferenceObject(request)
 
+    @endpoints.method(ConferenceForms, ConferenceImportResultForm, path='importConferences',
+            http_method='POST', name='importConferences')
+    @metrics.instrumented
+    def importConferences(self, request):
+        """Bulk create conferences organized by user."""
+        return self._importConferences(request)
+
     @endpoints.method(CONF_POST_REQUEST, ConferenceForm,
             path='updateConference/{websafeConferenceKey}',
             http_method='PUT', name='updateConference')
+    @metrics.instrumented
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info."""
         return self._updateConferenceObject(request)
 
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @staticmethod
+    def _etag(entities, *extra):
+        """Return an etag of entities at their current revisions, plus
+        any extra strings rendered into the same response."""
+        digest = hashlib.md5()
+        for entity in entities:
+            digest.update('%s:%s;' % (entity.key.urlsafe(), entity.revision))
+        for value in extra:
+            digest.update(value.encode('utf-8') if isinstance(value, unicode) else value)
+            digest.update(';')
+        return '"%s"' % digest.hexdigest()
+
+    @endpoints.method(CONF_CONDITIONAL_GET_REQUEST, ConferenceForm,
             path='getConference/{websafeConferenceKey}',
             http_method='GET', name='getConference')
+    @metrics.instrumented
     def getConference(self, request):
-        """Return requested conference (by websafeConferenceKey)."""
+        """Return requested conference (by websafeConferenceKey), or only
+        unchanged=True if its etag matches ifNoneMatch."""
+        form = self._getConferenceForm(request.websafeConferenceKey)
+        if request.ifNoneMatch and request.ifNoneMatch == form.etag:
+            return ConferenceForm(etag=form.etag, unchanged=True,
+                watchVersion=form.watchVersion)
+        return form
+
+    def _getConferenceForm(self, wsck):
+        """Return the rendered ConferenceForm of a conference, from the
+        instance cache or memcache when possible, and count the view."""
+        form = self._loadConferenceForm(wsck)
+        # only keys of existing conferences make it into the view counts
+        hotcache.recordView(wsck)
+        return form
+
+    def _loadConferenceForm(self, wsck):
+        """Return the rendered ConferenceForm of a conference, or raise
+        NotFoundException if wsck is not the key of one."""
+        # the instance cache is keyed by the conference's change counter,
+        # so registrations and updates are seen at once
+        version = memcache.get(MEMCACHE_CONFERENCE_VERSION_PREFIX + wsck)
+        cached = hotcache.get('conference:' + wsck)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        form = formcodec.decode(ConferenceForm,
+            memcache.get(self._conferenceFormKey(wsck, version)))
+        if form is not None:
+            hotcache.put('conference:' + wsck, (version, form), CONFERENCE_FORM_CACHE_SECONDS)
+            return form
+
         # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf_key = logic.conferenceKey(wsck)
+        conf = conf_key.get() if conf_key else None
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
+                'No conference found with key: %s' % wsck)
+        return self._cacheConferenceForm(conf, version)
+
+    @staticmethod
+    def _conferenceFormKey(websafeConferenceKey, version):
+        """Memcache key of a rendered ConferenceForm at a change counter value."""
+        return '%s%s:%s' % (MEMCACHE_CONFERENCE_FORM_PREFIX, websafeConferenceKey, version)
+
+    def _cacheConferenceForm(self, conf, version):
+        """Render the ConferenceForm of conf and keep it in memcache and
+        the instance cache for CONFERENCE_FORM_CACHE_SECONDS, the most an
+        organizer name change takes to show.
+        """
         prof = conf.key.parent().get()
-        # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        form = self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        # read before conf, so a watch started from it can't miss a change
+        form.watchVersion = int(version or 0)
+        wsck = conf.key.urlsafe()
+        encoded = formcodec.encode(form)
+        if encoded:
+            memcache.set(self._conferenceFormKey(wsck, version), encoded,
+                time=CONFERENCE_FORM_CACHE_SECONDS)
+        hotcache.put('conference:' + wsck, (version, form), CONFERENCE_FORM_CACHE_SECONDS)
+        return form
+
+    # - - - Organizer dashboard - - - - - - - - - - - - - - - - - - - -
+
+    _updateOrganizerSummary = staticmethod(logic.updateOrganizerSummary)
+
+    @endpoints.method(message_types.VoidMessage, OrganizerDashboardForm,
+            path='organizer/dashboard',
+            http_method='GET', name='getOrganizerDashboard')
+    @metrics.instrumented
+    def getOrganizerDashboard(self, request):
+        """Return totals of the conferences created by user."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
 
-    # - - - Query Conferences - - - - - - - - - - - - - - - - - - - -
+        p_key = ndb.Key(Profile, getUserId(user))
+        # the per-conference rows are read alongside the totals
+        entries = ConferenceSummary.query(ancestor=p_key).fetch_async(ORGANIZER_DASHBOARD_LIMIT)
+        summary = ndb.Key(OrganizerSummary, ORGANIZER_SUMMARY_ID, parent=p_key).get()
+        if not summary:
+            return OrganizerDashboardForm(conferenceCount=0, totalSeats=0, seatsSold=0)
+
+        entries = entries.get_result()
+        return OrganizerDashboardForm(
+            conferenceCount=summary.conferenceCount,
+            totalSeats=summary.totalSeats,
+            seatsSold=summary.seatsSold,
+            conferences=[ConferenceSummaryForm(
+                websafeConferenceKey=entry.websafeConferenceKey,
+                name=entry.name,
+                maxAttendees=entry.maxAttendees,
+                seatsSold=entry.seatsSold,
+                sessions=entry.sessions) \
+            for entry in entries]
+        )
+
+# - - - Conference facets - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _updateFacets(changes, transactional=False):
+        """Queue facet counter changes, if there are any, under a change
+        id the counters use to skip retried deliveries."""
+        if changes:
+            changeId = uuid.uuid4().hex
+            # transactional tasks can't be named
+            taskqueue.add(params={'changes': json.dumps(changes), 'changeId': changeId},
+                name=None if transactional else 'facets-' + changeId,
+                url='/tasks/update_facets', transactional=transactional)
+
+    @endpoints.method(ConferenceQueryForms, ConferenceFacetForms, path='getConferenceFacets',
+            http_method='POST', name='getConferenceFacets')
+    @metrics.instrumented
+    def getConferenceFacets(self, request):
+        """Return city, topic and month counts of conferences matching
+        the selected (equality) filters.
+        """
+        names = dict((field, name) for name, field in CONF_FIELDS.items())
+        selection = {}
+        for f in request.filters:
+            field = CONF_FIELDS.get(f.field)
+            if field not in facets.FACETS or f.operator != 'EQ':
+                raise endpoints.BadRequestException(
+                    "Facets can only be selected with EQ on CITY, TOPIC or MONTH.")
+            selection[field] = f.value
+
+        counts = facets.getCounts(selection)
+        return ConferenceFacetForms(
+            items=[ConferenceFacetForm(field=names[field], value=value, count=count) \
+            for field in facets.FACETS \
+            for value, count in sorted(counts[field].items(), key=lambda item: -item[1])]
+        )
+
+# - - - Query Conferences - - - - - - - - - - - - - - - - - - - -
 
     @endpoints.method(ConferenceQueryForms, ConferenceForms, path='queryConferences',
             http_method='POST', name='queryConferences')
+    @metrics.instrumented
     def queryConferences(self, request):
         """Query for conferences."""
-        print(request)
-        conferences = self._getQuery(request)
+        conferences = self._getQuery(request, 'queryConferences')
 
          # return individual ConferenceForm object per Conference
         return ConferenceForms(
@@ -463,6 +902,7 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms, path='getConferencesCreated',
             http_method='POST', name='getConferencesCreated')
+    @metrics.instrumented
     def getConferencesCreated(self, request):
         """Return conferences created by user."""
         # make sure user is authed
@@ -473,7 +913,8 @@ class ConferenceApi(remote.Service):
         # make profile key
         p_key = ndb.Key(Profile, getUserId(user))
         # create ancestor query for this user
-        conferences = Conference.query(ancestor=p_key)
+        conferences = self._fetchList(Conference.query(ancestor=p_key),
+            'getConferencesCreated')
         # get the user profile and display name
         prof = p_key.get()
         displayName = getattr(prof, 'displayName')
@@ -485,6 +926,7 @@ class ConferenceApi(remote.Service):
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='conferences/attending',
             http_method='GET', name='getConferencesToAttend')
+    @metrics.instrumented
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for."""
         # make sure user is authed
@@ -524,6 +966,7 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms, path='filterPlayground',
             http_method='POST', name='filterPlayground')
+    @metrics.instrumented
     def filterPlayground(self, request):
         conferences = (Conference.query(Conference.city == 'London')
                         .filter(Conference.topics == 'Medical Innovations')
@@ -559,14 +1002,21 @@ class ConferenceApi(remote.Service):
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
+            # a user registering directly takes the seat of their own
+            # hold, or else claims a seat token
+            hold_key = self._seatHoldKey(wsck, prof.key.id())
+            if hold_key.get():
+                hold_key.delete()
+            elif not logic.claimSeatToken(wsck):
                 raise ConflictException(
                     "There are no seats available.")
 
             # register user, take away one seat
             prof.conferenceKeysToAttend.append(wsck)
             conf.seatsAvailable -= 1
+            # a registered user no longer needs their waitlist entry
+            ndb.Key(WaitlistEntry, prof.key.id(), parent=conf.key).delete()
+            self._registration(prof, conf).put()
             retval = True
 
         # unregister
@@ -576,7 +1026,12 @@ class ConferenceApi(remote.Service):
 
                 # unregister user, add back one seat
                 prof.conferenceKeysToAttend.remove(wsck)
+                ndb.Key(Registration, prof.key.id(), parent=conf.key).delete()
                 conf.seatsAvailable += 1
+                # hand the freed seat to the head of the waitlist, or
+                # back to the token pool
+                if not self._promoteFromWaitlist(conf, 1):
+                    logic.returnSeatToken(wsck)
                 retval = True
             else:
                 retval = False
@@ -584,22 +1039,328 @@ class ConferenceApi(remote.Service):
         # write things back to the datastore & return
         prof.put()
         conf.put()
+        self._updateOrganizerSummary([conf])
+        # wake up watchConferences() long-polls once the seat change is committed
+        if retval:
+            ndb.get_context().call_on_commit(
+                lambda: self._bumpConferenceVersion(wsck))
         return BooleanMessage(data=retval)
 
 
+    _registration = staticmethod(logic.registration)
+
+    @staticmethod
+    def _getAttendeesPage(conf_key, pageSize, cursor=None):
+        """Return (registrations, nextPageToken) for a page of the roster."""
+        # ancestor query in key order; served by the built-in indexes
+        registrations, next_cursor, more = Registration.query(ancestor=conf_key).fetch_page(
+            pageSize, start_cursor=cursor)
+        return registrations, (next_cursor.urlsafe() if more and next_cursor else None)
+
+    @endpoints.method(ATTENDEES_GET_REQUEST, AttendeeForms,
+            path='getConferenceAttendees/{websafeConferenceKey}',
+            http_method='GET', name='getConferenceAttendees')
+    @metrics.instrumented
+    def getConferenceAttendees(self, request):
+        """Return a page of the users registered for a conference (organizer only)."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+
+        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % request.websafeConferenceKey)
+        if getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can list the conference attendees.')
+
+        try:
+            cursor = ndb.Cursor(urlsafe=request.pageToken) if request.pageToken else None
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException('Invalid pageToken.')
+        registrations, nextPageToken = self._getAttendeesPage(conf.key,
+            min(request.pageSize or ATTENDEES_PAGE_SIZE, ATTENDEES_PAGE_SIZE), cursor)
+
+        return AttendeeForms(
+            items=[AttendeeForm(userId=registration.key.id(),
+                displayName=registration.displayName,
+                mainEmail=registration.mainEmail) \
+            for registration in registrations],
+            nextPageToken=nextPageToken)
+
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/details/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
+    @metrics.instrumented
     def registerForConference(self, request):
         """Register user for selected conference."""
+        conf_key = logic.conferenceKey(request.websafeConferenceKey)
+        if conf_key:
+            logic.allocateSeatTokens(conf_key)
         return self._conferenceRegistration(request)
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
         path='unregisterFromConference/{websafeConferenceKey}',
         http_method='POST', name='unregisterFromConference')
+    @metrics.instrumented
     def unregisterFromConference(self, request):
         return self._conferenceRegistration(request, reg=False)
 
+# - - - Seat holds - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _seatHoldKey(websafeConferenceKey, user_id):
+        """Return key of the SeatHold of a user for a conference."""
+        return ndb.Key(SeatHold, '%s:%s' % (websafeConferenceKey, user_id))
+
+    def _holdSeat(self, request):
+        """Claim a seat token for a user, without writing the conference."""
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        if wsck in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+        conf_key = logic.conferenceKey(wsck)
+        if not conf_key or not conf_key.get():
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        logic.allocateSeatTokens(conf_key)
+
+        hold_key = self._seatHoldKey(wsck, prof.key.id())
+        expires = datetime.now() + timedelta(seconds=SEAT_HOLD_SECONDS)
+
+        # an unexpired hold is returned as is; an expired one the cron
+        # hasn't released still has its token, so it is just renewed
+        @ndb.transactional()
+        def renew():
+            hold = hold_key.get()
+            if hold and hold.expires <= datetime.now():
+                hold.expires = expires
+                hold.put()
+            return hold
+        hold = renew()
+
+        if not hold:
+            hold = SeatHold(key=hold_key, websafeConferenceKey=wsck,
+                userId=prof.key.id(), expires=expires)
+            if not logic.claimSeatToken(wsck, hold):
+                raise ConflictException(
+                    "There are no seats available.")
+        return SeatHoldForm(websafeConferenceKey=wsck, expires=str(hold.expires))
+
+    @endpoints.method(CONF_GET_REQUEST, SeatHoldForm,
+            path='holdSeat/{websafeConferenceKey}',
+            http_method='POST', name='holdSeat')
+    @metrics.instrumented
+    def holdSeat(self, request):
+        """Claim a seat for SEAT_HOLD_SECONDS; confirm with confirmSeatHold."""
+        return self._holdSeat(request)
+
+    @ndb.transactional(xg=True)
+    def _confirmSeatHold(self, request):
+        """Turn a user's seat hold into a registration; the held seat is
+        taken out of seatsAvailable only now."""
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        conf_key = logic.conferenceKey(wsck)
+        conf = conf_key.get() if conf_key else None
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        hold_key = self._seatHoldKey(wsck, prof.key.id())
+        hold = hold_key.get()
+        if not hold or hold.expires <= datetime.now():
+            raise ConflictException(
+                "You have no seat hold for this conference, or it expired.")
+
+        hold_key.delete()
+        if wsck in prof.conferenceKeysToAttend:
+            # registered meanwhile; the held seat goes back to the pool
+            logic.returnSeatToken(wsck)
+            return BooleanMessage(data=True)
+
+        prof.conferenceKeysToAttend.append(wsck)
+        conf.seatsAvailable -= 1
+        ndb.Key(WaitlistEntry, prof.key.id(), parent=conf.key).delete()
+        ndb.put_multi([prof, conf, self._registration(prof, conf)])
+        self._updateOrganizerSummary([conf])
+
+        ndb.get_context().call_on_commit(
+            lambda: self._bumpConferenceVersion(wsck))
+        return BooleanMessage(data=True)
+
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+            path='confirmSeatHold/{websafeConferenceKey}',
+            http_method='POST', name='confirmSeatHold')
+    @metrics.instrumented
+    def confirmSeatHold(self, request):
+        """Register user for a conference using a seat hold."""
+        return self._confirmSeatHold(request)
+
+    _expireSeatHolds = staticmethod(logic.expireSeatHolds)
+
+# - - - Waitlist - - - - - - - - - - - - - - - - - - - -
+
+    _promoteFromWaitlist = staticmethod(logic.promoteFromWaitlist)
+
+    def _joinWaitlist(self, request):
+        """Append user to the waitlist of a sold out conference."""
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        if wsck in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+        conf_key = logic.conferenceKey(wsck)
+        if not conf_key:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        conf = conf_key.get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        # checked outside the transaction, which would otherwise span
+        # every seat token shard
+        if logic.freeSeats(conf) > 0:
+            raise ConflictException(
+                "There are seats available, register instead.")
+        entry_key = ndb.Key(WaitlistEntry, prof.key.id(), parent=conf_key)
+
+        @ndb.transactional()
+        def join():
+            conf, entry = ndb.get_multi([conf_key, entry_key])
+            if not entry:
+                # take the next ticket from the conference's counter
+                entry = WaitlistEntry(key=entry_key, userId=prof.key.id(),
+                    ticket=conf.waitlistTail)
+                conf.waitlistTail += 1
+                ndb.put_multi([entry, conf])
+            return conf, entry
+        conf, entry = join()
+
+        return WaitlistPositionForm(websafeConferenceKey=wsck,
+            position=entry.ticket - conf.waitlistHead + 1)
+
+    @endpoints.method(CONF_GET_REQUEST, WaitlistPositionForm,
+            path='joinWaitlist/{websafeConferenceKey}',
+            http_method='POST', name='joinWaitlist')
+    @metrics.instrumented
+    def joinWaitlist(self, request):
+        """Join the waitlist of a sold out conference."""
+        return self._joinWaitlist(request)
+
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+            path='leaveWaitlist/{websafeConferenceKey}',
+            http_method='POST', name='leaveWaitlist')
+    @metrics.instrumented
+    def leaveWaitlist(self, request):
+        """Leave the waitlist of a conference."""
+        prof = self._getProfileFromUser()
+        conf_key = logic.conferenceKey(request.websafeConferenceKey)
+        if not conf_key:
+            return BooleanMessage(data=False)
+        entry_key = ndb.Key(WaitlistEntry, prof.key.id(), parent=conf_key)
+
+        # the entry shares the conference's entity group, so this can't
+        # interleave with a promotion deleting it
+        @ndb.transactional()
+        def leave():
+            if not entry_key.get():
+                # never joined, or already promoted
+                return False
+            entry_key.delete()
+            return True
+        return BooleanMessage(data=leave())
+
+    @endpoints.method(CONF_GET_REQUEST, WaitlistPositionForm,
+            path='getWaitlistPosition/{websafeConferenceKey}',
+            http_method='GET', name='getWaitlistPosition')
+    @metrics.instrumented
+    def getWaitlistPosition(self, request):
+        """Return user's position on a conference waitlist (1 is next).
+
+        Computed from the entry ticket and the conference waitlistHead
+        counter, so users who left the waitlist ahead of the caller are
+        still counted until the head passes them.
+        """
+        prof = self._getProfileFromUser()
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        conf, entry = ndb.get_multi([conf_key,
+            ndb.Key(WaitlistEntry, prof.key.id(), parent=conf_key)])
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % request.websafeConferenceKey)
+        if not entry:
+            raise endpoints.NotFoundException(
+                'You are not on the waitlist for this conference.')
+
+        return WaitlistPositionForm(websafeConferenceKey=request.websafeConferenceKey,
+            position=entry.ticket - conf.waitlistHead + 1)
+
+# - - - Live updates - - - - - - - - - - - - - - - - - - - -
+
+    _bumpConferenceVersion = staticmethod(logic.bumpConferenceVersion)
+
+    @endpoints.method(ConferenceWatchForm, ConferenceChangeForms,
+            path='conference/watch',
+            http_method='POST', name='watchConferences')
+    @metrics.instrumented
+    def watchConferences(self, request):
+        """Long-poll watched conferences; return once seatsAvailable or
+        featuredSpeakers change, or empty after LONG_POLL_SECONDS.
+        """
+        if not request.items:
+            return ConferenceChangeForms(items=[])
+        for item in request.items:
+            if not logic.conferenceKey(item.websafeConferenceKey):
+                raise endpoints.BadRequestException(
+                    'Not a conference key: %s' % item.websafeConferenceKey)
+        lastSeen = dict((item.websafeConferenceKey, item.version or 0)
+            for item in request.items)
+
+        # each waiting poll holds a request thread; cap them per instance
+        with _longPollLock:
+            wait = _longPollWaiters[0] < LONG_POLL_MAX_WAITERS
+            if wait:
+                _longPollWaiters[0] += 1
+        try:
+            changed, versions = self._waitForChanges(lastSeen,
+                LONG_POLL_SECONDS if wait else 0)
+        finally:
+            if wait:
+                with _longPollLock:
+                    _longPollWaiters[0] -= 1
+
+        confs = ndb.get_multi([logic.conferenceKey(wsck) for wsck in changed])
+        return ConferenceChangeForms(
+            items=[ConferenceChangeForm(websafeConferenceKey=wsck,
+                version=int(versions.get(wsck, 0)),
+                seatsAvailable=conf.seatsAvailable,
+                featuredSpeakers=conf.featuredSpeakers) \
+            for wsck, conf in zip(changed, confs) if conf],
+            retryAfter=None if wait or changed else LONG_POLL_RETRY_SECONDS
+        )
+
+    @staticmethod
+    def _waitForChanges(lastSeen, seconds):
+        """Poll the memcache counters of lastSeen for up to seconds,
+        backing off from LONG_POLL_INTERVAL to LONG_POLL_MAX_INTERVAL;
+        return (changed websafe keys, versions).
+        """
+        deadline = time.time() + seconds
+        interval = LONG_POLL_INTERVAL
+        # wait on the memcache counters; no datastore reads until something changes
+        while True:
+            versions = memcache.get_multi(lastSeen.keys(),
+                key_prefix=MEMCACHE_CONFERENCE_VERSION_PREFIX)
+            changed = [wsck for wsck in lastSeen
+                if int(versions.get(wsck, 0)) != lastSeen[wsck]]
+            remaining = deadline - time.time()
+            if changed or remaining <= 0:
+                return changed, versions
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, LONG_POLL_MAX_INTERVAL)
+
 # - - - Sessions - - - - - - - - - - - - - - - - - - - - - -
 
     def _createSessionObject(self, request):
@@ -643,7 +1404,18 @@ class ConferenceApi(remote.Service):
         data['key'] = session_key
 
         session = Session(**data)
-        session.put()
+
+        @ndb.transactional()
+        def putSession():
+            session.put()
+            self._updateOrganizerSummary([conf_key.get()], sessions=1)
+            taskqueue.add(params={'websafeKey': session_key.urlsafe()},
+                url='/tasks/index_document', transactional=True)
+            self._updateAutocomplete(
+                autocomplete.countChanges('speaker', [], [data['speaker']]), transactional=True)
+        putSession()
+        memcache.delete(MEMCACHE_AGENDA_PREFIX + request.websafeConferenceKey,
+            seconds=AGENDA_LOCK_SECONDS)
 
         # if a speaker was provided,
         if data['speaker']:
@@ -656,17 +1428,8 @@ class ConferenceApi(remote.Service):
     def _copySessionToForm(self, session):
         """Copy relevant fields from Session to SessionForm."""
         sf = SessionForm()
-        for field in sf.all_fields():
-            # TODO: convert date and time objects to date and time strings
-            if hasattr(session, field.name):
-                if field.name == 'dateTime':
-                    setattr(sf, field.name, str(getattr(session, field.name)))
-                #if field.name == 'startTime':
-                    #setattr(sf, field.name, str(getattr(session, field.name)))
-                #elif field.name == 'date':
-                    #setattr(sf, field.name, str(getattr(session, field.name)))
-                else:
-                    setattr(sf, field.name, getattr(session, field.name))
+        for name, convert in self._converterPlan(SessionForm, Session):
+            setattr(sf, name, convert(session))
 
         sf.check_initialized()
         return sf
@@ -678,20 +1441,11 @@ class ConferenceApi(remote.Service):
         sessions = Session.query(ancestor=conf_key)
         return sessions
 
-    def _getConferenceSessionQuery(self, request):
-        """Return formatted query from the submitted filters."""
+    def _getConferenceSessionQuery(self, request, endpoint):
+        """Return sessions of a conference matching the submitted filters."""
         conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-
-        q = Session.query(ancestor=conf_key)
         inequality_filter, filters = self._formatSessionFilters(request.filters)
 
-        # if exists, sort of inequality filter first
-        if not inequality_filter:
-            q = q.order(Session.sessionName)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Session.sessionName)
-
         for filtr in filters:
             # TODO: convert date and time strings to date and time objects?
             if filtr['field'] == 'dateTime':
@@ -699,9 +1453,8 @@ class ConferenceApi(remote.Service):
             if filtr["field"] == 'duration':
                 filtr["value"] = int(filtr["value"])
 
-            formatted_query = ndb.query.FilterNode(filtr['field'], filtr['operator'], filtr['value'])
-            q = q.filter(formatted_query)
-        return q
+        # if exists, sort of inequality filter first, then by name
+        return self._runPlannedQuery(Session, filters, 'sessionName', endpoint, ancestor=conf_key)
 
     def _formatSessionFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
@@ -729,28 +1482,53 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(SESS_POST_REQUEST, SessionForm, path='createSession/{websafeConferenceKey}',
         http_method='POST', name='createSession')
+    @metrics.instrumented
     def createSession(self, request):
         """Create new session."""
         return self._createSessionObject(request)
 
 # - - - Query Sessions - - - - - - - - - - - - - - - - - - - -
 
-    @endpoints.method(CONF_GET_REQUEST, SessionForms, path='getConferenceSessions/{websafeConferenceKey}',
+    @endpoints.method(CONF_CONDITIONAL_GET_REQUEST, SessionForms, path='getConferenceSessions/{websafeConferenceKey}',
         http_method='POST', name='getConferenceSessions')
+    @metrics.instrumented
     def getConferenceSessions(self, request):
+        """Return the sessions of a conference, or only unchanged=True if
+        the etag of the agenda matches ifNoneMatch."""
+        forms = self._getAgendaForms(request)
+        if request.ifNoneMatch and request.ifNoneMatch == forms.etag:
+            return SessionForms(etag=forms.etag, unchanged=True)
+        return forms
+
+    def _getAgendaForms(self, request):
+        """Return the rendered SessionForms of a conference, from memcache
+        when possible."""
+        agendaKey = MEMCACHE_AGENDA_PREFIX + request.websafeConferenceKey
+        forms = formcodec.decode(SessionForms, memcache.get(agendaKey))
+        if forms is not None:
+            return forms
+
         sessions = self._getConferenceSessions(request)
         sessions = sessions.order(Session.sessionName)
+        sessions = list(self._fetchList(sessions, 'getConferenceSessions'))
 
-        return SessionForms(
+        forms = SessionForms(
             items=[self._copySessionToForm(session) \
-            for session in sessions])
+            for session in sessions],
+            etag=self._etag(sessions))
+        encoded = formcodec.encode(forms)
+        if encoded:
+            memcache.add(agendaKey, encoded, time=AGENDA_CACHE_SECONDS)
+        return forms
 
     @endpoints.method(SESS_STR_POST_REQUEST, SessionForms, path='getConferenceSessionsByType/{websafeConferenceKey}',
         http_method='POST', name='getConferenceSessionsByType')
+    @metrics.instrumented
     def getConferenceSessionsByType(self, request):
         sessions = self._getConferenceSessions(request)
         sessions = sessions.filter(Session.typeOfSession == request.data)
         sessions = sessions.order(Session.sessionName)
+        sessions = self._fetchList(sessions, 'getConferenceSessionsByType')
 
         return SessionForms(
             items=[self._copySessionToForm(session) \
@@ -758,9 +1536,11 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(StringMessage, SessionForms, path='getSessionsBySpeaker',
         http_method='POST', name='getSessionsBySpeaker')
+    @metrics.instrumented
     def getSessionsBySpeaker(self, request):
         sessions = Session.query(Session.speaker == request.data)
         sessions = sessions.order(Session.sessionName)
+        sessions = self._fetchList(sessions, 'getSessionsBySpeaker')
 
         return SessionForms(
             items=[self._copySessionToForm(session) \
@@ -768,15 +1548,83 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(SESS_QUERY_REQUEST, SessionForms, path='queryConferenceSessions/{websafeConferenceKey}',
         http_method='POST', name='queryConferenceSessions')
+    @metrics.instrumented
     def queryConferenceSessions(self, request):
-        sessions = self._getConferenceSessionQuery(request)
+        sessions = self._getConferenceSessionQuery(request, 'queryConferenceSessions')
 
         return SessionForms(
             items=[self._copySessionToForm(session) \
             for session in sessions])
 
+# - - - Autocomplete - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _updateAutocomplete(changes, transactional=False):
+        """Queue autocomplete count changes, if there are any, under a
+        change id the counters use to skip retried deliveries."""
+        if changes:
+            changeId = uuid.uuid4().hex
+            # transactional tasks can't be named
+            taskqueue.add(params={'changes': json.dumps(changes), 'changeId': changeId},
+                name=None if transactional else 'autocomplete-' + changeId,
+                url='/tasks/update_autocomplete', transactional=transactional)
+
+    @endpoints.method(AutocompleteForm, AutocompleteForms, path='autocomplete',
+            http_method='POST', name='getAutocomplete')
+    @metrics.instrumented
+    def getAutocomplete(self, request):
+        """Return known cities, topics or speakers starting with prefix."""
+        try:
+            field = AUTOCOMPLETE_FIELDS[request.field]
+        except KeyError:
+            raise endpoints.BadRequestException("Autocomplete field must be one of: %s" %
+                ', '.join(sorted(AUTOCOMPLETE_FIELDS)))
+
+        limit = min(request.limit or AUTOCOMPLETE_LIMIT, SEARCH_MAX_PAGE_SIZE)
+        suggestions = autocomplete.suggest(field, request.prefix or u'', limit)
+        return AutocompleteForms(
+            items=[AutocompleteItemForm(value=value, count=count) \
+            for value, count in suggestions]
+        )
+
+# - - - Search - - - - - - - - - - - - - - - - - - - -
+
+    def _search(self, kind, request):
+        """Return (entities, nextPageToken) for one page of search results."""
+        pageSize = min(request.pageSize or SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+        try:
+            offset = int(request.pageToken or 0)
+        except ValueError:
+            raise endpoints.BadRequestException('Invalid pageToken.')
+
+        websafeKeys, more = search.search(kind, request.query or '', offset, pageSize)
+        entities = ndb.get_multi([ndb.Key(urlsafe=key) for key in websafeKeys])
+        nextPageToken = str(offset + pageSize) if more else None
+        return [entity for entity in entities if entity], nextPageToken
+
+    @endpoints.method(SearchForm, ConferenceSearchForms, path='searchConferences',
+            http_method='POST', name='searchConferences')
+    @metrics.instrumented
+    def searchConferences(self, request):
+        """Full-text search over conference name, description and topics."""
+        conferences, nextPageToken = self._search('Conference', request)
+        return ConferenceSearchForms(
+            items=[self._copyConferenceToForm(conf, "") for conf in conferences],
+            nextPageToken=nextPageToken)
+
+    @endpoints.method(SearchForm, SessionSearchForms, path='searchSessions',
+            http_method='POST', name='searchSessions')
+    @metrics.instrumented
+    def searchSessions(self, request):
+        """Full-text search over session name, highlights and speaker."""
+        sessions, nextPageToken = self._search('Session', request)
+        return SessionSearchForms(
+            items=[self._copySessionToForm(session) for session in sessions],
+            nextPageToken=nextPageToken)
+
     @endpoints.method(CONF_GET_REQUEST, StringMessage, path='getFeaturedSpeaker/{websafeConferenceKey}',
         http_method='POST', name='getFeaturedSpeaker')
+    @metrics.instrumented
     def getFeaturedSpeaker(self, request):
         conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
         conf = conf_key.get()
@@ -791,55 +1639,69 @@ class ConferenceApi(remote.Service):
 
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
-    @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        print('cacheAnnouncements called')
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
-                'Last chance to attend! The following conferences '
-                'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
-        return announcement
+    _cacheAnnouncement = staticmethod(logic.cacheAnnouncement)
 
     @staticmethod
-    def _cacheSpeakerAnnouncement(speaker, sessionNames, conferenceName):
-        formattedSessionNames = ', '.join(session for session in sessionNames)
-
-        announcement = "%s is speaker for the following sessions: %s at %s conference" % (speaker, formattedSessionNames, conferenceName)
-        memcache.set(MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY, announcement)
-
-        return announcement
-
-
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+    def _warmup():
+        """Prime the instance cache: the announcement, forms of the
+        WARMUP_CONFERENCES most viewed conferences and converter plans.
+        """
+        for formClass, modelClass in ((ProfileForm, Profile),
+                (ConferenceForm, Conference), (SessionForm, Session)):
+            ConferenceApi._converterPlan(formClass, modelClass)
+
+        hotcache.put(MEMCACHE_ANNOUNCEMENTS_KEY, memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "",
+            ANNOUNCEMENT_CACHE_SECONDS)
+
+        # a malformed key in the shared counts mustn't fail the warmup
+        wscks = [wsck for wsck in hotcache.topViewed(WARMUP_CONFERENCES)
+            if logic.conferenceKey(wsck)]
+        versions = memcache.get_multi(wscks, key_prefix=MEMCACHE_CONFERENCE_VERSION_PREFIX)
+        confs = ndb.get_multi([logic.conferenceKey(wsck) for wsck in wscks])
+        # organizer profiles in one batch; _cacheConferenceForm then reads them from the context cache
+        ndb.get_multi([conf.key.parent() for conf in confs if conf])
+        api = ConferenceApi()
+        for wsck, conf in zip(wscks, confs):
+            if conf:
+                api._cacheConferenceForm(conf, versions.get(wsck))
+        return len([conf for conf in confs if conf])
+    _cacheSpeakerAnnouncement = staticmethod(logic.cacheSpeakerAnnouncement)
+    _getSpeakerAnnouncements = staticmethod(logic.getSpeakerAnnouncements)
+
+    @endpoints.method(ANNOUNCEMENT_GET_REQUEST, AnnouncementForm,
             path='conference/announcement/get',
             http_method='GET', name='getAnnouncement')
+    @metrics.instrumented
     def getAnnouncement(self, request):
-        """Return Announcement from memcache."""
+        """Return Announcement from memcache, or only unchanged=True if
+        its etag matches ifNoneMatch."""
         # TODO 1
         # return an existing announcement from Memcache or an empty string.
-        announcement = ""
-        if memcache.get(MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY):
-            announcement = memcache.get(MEMCACHE_SPEAKER_ANNOUNCEMENTS_KEY)
+        announcement = hotcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
+        if announcement is None:
+            announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or ""
+            hotcache.put(MEMCACHE_ANNOUNCEMENTS_KEY, announcement, ANNOUNCEMENT_CACHE_SECONDS)
+
+        etag = self._etag([], announcement)
+        if request.ifNoneMatch and request.ifNoneMatch == etag:
+            return AnnouncementForm(etag=etag, unchanged=True)
+        return AnnouncementForm(data=announcement, etag=etag)
+
+    @endpoints.method(message_types.VoidMessage, SpeakerAnnouncementForms,
+            path='conference/announcement/speakers',
+            http_method='GET', name='getSpeakerAnnouncements')
+    @metrics.instrumented
+    def getSpeakerAnnouncements(self, request):
+        """Return speaker announcements for conferences the user attends."""
+        prof = self._getProfileFromUser()
+        websafeConferenceKeys = prof.conferenceKeysToAttend
+        announcements = self._getSpeakerAnnouncements(websafeConferenceKeys)
 
-        return StringMessage(data=announcement)
+        return SpeakerAnnouncementForms(
+            items=[SpeakerAnnouncementForm(websafeConferenceKey=wsck,
+                announcement=announcements[wsck]) \
+            for wsck in websafeConferenceKeys if wsck in announcements]
+        )
 
 
 # registers API
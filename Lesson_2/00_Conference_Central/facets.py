@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""facets.py
+
+Udacity conference server-side Python App Engine faceted counts;
+    per-(city, topic, month) conference counters, maintained on write so
+    the conference browser can show counts without scanning conferences
+
+"""
+
+import json
+import random
+import zlib
+
+from google.appengine.ext import ndb
+
+from models import FacetCounts
+
+FACETS = ('city', 'topics', 'month')
+ANY = '*'
+
+# every conference write touches the [facet, *, *] counters; sharding
+# them spreads concurrent writes over FACET_SHARDS entity groups
+FACET_SHARDS = 8
+
+# change ids remembered per shard; retries come well within this many changes
+APPLIED_CHANGES_KEPT = 500
+
+
+def _countsId(facet, selection):
+    """Id of the counts of facet under a selection of the other facets."""
+    return json.dumps([facet] + [selection.get(other, ANY)
+        for other in FACETS if other != facet])
+
+
+def _values(conf):
+    """Return {facet: [values]} for a Conference."""
+    return {
+        'city': [conf.city] if conf.city else [],
+        'topics': list(conf.topics),
+        'month': [str(conf.month)] if conf.month is not None else [],
+    }
+
+
+def _changesFor(values, sign, changes):
+    for facet in FACETS:
+        first, second = [other for other in FACETS if other != facet]
+        for value in values[facet]:
+            for a in values[first] + [ANY]:
+                for b in values[second] + [ANY]:
+                    deltas = changes.setdefault(_countsId(facet, {first: a, second: b}), {})
+                    deltas[value] = deltas.get(value, 0) + sign
+
+
+def countChanges(oldConf, newConf):
+    """Return {countsId: {value: delta}} moving a conference from oldConf
+    to newConf; either may be None for create/delete.
+    """
+    changes = {}
+    if oldConf:
+        _changesFor(_values(oldConf), -1, changes)
+    if newConf:
+        _changesFor(_values(newConf), 1, changes)
+    for countsId in changes.keys():
+        changes[countsId] = dict((value, delta)
+            for value, delta in changes[countsId].items() if delta)
+        if not changes[countsId]:
+            del changes[countsId]
+    return changes
+
+
+def _shardKey(countsId, shard):
+    # shard 0 keeps the unsharded id, so counts from before sharding still add up
+    return ndb.Key(FacetCounts, '%s#%d' % (countsId, shard) if shard else countsId)
+
+
+def _shardOf(changeId):
+    """A change always goes to the same shard, where its id is remembered."""
+    if not changeId:
+        return random.randrange(FACET_SHARDS)
+    return (zlib.crc32(changeId.encode('utf-8')) & 0xffffffff) % FACET_SHARDS
+
+
+@ndb.transactional()
+def _updateCounts(key, deltas, changeId):
+    entry = key.get() or FacetCounts(key=key, counts={})
+    if changeId:
+        # task delivery is at least once; apply each change once
+        if changeId in entry.applied:
+            return
+        entry.applied = (entry.applied + [changeId])[-APPLIED_CHANGES_KEPT:]
+    for value, delta in deltas.items():
+        # a shard may go negative; only the sum over shards is a count
+        count = entry.counts.get(value, 0) + delta
+        if count:
+            entry.counts[value] = count
+        else:
+            entry.counts.pop(value, None)
+    entry.put()
+
+
+def updateCounts(changes, changeId=None):
+    """Apply the output of countChanges(), one transaction per counter
+    entity; counters that already applied changeId are left as they are.
+    """
+    shard = _shardOf(changeId)
+    for countsId, deltas in changes.items():
+        _updateCounts(_shardKey(countsId, shard), deltas, changeId)
+
+
+def getCounts(selection):
+    """Return {facet: {value: count}} for conferences matching selection,
+    a dict of facet -> selected value; one batch get.
+    """
+    keys = [_shardKey(_countsId(facet, selection), shard)
+        for facet in FACETS for shard in range(FACET_SHARDS)]
+    entries = ndb.get_multi(keys)
+    counts = {}
+    for i, facet in enumerate(FACETS):
+        total = counts[facet] = {}
+        for entry in entries[i * FACET_SHARDS:(i + 1) * FACET_SHARDS]:
+            for value, count in (entry.counts if entry else {}).items():
+                total[value] = total.get(value, 0) + count
+        counts[facet] = dict((value, count) for value, count in total.items() if count > 0)
+    return counts
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""formcodec.py
+
+Udacity conference server-side Python App Engine form codec;
+    compact memcache encoding of rendered ProtoRPC forms: protocol
+    buffer encoding behind a one byte header with a format version,
+    zlib compressed when large (long descriptions, big agendas)
+
+"""
+
+import zlib
+
+from protorpc import protobuf
+
+# bump when the encoding changes; values of other versions decode as misses
+FORMAT_VERSION = 1
+COMPRESSED = 0x80
+
+# encoded forms at least this long are compressed
+COMPRESS_MIN_BYTES = 1024
+
+# stay well under memcache's 1MB item limit, leaving room for the key
+MAX_VALUE_BYTES = 900 * 1024
+
+
+def encode(message):
+    """Return message as a compact string, or None if too large to cache."""
+    body = protobuf.encode_message(message)
+    flags = FORMAT_VERSION
+    if len(body) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(body, 6)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= COMPRESSED
+    if len(body) + 1 > MAX_VALUE_BYTES:
+        return None
+    return chr(flags) + body
+
+
+def decode(messageClass, data):
+    """Return the messageClass message encoded in data, or None when
+    data is missing or was written by another format version."""
+    if not data:
+        return None
+    flags = ord(data[0])
+    if flags & ~COMPRESSED != FORMAT_VERSION:
+        return None
+    body = data[1:]
+    if flags & COMPRESSED:
+        body = zlib.decompress(body)
+    return protobuf.decode_message(messageClass, body)
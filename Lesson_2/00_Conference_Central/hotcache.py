@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""hotcache.py
+
+Udacity conference server-side Python App Engine instance cache;
+    short-lived process-memory cache of hot values, primed by the
+    /_ah/warmup handler, and the conference view counts that decide
+    which conferences are hot
+
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from google.appengine.api import memcache
+
+# most values kept per instance; the least recently used go first
+MAX_VALUES = 1000
+# most conferences kept in the shared view counts
+TOP_VIEWED_KEPT = 200
+VIEWS_FLUSH_SECONDS = 60
+
+MEMCACHE_CONFERENCE_VIEWS_KEY = 'CONFERENCE VIEWS'
+CAS_RETRIES = 5
+
+_lock = threading.Lock()
+# key -> (expires, value), least recently used first
+_values = OrderedDict()
+_views = {}
+_lastViewsFlush = [time.time()]
+
+
+def get(key):
+    """Return the cached value of key, or None if missing or expired."""
+    with _lock:
+        entry = _values.pop(key, None)
+        if entry is None or entry[0] < time.time():
+            return None
+        _values[key] = entry
+    return entry[1]
+
+
+def put(key, value, seconds):
+    """Cache value in this instance for seconds, evicting the least
+    recently used values beyond MAX_VALUES."""
+    with _lock:
+        _values.pop(key, None)
+        _values[key] = (time.time() + seconds, value)
+        while len(_values) > MAX_VALUES:
+            _values.popitem(last=False)
+
+
+def clear():
+    """Drop every value cached by this instance."""
+    with _lock:
+        _values.clear()
+
+
+def recordView(websafeConferenceKey):
+    """Count a view of a conference; counts are flushed to memcache at
+    most every VIEWS_FLUSH_SECONDS."""
+    with _lock:
+        _views[websafeConferenceKey] = _views.get(websafeConferenceKey, 0) + 1
+        if time.time() - _lastViewsFlush[0] < VIEWS_FLUSH_SECONDS:
+            return
+    flushViews()
+
+
+def flushViews():
+    """Merge this instance's view counts into the shared counts,
+    keeping the TOP_VIEWED_KEPT most viewed conferences."""
+    with _lock:
+        views = dict(_views)
+        _views.clear()
+        _lastViewsFlush[0] = time.time()
+    if not views:
+        return
+
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        counts = client.gets(MEMCACHE_CONFERENCE_VIEWS_KEY)
+        if counts is None:
+            if client.add(MEMCACHE_CONFERENCE_VIEWS_KEY, views):
+                return
+            continue
+        for wsck, count in views.items():
+            counts[wsck] = counts.get(wsck, 0) + count
+        if len(counts) > TOP_VIEWED_KEPT:
+            counts = dict(sorted(counts.items(), key=lambda item: -item[1])[:TOP_VIEWED_KEPT])
+        if client.cas(MEMCACHE_CONFERENCE_VIEWS_KEY, counts):
+            return
+
+
+def topViewed(limit):
+    """Return websafe keys of the limit most viewed conferences."""
+    counts = memcache.get(MEMCACHE_CONFERENCE_VIEWS_KEY) or {}
+    return [wsck for wsck, count in sorted(counts.items(), key=lambda item: -item[1])[:limit]]
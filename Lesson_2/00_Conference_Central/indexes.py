@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""indexes.py
+
+Udacity conference server-side Python App Engine declared indexes;
+    the composite indexes of index.yaml, which is not uploaded with the
+    app, for the query planner. Generated by querycatalog.py; do not
+    edit by hand
+
+"""
+
+# (kind, ancestor, (properties...))
+INDEXES = [
+    ('Conference', False, ('city', 'maxAttendees', 'name')),
+    ('Conference', False, ('city', 'month', 'name')),
+    ('Conference', False, ('city', 'name')),
+    ('Conference', False, ('city', 'topics', 'name')),
+    ('Conference', False, ('maxAttendees', 'city', 'name')),
+    ('Conference', False, ('maxAttendees', 'month', 'name')),
+    ('Conference', False, ('maxAttendees', 'name')),
+    ('Conference', False, ('maxAttendees', 'topics', 'name')),
+    ('Conference', False, ('month', 'city', 'name')),
+    ('Conference', False, ('month', 'maxAttendees', 'name')),
+    ('Conference', False, ('month', 'name')),
+    ('Conference', False, ('month', 'topics', 'name')),
+    ('Conference', False, ('seatsAvailable', 'name')),
+    ('Conference', False, ('topics', 'city', 'name')),
+    ('Conference', False, ('topics', 'maxAttendees', 'name')),
+    ('Conference', False, ('topics', 'month', 'name')),
+    ('Conference', False, ('topics', 'name')),
+    ('Session', False, ('speaker', 'sessionName')),
+    ('Session', True, ('dateTime', 'duration')),
+    ('Session', True, ('dateTime', 'duration', 'sessionName')),
+    ('Session', True, ('dateTime', 'highlights')),
+    ('Session', True, ('dateTime', 'highlights', 'sessionName')),
+    ('Session', True, ('dateTime', 'sessionName')),
+    ('Session', True, ('dateTime', 'speaker')),
+    ('Session', True, ('dateTime', 'speaker', 'sessionName')),
+    ('Session', True, ('dateTime', 'typeOfSession')),
+    ('Session', True, ('dateTime', 'typeOfSession', 'sessionName')),
+    ('Session', True, ('duration', 'dateTime')),
+    ('Session', True, ('duration', 'dateTime', 'sessionName')),
+    ('Session', True, ('duration', 'highlights')),
+    ('Session', True, ('duration', 'highlights', 'sessionName')),
+    ('Session', True, ('duration', 'sessionName')),
+    ('Session', True, ('duration', 'speaker')),
+    ('Session', True, ('duration', 'speaker', 'sessionName')),
+    ('Session', True, ('duration', 'typeOfSession')),
+    ('Session', True, ('duration', 'typeOfSession', 'sessionName')),
+    ('Session', True, ('highlights', 'dateTime')),
+    ('Session', True, ('highlights', 'dateTime', 'sessionName')),
+    ('Session', True, ('highlights', 'duration')),
+    ('Session', True, ('highlights', 'duration', 'sessionName')),
+    ('Session', True, ('highlights', 'sessionName')),
+    ('Session', True, ('highlights', 'speaker')),
+    ('Session', True, ('highlights', 'speaker', 'sessionName')),
+    ('Session', True, ('highlights', 'typeOfSession')),
+    ('Session', True, ('highlights', 'typeOfSession', 'sessionName')),
+    ('Session', True, ('sessionName',)),
+    ('Session', True, ('sessionName', 'dateTime')),
+    ('Session', True, ('sessionName', 'duration')),
+    ('Session', True, ('sessionName', 'highlights')),
+    ('Session', True, ('sessionName', 'speaker')),
+    ('Session', True, ('sessionName', 'typeOfSession')),
+    ('Session', True, ('speaker', 'dateTime')),
+    ('Session', True, ('speaker', 'dateTime', 'sessionName')),
+    ('Session', True, ('speaker', 'duration')),
+    ('Session', True, ('speaker', 'duration', 'sessionName')),
+    ('Session', True, ('speaker', 'highlights')),
+    ('Session', True, ('speaker', 'highlights', 'sessionName')),
+    ('Session', True, ('speaker', 'sessionName')),
+    ('Session', True, ('speaker', 'typeOfSession')),
+    ('Session', True, ('speaker', 'typeOfSession', 'sessionName')),
+    ('Session', True, ('typeOfSession', 'dateTime')),
+    ('Session', True, ('typeOfSession', 'dateTime', 'sessionName')),
+    ('Session', True, ('typeOfSession', 'duration')),
+    ('Session', True, ('typeOfSession', 'duration', 'sessionName')),
+    ('Session', True, ('typeOfSession', 'highlights')),
+    ('Session', True, ('typeOfSession', 'highlights', 'sessionName')),
+    ('Session', True, ('typeOfSession', 'sessionName')),
+    ('Session', True, ('typeOfSession', 'speaker')),
+    ('Session', True, ('typeOfSession', 'speaker', 'sessionName')),
+    ('WaitlistEntry', True, ('ticket',)),
+]
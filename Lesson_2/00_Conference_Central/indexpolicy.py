@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""indexpolicy.py
+
+Udacity conference server-side Python App Engine indexing policy;
+    only properties some query filters or sorts on are indexed. Checks
+    the models against the query catalog and index.yaml, counts the
+    index rows a put writes, and re-puts existing entities so rows of
+    newly unindexed properties are dropped
+
+usage:
+    indexpolicy.py           print indexed properties and their queries
+    indexpolicy.py --check   exit 1 if a queried property is unindexed,
+                             or an indexed property is never queried
+
+"""
+
+import sys
+from collections import defaultdict
+
+from google.appengine.ext import ndb
+
+import models
+import planner
+import querycatalog
+
+# kinds stored before the policy unindexed some of their properties;
+# /tasks/reindex re-puts their entities so the datastore drops the stale
+# index rows. Kinds added since were written under the policy.
+REINDEX_KINDS = ('Conference', 'Profile')
+REINDEX_BATCH_SIZE = 100
+
+# stored as serialized blobs, never indexed whatever their flags say
+UNINDEXABLE = (ndb.TextProperty, ndb.BlobProperty, ndb.LocalStructuredProperty)
+
+
+def storedModels():
+    """Return {kind: model} of the models stored as entities, leaving
+    out those only kept inside a LocalStructuredProperty."""
+    nested = set()
+    found = {}
+    for name in dir(models):
+        model = getattr(models, name)
+        if not (isinstance(model, type) and issubclass(model, ndb.Model)):
+            continue
+        found[model._get_kind()] = model
+        for prop in model._properties.values():
+            if isinstance(prop, ndb.LocalStructuredProperty):
+                nested.add(prop._modelclass._get_kind())
+    return dict((kind, model) for kind, model in found.items() if kind not in nested)
+
+
+def indexedProperties(model):
+    """Return names of the properties of model the datastore indexes."""
+    return set(prop._name for prop in model._properties.values()
+        if prop._indexed and not isinstance(prop, UNINDEXABLE))
+
+
+def defaultIndexed(model):
+    """Return names of the properties of model ndb would index if none
+    were declared indexed=False."""
+    return set(prop._name for prop in model._properties.values()
+        if not isinstance(prop, UNINDEXABLE))
+
+
+def queriedProperties():
+    """Return {(kind, property): [sources]} of the properties queries
+    filter or sort on, from the query catalog and index.yaml."""
+    queried = defaultdict(list)
+    for shape in querycatalog.queryShapes():
+        for prop in shape.equalities + tuple(shape.postfix):
+            if shape.source not in queried[(shape.kind, prop)]:
+                queried[(shape.kind, prop)].append(shape.source)
+    for kind, ancestor, props in planner.declaredIndexes():
+        for prop in props:
+            queried[(kind, prop)].append('index.yaml')
+    return queried
+
+
+def violations():
+    """Return (unindexed, unqueried): queried properties that are not
+    indexed, and indexed properties no query uses."""
+    stored = storedModels()
+    queried = queriedProperties()
+    unindexed = sorted((kind, prop) for kind, prop in queried
+        if kind not in stored or prop not in indexedProperties(stored[kind]))
+    unqueried = sorted((kind, prop) for kind, model in stored.items()
+        for prop in indexedProperties(model) if (kind, prop) not in queried)
+    return unindexed, unqueried
+
+
+def indexRows(entity, indexed=None):
+    """Return the rows a first put of entity writes: the entity and its
+    kind index row, an ascending and a descending built-in index row per
+    value of an indexed property, and one row per combination of values
+    (and ancestor, for ancestor indexes) of each matching composite.
+
+    indexed defaults to the properties the model indexes now.
+    """
+    model = type(entity)
+    if indexed is None:
+        indexed = indexedProperties(model)
+    counts = {}
+    for prop in model._properties.values():
+        value = prop._get_value(entity)
+        counts[prop._name] = len(value) if prop._repeated else 1
+
+    rows = 2 + sum(2 * counts[name] for name in indexed)
+    for kind, ancestor, props in planner.declaredIndexes():
+        if kind != model._get_kind() or not all(name in indexed for name in props):
+            continue
+        combinations = len(entity.key.pairs()) if ancestor else 1
+        for name in props:
+            combinations *= counts[name]
+        rows += combinations
+    return rows
+
+
+def reindexBatch(kind, cursor=None):
+    """Re-put one batch of kind so its index rows follow the current
+    policy; return the cursor of the next batch, or None when done."""
+    keys, cursor, more = ndb.Query(kind=kind).fetch_page(REINDEX_BATCH_SIZE,
+        start_cursor=cursor, keys_only=True)
+    for key in keys:
+        # transactional, so the re-put can't undo a concurrent write
+        ndb.transaction(lambda: _reput(key))
+    return cursor if more else None
+
+
+def _reput(key):
+    entity = key.get()
+    if entity:
+        if hasattr(entity, 'revision'):
+            # undone by _pre_put_hook: the values don't change, so cached
+            # forms and etags of the entity stay valid
+            entity.revision -= 1
+        entity.put()
+
+
+def main(argv):
+    unindexed, unqueried = violations()
+    if '--check' in argv:
+        for kind, prop in unindexed:
+            print('queried but not indexed: %s.%s' % (kind, prop))
+        for kind, prop in unqueried:
+            print('indexed but never queried: %s.%s' % (kind, prop))
+        return 1 if unindexed or unqueried else 0
+
+    queried = queriedProperties()
+    for kind, model in sorted(storedModels().items()):
+        for prop in sorted(indexedProperties(model)):
+            print('%s.%s: %s' % (kind, prop, ', '.join(queried.get((kind, prop), ['never queried']))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+
+"""logic.py
+
+Udacity conference server-side Python App Engine business logic;
+    announcements, featured speakers, registration and seat bookkeeping
+    shared by the API and the task/cron handlers, without importing
+    Cloud Endpoints so task and cron instances start faster
+
+"""
+
+import random
+from datetime import datetime
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+
+from models import Conference
+from models import ConferenceSummary
+from models import OrganizerSummary
+from models import Profile
+from models import Registration
+from models import SeatHold
+from models import SeatTokenShard
+from models import Session
+from models import SpeakerAnnouncement
+from models import WaitlistEntry
+
+MEMCACHE_ANNOUNCEMENTS_KEY = 'RECENT ANNOUNCEMENTS'
+MEMCACHE_SPEAKER_ANNOUNCEMENTS_PREFIX = 'SPEAKER ANNOUNCEMENTS:'
+SPEAKER_ANNOUNCEMENT_ID = 'featured'
+CONFIRMATION_EMAIL_QUEUE = 'confirmation-emails'
+MEMCACHE_CONFERENCE_VERSION_PREFIX = 'CONFERENCE VERSION:'
+WAITLIST_PROMOTE_BATCH = 5
+REGISTRATION_BACKFILL_BATCH = 100
+SEAT_HOLD_EXPIRE_BATCH = 500
+ORGANIZER_SUMMARY_ID = 'summary'
+# each conference's unsold, unheld seats are split over this many
+# SeatTokenShards, so concurrent holds rarely contend
+SEAT_TOKEN_SHARDS = 8
+
+OPERATORS = {
+            'EQ':   '=',
+            'GT':   '>',
+            'GTEQ': '>=',
+            'LT':   '<',
+            'LTEQ': '<=',
+            'NE':   '!='
+            }
+
+CONF_FIELDS =    {
+            'CITY': 'city',
+            'TOPIC': 'topics',
+            'MONTH': 'month',
+            'MAX_ATTENDEES': 'maxAttendees',
+            }
+
+SESS_FIELDS = {
+            'SESSION_NAME': 'sessionName',
+            'HIGHLIGHTS': 'highlights',
+            'SPEAKER': 'speaker',
+            'DURATION': 'duration',
+            'TYPE_OF_SESSION': 'typeOfSession',
+            'DATE_TIME': 'dateTime',
+            }
+
+# - - - Announcements - - - - - - - - - - - - - - - - - - - -
+
+def cacheAnnouncement():
+    """Create Announcement & assign to memcache; used by
+    memcache cron job & putAnnouncement().
+    """
+    print('cacheAnnouncements called')
+    confs = Conference.query(ndb.AND(
+        Conference.seatsAvailable <= 5,
+        Conference.seatsAvailable > 0)
+    ).fetch(projection=[Conference.name])
+
+    if confs:
+        # If there are almost sold out conferences,
+        # format announcement and set it in memcache
+        announcement = '%s %s' % (
+            'Last chance to attend! The following conferences '
+            'are nearly sold out:',
+            ', '.join(conf.name for conf in confs))
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+    else:
+        # If there are no sold out conferences,
+        # delete the memcache announcements entry
+        announcement = ""
+        memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+    return announcement
+
+
+def cacheSpeakerAnnouncement(speaker, sessionNames, conference):
+    """Store the featured speaker announcement for one conference,
+    both in the datastore and in memcache under a per-conference key.
+    """
+    formattedSessionNames = ', '.join(session for session in sessionNames)
+
+    announcement = "%s is speaker for the following sessions: %s at %s conference" % (speaker, formattedSessionNames, conference.name)
+
+    # persist, so a memcache eviction doesn't lose the announcement
+    SpeakerAnnouncement(
+        key=ndb.Key(SpeakerAnnouncement, SPEAKER_ANNOUNCEMENT_ID, parent=conference.key),
+        announcement=announcement
+    ).put()
+    memcache.set(MEMCACHE_SPEAKER_ANNOUNCEMENTS_PREFIX + conference.key.urlsafe(), announcement)
+
+    return announcement
+
+
+def getSpeakerAnnouncements(websafeConferenceKeys):
+    """Return dict of websafeConferenceKey -> speaker announcement,
+    reading memcache first and falling back to the datastore.
+    """
+    announcements = memcache.get_multi(websafeConferenceKeys,
+        key_prefix=MEMCACHE_SPEAKER_ANNOUNCEMENTS_PREFIX)
+
+    missing = [wsck for wsck in websafeConferenceKeys if wsck not in announcements]
+    if missing:
+        stored = ndb.get_multi([ndb.Key(SpeakerAnnouncement, SPEAKER_ANNOUNCEMENT_ID,
+            parent=ndb.Key(urlsafe=wsck)) for wsck in missing])
+        found = dict((wsck, entry.announcement)
+            for wsck, entry in zip(missing, stored) if entry)
+        # repopulate memcache with whatever was evicted
+        if found:
+            memcache.set_multi(found, key_prefix=MEMCACHE_SPEAKER_ANNOUNCEMENTS_PREFIX)
+            announcements.update(found)
+
+    return announcements
+
+# - - - Featured speaker - - - - - - - - - - - - - - - - - - - -
+
+def setFeaturedSpeaker(speaker, conf_key):
+    """Feature speaker at a conference once they have more than one
+    session there, and announce their sessions.
+    """
+    # check how many sessions by this speaker at given conference
+    sessions = Session.query(ancestor=conf_key)
+    sessions = sessions.filter(Session.speaker == speaker)
+    q_count = sessions.count()
+    # if more than one session,
+    if q_count > 1:
+        # get all sessionNames
+        sessionNames = []
+        for session in sessions:
+            sessionNames.append(session.sessionName)
+        conference = conf_key.get()
+
+        # add speaker to featuredSpeakers property of conference
+        if speaker not in conference.featuredSpeakers:
+            conference.featuredSpeakers.append(speaker)
+            conference.put()
+            bumpConferenceVersion(conf_key.urlsafe())
+        # pass in speaker name, session names, and conference
+        cacheSpeakerAnnouncement(speaker, sessionNames, conference)
+
+# - - - Registration - - - - - - - - - - - - - - - - - - - -
+
+def conferenceKey(websafeConferenceKey):
+    """Return the Conference key websafeConferenceKey encodes, or None
+    if it is empty, malformed or the key of another kind."""
+    try:
+        key = ndb.Key(urlsafe=websafeConferenceKey)
+    except (TypeError, ValueError, ProtocolBufferDecodeError):
+        return None
+    return key if key.kind() == Conference._get_kind() else None
+
+
+def registration(prof, conf):
+    """Return the roster Registration of prof for conf."""
+    return Registration(key=ndb.Key(Registration, prof.key.id(), parent=conf.key),
+        displayName=prof.displayName, mainEmail=prof.mainEmail)
+
+
+def backfillRegistrations(cursor=None):
+    """Add the missing Registration of each conference in one batch of
+    Profiles' conferenceKeysToAttend, for profiles registered before the
+    roster existed; return the cursor of the next batch, or None when done.
+    """
+    keys, cursor, more = Profile.query().fetch_page(REGISTRATION_BACKFILL_BATCH,
+        start_cursor=cursor, keys_only=True)
+    for prof_key in keys:
+        for wsck in prof_key.get().conferenceKeysToAttend:
+            conf_key = conferenceKey(wsck)
+            if conf_key:
+                _backfillRegistration(prof_key, conf_key)
+    return cursor if more else None
+
+
+@ndb.transactional(xg=True)
+def _backfillRegistration(prof_key, conf_key):
+    # re-read both, so a concurrent unregister can't be undone
+    reg_key = ndb.Key(Registration, prof_key.id(), parent=conf_key)
+    prof, conf, reg = ndb.get_multi([prof_key, conf_key, reg_key])
+    if prof and conf and not reg and conf_key.urlsafe() in prof.conferenceKeysToAttend:
+        registration(prof, conf).put()
+
+
+def promoteFromWaitlist(conf, seats):
+    """Register the oldest waitlisted users into up to seats freed seats
+    of conf, which seatsAvailable already counts; return how many were
+    registered. Must run inside the caller's xg transaction; the caller
+    puts conf and gives the seats left over back to the token pool.
+    """
+    if seats <= 0 or conf.waitlistHead >= conf.waitlistTail:
+        return 0
+
+    wsck = conf.key.urlsafe()
+    entries = WaitlistEntry.query(ancestor=conf.key).order(
+        WaitlistEntry.ticket).fetch(min(seats, WAITLIST_PROMOTE_BATCH))
+    profiles = ndb.get_multi([ndb.Key(Profile, entry.userId) for entry in entries])
+
+    promoted = []
+    for entry, prof in zip(entries, profiles):
+        if prof and wsck not in prof.conferenceKeysToAttend:
+            prof.conferenceKeysToAttend.append(wsck)
+            conf.seatsAvailable -= 1
+            promoted.append(prof)
+        conf.waitlistHead = entry.ticket + 1
+
+    ndb.put_multi(promoted + [registration(prof, conf) for prof in promoted])
+    ndb.delete_multi([entry.key for entry in entries])
+    return len(promoted)
+
+
+def expireSeatHolds():
+    """Delete expired seat holds and give their seats back to their
+    conferences; used by the seat hold cleanup cron job.
+    """
+    # eventually consistent; each hold is checked again in its transaction
+    keys = SeatHold.query(SeatHold.expires <= datetime.now()).fetch(
+        SEAT_HOLD_EXPIRE_BATCH, keys_only=True)
+    return len([key for key in keys if releaseSeatHold(key)])
+
+
+@ndb.transactional(xg=True)
+def releaseSeatHold(hold_key):
+    """Delete a hold if it is still expired and give its seat to the
+    head of the waitlist, or its token back to the pool; return True if
+    this call released it.
+    """
+    hold = hold_key.get()
+    if not hold or hold.expires > datetime.now():
+        # confirmed, renewed or released meanwhile
+        return False
+    hold_key.delete()
+
+    wsck = hold.websafeConferenceKey
+    conf_key = conferenceKey(wsck)
+    conf = conf_key.get() if conf_key else None
+    # only a waitlist makes the cron write the conference
+    if conf and conf.waitlistHead < conf.waitlistTail:
+        promoted = promoteFromWaitlist(conf, 1)
+        conf.put()
+        updateOrganizerSummary([conf])
+        if promoted:
+            ndb.get_context().call_on_commit(lambda: bumpConferenceVersion(wsck))
+            return True
+    returnSeatToken(wsck)
+    return True
+
+# - - - Seat tokens - - - - - - - - - - - - - - - - - - - -
+
+def _seatShardKeys(websafeConferenceKey):
+    return [ndb.Key(SeatTokenShard, '%s:%d' % (websafeConferenceKey, shard))
+        for shard in range(SEAT_TOKEN_SHARDS)]
+
+
+def allocateSeatTokens(conf_key):
+    """Split the unsold seats of a conference over its SeatTokenShards,
+    unless they exist. Call outside transactions, when a conference is
+    created or before its first hold or registration.
+
+    The shards are root entities, so holds claim seats without writing
+    the conference's entity group. The tokens left in the shards plus the
+    outstanding SeatHolds always add up to Conference.seatsAvailable.
+    """
+    keys = _seatShardKeys(conf_key.urlsafe())
+
+    @ndb.transactional(xg=True)
+    def allocate():
+        conf = conf_key.get()
+        if not conf or any(ndb.get_multi(keys)):
+            return
+        seats = max(conf.seatsAvailable or 0, 0)
+        ndb.put_multi([SeatTokenShard(key=key, available=seats // SEAT_TOKEN_SHARDS
+            + (1 if shard < seats % SEAT_TOKEN_SHARDS else 0))
+            for shard, key in enumerate(keys)])
+    allocate()
+
+
+def freeSeats(conf):
+    """Return the seats of conf neither sold nor held."""
+    shards = ndb.get_multi(_seatShardKeys(conf.key.urlsafe()))
+    if not any(shards):
+        # not allocated yet, so nothing is held
+        return conf.seatsAvailable or 0
+    return sum(shard.available for shard in shards if shard)
+
+
+def claimSeatToken(websafeConferenceKey, hold=None):
+    """Take one seat token of a conference from a shard that has one,
+    putting hold in the same transaction; return False when no token is
+    left. A hold that already exists takes no second token.
+    """
+    candidates = _seatShardKeys(websafeConferenceKey)
+    if not ndb.in_transaction():
+        candidates = [shard.key for shard in ndb.get_multi(candidates)
+            if shard and shard.available > 0]
+    # else read shards one at a time, so the caller's transaction only
+    # spans the shards it had to look at
+    random.shuffle(candidates)
+    for key in candidates:
+        claimed = _claimFrom(key, hold)
+        if claimed is not None:
+            return claimed
+    return False
+
+
+@ndb.transactional(xg=True)
+def _claimFrom(key, hold):
+    # None: this shard ran out meanwhile, try another
+    if hold and hold.key.get():
+        return True
+    shard = key.get()
+    if not shard or shard.available <= 0:
+        return None
+    shard.available -= 1
+    ndb.put_multi([shard] + ([hold] if hold else []))
+    return True
+
+
+@ndb.transactional(xg=True)
+def returnSeatToken(websafeConferenceKey):
+    """Give one seat of a conference back to a random shard."""
+    shard = random.choice(_seatShardKeys(websafeConferenceKey)).get()
+    # without shards the pool is allocated from seatsAvailable later
+    if shard:
+        shard.available += 1
+        shard.put()
+
+
+def adjustSeatTokens(websafeConferenceKey, delta):
+    """Add delta seats, which may be negative, to the token pool of a
+    conference; return False if fewer than -delta seats are unheld. Call
+    in the transaction changing Conference.seatsAvailable by delta.
+    """
+    shards = ndb.get_multi(_seatShardKeys(websafeConferenceKey))
+    if not any(shards):
+        return True
+    shards = [shard for shard in shards if shard]
+    if delta > 0:
+        shards[0].available += delta
+        changed = shards[:1]
+    else:
+        changed = []
+        for shard in shards:
+            taken = min(shard.available, -delta)
+            if taken:
+                shard.available -= taken
+                delta += taken
+                changed.append(shard)
+        if delta:
+            return False
+    ndb.put_multi(changed)
+    return True
+
+# - - - Organizer dashboard - - - - - - - - - - - - - - - - - - - -
+
+def updateOrganizerSummary(confs, sessions=0):
+    """Refresh the ConferenceSummary of each of confs, all of one
+    organizer, and apply the change to the organizer's totals. Call
+    inside a transaction; the summaries share the entity group of the
+    organizer's conferences. Only the entities of confs and the small
+    totals entity are written, however many conferences there are.
+    """
+    summary_key = ndb.Key(OrganizerSummary, ORGANIZER_SUMMARY_ID, parent=confs[0].key.parent())
+    entry_keys = [ndb.Key(ConferenceSummary, ORGANIZER_SUMMARY_ID, parent=conf.key)
+        for conf in confs]
+    entities = ndb.get_multi([summary_key] + entry_keys)
+    summary = entities[0] or OrganizerSummary(key=summary_key)
+
+    changed = []
+    for conf, key, entry in zip(confs, entry_keys, entities[1:]):
+        if not entry:
+            entry = ConferenceSummary(key=key, websafeConferenceKey=conf.key.urlsafe())
+            summary.conferenceCount += 1
+        summary.totalSeats -= entry.maxAttendees
+        summary.seatsSold -= entry.seatsSold
+        entry.name = conf.name
+        entry.maxAttendees = conf.maxAttendees or 0
+        entry.seatsSold = max(entry.maxAttendees - (conf.seatsAvailable or 0), 0)
+        entry.sessions += sessions
+        summary.totalSeats += entry.maxAttendees
+        summary.seatsSold += entry.seatsSold
+        changed.append(entry)
+    ndb.put_multi([summary] + changed)
+
+# - - - Live updates - - - - - - - - - - - - - - - - - - - -
+
+def bumpConferenceVersion(websafeConferenceKey):
+    """Increment the memcache change counter of a conference."""
+    return memcache.incr(MEMCACHE_CONFERENCE_VERSION_PREFIX + websafeConferenceKey,
+        initial_value=0)
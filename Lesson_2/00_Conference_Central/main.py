@@ -1,21 +1,155 @@
 #!/usr/bin/env python
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from string import Template
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
-from conference import ConferenceApi
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.api import users
+from google.appengine.api import datastore_errors
+from logic import CONFIRMATION_EMAIL_QUEUE
 
 from google.appengine.ext import ndb
+from models import Conference
+from models import EmailOutcome
+from models import Registration
 from models import Session
+from utils import getUserId
+import autocomplete
+import facets
+import logic
+import metrics
+import profiler
+import search
+import slowqueries
+import wishlist
+
+EMAIL_BATCH_SIZE = 100
+EMAIL_MAX_BATCHES = 10
+EMAIL_LEASE_SECONDS = 60
+EMAIL_RETRY_SECONDS = 30
+EMAIL_MAX_ATTEMPTS = 5
+
+# under the 100KB task size limit, leaving room for the other params
+COUNT_CHANGES_PAYLOAD_BYTES = 90000
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_MAX_ROWS = 10000
+EXPORT_MAX_CONCURRENT = 2
+EXPORT_RETRY_SECONDS = 30
+# exports are counted in the minute they start; a frontend request ends
+# within 60s, so only this and the previous minute can still be running,
+# and a count left behind by a killed request expires with its minute
+EXPORT_SLOT_SECONDS = 60
+MEMCACHE_EXPORTS_RUNNING_PREFIX = 'EXPORTS RUNNING:'
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+def _loadTemplate(name):
+    with open(os.path.join(TEMPLATE_DIR, name)) as f:
+        return Template(f.read())
+
+CONFIRMATION_EMAIL = _loadTemplate('confirmation_email.txt')
+CONFIRMATION_EMAIL_ITEM = _loadTemplate('confirmation_email_item.txt')
+IMPORT_SUMMARY_EMAIL = _loadTemplate('import_summary_email.txt')
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
         """Set Announcement in Memcache."""
         # TODO 1
-        ConferenceApi._cacheAnnouncement()
+        logic.cacheAnnouncement()
+
+class SendConfirmationEmailsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Lease queued confirmation emails in batches and send one
+        email per organizer for all conferences in the batch."""
+        queue = taskqueue.Queue(CONFIRMATION_EMAIL_QUEUE)
+        sender = 'noreply@%s.appspotmail.com' % (
+            app_identity.get_application_id())
+
+        for _ in range(EMAIL_MAX_BATCHES):
+            tasks = queue.lease_tasks(EMAIL_LEASE_SECONDS, EMAIL_BATCH_SIZE)
+            if not tasks:
+                break
+
+            # group leased tasks by recipient
+            batches = {}
+            malformed = []
+            for task in tasks:
+                try:
+                    payload = json.loads(task.payload)
+                    batches.setdefault(payload['email'], []).append(
+                        (task, payload['conference']))
+                except (ValueError, TypeError, KeyError):
+                    # would be leased and fail again forever; drop it
+                    logging.error('Dropping malformed confirmation email task %s: %r',
+                        task.name, task.payload)
+                    malformed.append(task)
+            if malformed:
+                queue.delete_tasks(malformed)
+
+            outcomes = []
+            for email, batch in batches.items():
+                conferences = [conference for task, conference in batch]
+                batchTasks = [task for task, conference in batch]
+                attempts = max(task.retry_count for task in batchTasks)
+                try:
+                    mail.send_mail(
+                        sender,                                     # from
+                        email,                                      # to
+                        'You created %d new Conference(s)!' % len(conferences), # subj
+                        self._renderEmail(conferences)              # body
+                    )
+                except Exception:
+                    logging.exception('Sending confirmation email to %s failed', email)
+                    status = self._retryOrDrop(queue, batchTasks)
+                else:
+                    queue.delete_tasks(batchTasks)
+                    status = 'SENT'
+                outcomes.append(EmailOutcome(
+                    recipient=email,
+                    conferenceNames=[conference['name'] for conference in conferences],
+                    status=status,
+                    attempts=attempts))
+            ndb.put_multi(outcomes)
+
+    def _renderEmail(self, conferences):
+        """Render the confirmation email body for a list of conferences."""
+        items = [CONFIRMATION_EMAIL_ITEM.substitute(
+            name=conference['name'],
+            city=conference['city'] or '',
+            topics=', '.join(conference['topics'] or []),
+            startDate=conference['startDate'] or 'TBD',
+            endDate=conference['endDate'] or 'TBD',
+            maxAttendees=conference['maxAttendees'] or 0,
+        ) for conference in conferences]
+        return CONFIRMATION_EMAIL.substitute(conferences='\r\n'.join(items))
+
+    def _retryOrDrop(self, queue, tasks):
+        """Back off exponentially on failed tasks; drop them after too many attempts."""
+        if max(task.retry_count for task in tasks) >= EMAIL_MAX_ATTEMPTS:
+            queue.delete_tasks(tasks)
+            return 'FAILED'
+        for task in tasks:
+            queue.modify_task_lease(task,
+                EMAIL_RETRY_SECONDS * 2 ** task.retry_count)
+        return 'RETRYING'
 
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Conference creation."""
+        """Send email confirming Conference creation.
+
+        Only drains /tasks/send_confirmation_email push tasks queued
+        before the pull queue replaced them; remove next release.
+        """
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),     # from
@@ -26,33 +160,422 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
                 'conferenceInfo')
         )
 
+class SendImportSummaryEmailHandler(webapp2.RequestHandler):
+    def post(self):
+        """Send one email summarizing a bulk Conference import."""
+        mail.send_mail(
+            'noreply@%s.appspotmail.com' % (
+                app_identity.get_application_id()),     # from
+            self.request.get('email'),                  # to
+            'Your Conference import finished',          # subj
+            IMPORT_SUMMARY_EMAIL.substitute(            # body
+                imported=self.request.get('imported'),
+                failed=self.request.get('failed'))
+        )
+
+class ExpireSeatHoldsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return expired seat holds to the pool."""
+        logic.expireSeatHolds()
+
+class IndexDocumentHandler(webapp2.RequestHandler):
+    def post(self):
+        """Update the search index for one Conference or Session."""
+        try:
+            search.indexDocument(self.request.get('websafeKey'))
+        except search.IndexInProgressError:
+            # retried later, in case the running index read the old text
+            logging.info('indexing of %s already running', self.request.get('websafeKey'))
+            self.response.set_status(503)
+
+class UpdateAutocompleteHandler(webapp2.RequestHandler):
+    def post(self):
+        """Apply city/topic/speaker count changes to the autocomplete index."""
+        autocomplete.updateCounts(json.loads(self.request.get('changes')),
+            self.request.get('changeId') or None)
+
+class UpdateFacetsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Apply conference count changes to the facet counters."""
+        facets.updateCounts(json.loads(self.request.get('changes')),
+            self.request.get('changeId') or None)
+
+def _splitChanges(changes):
+    """Yield parts of nested {key: {value: delta}} count changes whose
+    JSON stays under COUNT_CHANGES_PAYLOAD_BYTES, always the same parts
+    for the same changes."""
+    part, size = {}, 0
+    for key, deltas in sorted(changes.items()):
+        for value, delta in sorted(deltas.items()):
+            itemSize = len(json.dumps([key, value, delta]))
+            if part and size + itemSize > COUNT_CHANGES_PAYLOAD_BYTES:
+                yield part
+                part, size = {}, 0
+            part.setdefault(key, {})[value] = delta
+            size += itemSize
+    if part:
+        yield part
+
+class QueueCountChangesHandler(webapp2.RequestHandler):
+    def post(self):
+        """Queue the stored count changes of an import chunk as facet
+        and autocomplete tasks small enough to add, then drop them."""
+        key = ndb.Key(urlsafe=self.request.get('websafeKey'))
+        pending = key.get()
+        if not pending:
+            return
+        prefix = hashlib.md5(key.urlsafe()).hexdigest()
+        for name, url, changes in (
+                ('facets', '/tasks/update_facets', pending.facets),
+                ('autocomplete', '/tasks/update_autocomplete', pending.autocomplete)):
+            for i, part in enumerate(_splitChanges(changes or {})):
+                # named, and the counters skip the change id, so a retry
+                # of this task queues and applies each part once
+                changeId = '%s-%s-%d' % (prefix, name, i)
+                try:
+                    taskqueue.add(params={'changes': json.dumps(part), 'changeId': changeId},
+                        name=changeId, url=url)
+                except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+                    pass
+        key.delete()
+
+class FlushWishlistHandler(webapp2.RequestHandler):
+    def post(self):
+        """Write a user's buffered wishlist changes into their Profile."""
+        try:
+            wishlist.flush(self.request.get('userId'))
+        except wishlist.FlushInProgressError:
+            # retried later, in case the running flush misses our mutations
+            logging.info('wishlist flush of %s already running', self.request.get('userId'))
+            self.response.set_status(503)
+
+class ChainedBatchHandler(webapp2.RequestHandler):
+    """Base handler running a migration as one task chain per kind.
+
+    A POST without a kind starts a chain for every kind; a POST with a
+    kind processes one batch from its cursor and adds the task of the
+    next batch, named after (run, kind, cursor) so a retried batch
+    can't fork a second chain.
+    """
+    url = None
+    kinds = ()
+
+    def batch(self, kind, cursor):
+        """Process one batch; return the next cursor, or None when done."""
+        raise NotImplementedError
+
+    def post(self):
+        kind = self.request.get('kind')
+        if not kind:
+            run = uuid.uuid4().hex
+            for kind in self.kinds:
+                self._chain(run, kind, '')
+            self.response.write('started %s for %s' % (self.url, ', '.join(self.kinds)))
+            return
+
+        if kind not in self.kinds:
+            self.abort(400)
+        token = self.request.get('cursor')
+        try:
+            cursor = ndb.Cursor(urlsafe=token) if token else None
+        except datastore_errors.BadValueError:
+            self.abort(400)
+        cursor = self.batch(kind, cursor)
+        if cursor:
+            self._chain(self.request.get('run'), kind, cursor.urlsafe())
+        else:
+            logging.info('%s finished %s', self.url, kind)
+
+    def _chain(self, run, kind, token):
+        name = '%s-%s-%s-%s' % (self.url.strip('/').replace('/', '-').replace('_', '-'),
+            run, kind, hashlib.md5(token).hexdigest())
+        try:
+            taskqueue.add(url=self.url, name=name,
+                params={'run': run, 'kind': kind, 'cursor': token})
+        except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+            pass
+
+class BackfillRegistrationsHandler(ChainedBatchHandler):
+    """Add the Registration rows of profiles registered before the
+    attendee roster was kept."""
+    url = '/tasks/backfill_registrations'
+    kinds = ('Profile',)
+
+    def batch(self, kind, cursor):
+        return logic.backfillRegistrations(cursor)
+
+class ReindexHandler(ChainedBatchHandler):
+    """Re-put every entity of the kinds the indexing policy changed, so
+    the datastore drops the index rows of newly unindexed properties."""
+    url = '/tasks/reindex'
+
+    # indexpolicy pulls in the query catalog and yaml; only the reindex
+    # tasks need it, not every instance serving main.app
+    @property
+    def kinds(self):
+        import indexpolicy
+        return indexpolicy.REINDEX_KINDS
+
+    def batch(self, kind, cursor):
+        import indexpolicy
+        return indexpolicy.reindexBatch(kind, cursor)
+
 class SetSpeakerAnnouncementHandler(webapp2.RequestHandler):
     # i think it should be post
     def post(self):
-        speaker = self.request.get('speaker')
-        conf_key = ndb.Key(urlsafe=self.request.get('websafeConferenceKey'))
-        # check how many sessions by this speaker at given conference
-        sessions = Session.query(ancestor=conf_key)
-        sessions = sessions.filter(Session.speaker == speaker)
-        q_count = sessions.count()
-        # if more than one session,
-        if q_count > 1:
-            # get all sessionNames
-            sessionNames = []
-            for session in sessions:
-                sessionNames.append(session.sessionName)
-            # get the name of the conference
-            conference = conf_key.get()
-            conferenceName = conference.name
-
-            # add speaker to featuredSpeakers property of conference
-            conference.featuredSpeakers.append(speaker)
-            conference.put()
-            # pass in speaker name, session names, and conference name
-            ConferenceApi._cacheSpeakerAnnouncement(speaker, sessionNames, conferenceName)
+        logic.setFeaturedSpeaker(self.request.get('speaker'),
+            ndb.Key(urlsafe=self.request.get('websafeConferenceKey')))
+
+class ExportHandler(webapp2.RequestHandler):
+    """Base handler writing query results as CSV or NDJSON.
+
+    Rows are fetched EXPORT_BATCH_SIZE at a time without the ndb caches,
+    so memory stays bounded; after EXPORT_MAX_ROWS rows the response
+    carries an X-Next-Cursor header to resume from. At most
+    EXPORT_MAX_CONCURRENT exports run at once, so they can't starve
+    interactive traffic.
+    """
+    columns = ()
+
+    def query(self):
+        """Return the ndb query to export."""
+        raise NotImplementedError
+
+    def row(self, entity):
+        """Return dict of column -> value for one entity."""
+        raise NotImplementedError
+
+    def get(self):
+        fmt = self.request.get('format', 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            self.abort(400)
+        token = self.request.get('cursor') or None
+        try:
+            cursor = ndb.Cursor(urlsafe=token) if token else None
+        except datastore_errors.BadValueError:
+            self.abort(400)
+        query = self.query()
+
+        slot = int(time.time()) // EXPORT_SLOT_SECONDS
+        key = MEMCACHE_EXPORTS_RUNNING_PREFIX + str(slot)
+        memcache.add(key, 0, time=2 * EXPORT_SLOT_SECONDS)
+        running = memcache.incr(key)
+        try:
+            # None: memcache is unavailable, so the count is unknown
+            if running is None or running + (memcache.get(
+                    MEMCACHE_EXPORTS_RUNNING_PREFIX + str(slot - 1)) or 0) > EXPORT_MAX_CONCURRENT:
+                self.response.headers['Retry-After'] = str(EXPORT_RETRY_SECONDS)
+                self.abort(503)
+            self._export(query, cursor, fmt)
+        finally:
+            if running is not None:
+                memcache.decr(key)
+
+    def _export(self, query, cursor, fmt):
+        if fmt == 'csv':
+            self.response.headers['Content-Type'] = 'text/csv'
+            writer = csv.writer(self.response.out)
+            writer.writerow(self.columns)
+        else:
+            self.response.headers['Content-Type'] = 'application/x-ndjson'
+
+        rows = 0
+        more = True
+        while more and rows < EXPORT_MAX_ROWS:
+            entities, cursor, more = query.fetch_page(EXPORT_BATCH_SIZE,
+                start_cursor=cursor, use_cache=False, use_memcache=False)
+            for entity in entities:
+                row = self.row(entity)
+                if fmt == 'csv':
+                    writer.writerow([self._csvValue(row[column]) for column in self.columns])
+                else:
+                    self.response.out.write(json.dumps(row) + '\n')
+            rows += len(entities)
+
+        if more and cursor:
+            self.response.headers['X-Next-Cursor'] = cursor.urlsafe()
+
+    @staticmethod
+    def _csvValue(value):
+        if isinstance(value, list):
+            value = '|'.join(value)
+        if value is None:
+            return ''
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return value
+
+class ExportConferencesHandler(ExportHandler):
+    columns = ('websafeKey', 'name', 'description', 'organizerUserId', 'topics',
+        'city', 'startDate', 'endDate', 'month', 'maxAttendees', 'seatsAvailable')
+
+    def query(self):
+        return Conference.query().order(Conference.key)
+
+    def row(self, conf):
+        return {
+            'websafeKey': conf.key.urlsafe(),
+            'name': conf.name,
+            'description': conf.description,
+            'organizerUserId': conf.organizerUserId,
+            'topics': conf.topics,
+            'city': conf.city,
+            'startDate': conf.startDate and str(conf.startDate),
+            'endDate': conf.endDate and str(conf.endDate),
+            'month': conf.month,
+            'maxAttendees': conf.maxAttendees,
+            'seatsAvailable': conf.seatsAvailable,
+        }
+
+class ExportSessionsHandler(ExportHandler):
+    columns = ('websafeKey', 'websafeConferenceKey', 'sessionName', 'highlights',
+        'speaker', 'duration', 'typeOfSession', 'dateTime')
+
+    def query(self):
+        wsck = self.request.get('websafeConferenceKey')
+        if wsck:
+            return Session.query(ancestor=ndb.Key(urlsafe=wsck))
+        return Session.query().order(Session.key)
+
+    def row(self, session):
+        return {
+            'websafeKey': session.key.urlsafe(),
+            'websafeConferenceKey': session.key.parent().urlsafe(),
+            'sessionName': session.sessionName,
+            'highlights': session.highlights,
+            'speaker': session.speaker,
+            'duration': session.duration,
+            'typeOfSession': session.typeOfSession,
+            'dateTime': session.dateTime and str(session.dateTime),
+        }
+
+class ExportAttendeesHandler(ExportHandler):
+    columns = ('userId', 'displayName', 'mainEmail')
+
+    def query(self):
+        """Roster of one conference; only its organizer may export it."""
+        wsck = self.request.get('websafeConferenceKey')
+        if not wsck:
+            self.abort(400)
+        conf_key = logic.conferenceKey(wsck)
+        conf = conf_key.get() if conf_key else None
+        if not conf:
+            self.abort(404)
+        if getUserId(users.get_current_user()) != conf.organizerUserId:
+            self.abort(403)
+        # ancestor query in key order; served by the built-in indexes
+        return Registration.query(ancestor=conf.key)
+
+    def row(self, registration):
+        return {
+            'userId': registration.key.id(),
+            'displayName': registration.displayName,
+            'mainEmail': registration.mainEmail,
+        }
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Load the API and prime this instance's caches before it
+        takes user traffic."""
+        import conference
+        warmed = conference.ConferenceApi._warmup()
+        logging.info('warmup primed %d conference forms', warmed)
+
+class MetricsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Show aggregated endpoint metrics, slowest total time first;
+        ?format=json returns the raw counters."""
+        # the API module registers its endpoints with metrics; imported
+        # here so task and cron handlers don't load Cloud Endpoints
+        import conference
+        totals = metrics.getMetrics()
+        if self.request.get('format') == 'json':
+            self.response.headers['Content-Type'] = 'application/json'
+            self.response.write(json.dumps(totals, indent=2, sort_keys=True))
+            return
+
+        self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        self.response.write('%-28s %8s %6s %9s %8s %8s %8s %8s %8s %8s\n' % ('endpoint',
+            'calls', 'errors', 'avg ms', 'gets', 'puts', 'queries', 'mc hit%', 'tasks', 'items'))
+        for endpoint, counters in sorted(totals.items(), key=lambda item: -item[1]['totalMs']):
+            calls = float(counters['calls'])
+            lookups = counters['memcacheHits'] + counters['memcacheMisses']
+            self.response.write('%-28s %8d %6d %9.1f %8.2f %8.2f %8.2f %8s %8.2f %8.2f\n' % (
+                endpoint, counters['calls'], counters['errors'], counters['totalMs'] / calls,
+                counters['datastoreGets'] / calls, counters['datastorePuts'] / calls,
+                counters['datastoreQueries'] / calls,
+                '%.0f' % (100.0 * counters['memcacheHits'] / lookups) if lookups else '-',
+                counters['taskqueueAdds'] / calls, counters['items'] / calls))
+
+class SlowQueriesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Show slow queries grouped by shape, most total time first,
+        then the most recent ones; ?format=json returns the raw entries."""
+        entries = slowqueries.recent()
+        if self.request.get('format') == 'json':
+            self.response.headers['Content-Type'] = 'application/json'
+            self.response.write(json.dumps(entries, indent=2, sort_keys=True))
+            return
+
+        self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        self.response.write('Top offenders (queries over %dms)\n\n' % slowqueries.SLOW_QUERY_MS)
+        self.response.write('%-24s %8s %10s %8s %9s %9s  %s\n' % ('endpoint',
+            'count', 'total ms', 'max ms', 'results', 'scanned', 'query'))
+        for group in slowqueries.topOffenders(entries):
+            self.response.write('%-24s %8d %10d %8d %9.1f %9.1f  %s %s [%s]\n' % (
+                group['endpoint'], group['count'], group['totalMs'], group['maxMs'],
+                group['results'] / float(group['count']), group['scanned'] / float(group['count']),
+                group['kind'], group['shape'], group['strategy']))
+
+        self.response.write('\nRecent\n\n')
+        for entry in entries:
+            self.response.write('%6dms %-24s %s %s [%s%s] results=%d scanned=%d\n' % (
+                entry['ms'], entry['endpoint'], entry['kind'], entry['shape'], entry['strategy'],
+                ''.join(' (%s)' % ', '.join(index) for index in entry['indexes']),
+                entry['results'], entry['scanned']))
+
+class ProfilesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Show the functions with the most own time per endpoint over
+        all profiled calls; ?format=json returns the raw aggregates."""
+        import conference
+        profiles = profiler.getProfiles(metrics.ENDPOINTS)
+        if self.request.get('format') == 'json':
+            self.response.headers['Content-Type'] = 'application/json'
+            self.response.write(json.dumps(profiles, indent=2, sort_keys=True))
+            return
+
+        limit = int(self.request.get('limit') or 20)
+        self.response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+        for endpoint, aggregate in sorted(profiles.items()):
+            samples = float(aggregate['samples'])
+            self.response.write('%s (%d profiled calls)\n' % (endpoint, aggregate['samples']))
+            self.response.write('%10s %12s %12s  %s\n' % ('calls', 'own ms', 'cum ms', 'function'))
+            functions = sorted(aggregate['functions'].items(), key=lambda item: -item[1][1])
+            for label, (calls, tottime, cumtime) in functions[:limit]:
+                self.response.write('%10.1f %12.2f %12.2f  %s\n' % (calls / samples,
+                    tottime * 1000 / samples, cumtime * 1000 / samples, label))
+            self.response.write('\n')
 
 app = webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/send_confirmation_emails', SendConfirmationEmailsHandler),
+    ('/crons/expire_seat_holds', ExpireSeatHoldsHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
-    ('/tasks/set_speaker_announcement', SetSpeakerAnnouncementHandler)
+    ('/tasks/set_speaker_announcement', SetSpeakerAnnouncementHandler),
+    ('/tasks/send_import_summary_email', SendImportSummaryEmailHandler),
+    ('/tasks/index_document', IndexDocumentHandler),
+    ('/tasks/update_autocomplete', UpdateAutocompleteHandler),
+    ('/tasks/update_facets', UpdateFacetsHandler),
+    ('/tasks/queue_count_changes', QueueCountChangesHandler),
+    ('/tasks/flush_wishlist', FlushWishlistHandler),
+    ('/tasks/reindex', ReindexHandler),
+    ('/tasks/backfill_registrations', BackfillRegistrationsHandler),
+    ('/export/attendees', ExportAttendeesHandler),
+    ('/export/conferences', ExportConferencesHandler),
+    ('/export/sessions', ExportSessionsHandler),
+    ('/admin/metrics', MetricsHandler),
+    ('/admin/slow_queries', SlowQueriesHandler),
+    ('/admin/profiles', ProfilesHandler),
+    ('/_ah/warmup', WarmupHandler)
 ], debug=True)
\ No newline at end of file
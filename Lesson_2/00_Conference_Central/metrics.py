@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""metrics.py
+
+Udacity conference server-side Python App Engine endpoint metrics;
+    per-request RPC and latency counters for ConferenceApi methods,
+    aggregated per instance and flushed to memcache
+
+"""
+
+import json
+import logging
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+import profiler
+
+MEMCACHE_METRICS_PREFIX = 'METRICS:'
+FLUSH_SECONDS = 60
+
+COUNTERS = ('calls', 'errors', 'totalMs', 'datastoreGets', 'datastorePuts',
+    'datastoreQueries', 'memcacheHits', 'memcacheMisses', 'taskqueueAdds', 'items')
+
+# endpoint names, registered by instrumented() as ConferenceApi is defined
+ENDPOINTS = []
+
+_local = threading.local()
+_lock = threading.Lock()
+_pending = {}
+_lastFlush = [time.time()]
+
+
+def _counters():
+    return getattr(_local, 'counters', None)
+
+
+def _countRpc(service, call, request, response):
+    """apiproxy post-call hook: count RPCs of the instrumented request."""
+    counters = _counters()
+    if counters is None:
+        return
+    if service == 'datastore_v3':
+        if call == 'Get':
+            counters['datastoreGets'] += request.key_size()
+        elif call == 'Put':
+            counters['datastorePuts'] += request.entity_size()
+        elif call == 'RunQuery':
+            counters['datastoreQueries'] += 1
+    elif service == 'memcache' and call == 'Get':
+        hits = response.item_size()
+        counters['memcacheHits'] += hits
+        counters['memcacheMisses'] += request.key_size() - hits
+    elif service == 'taskqueue':
+        if call == 'Add':
+            counters['taskqueueAdds'] += 1
+        elif call == 'BulkAdd':
+            counters['taskqueueAdds'] += request.add_request_size()
+
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('metrics', _countRpc)
+
+
+def _itemCount(response):
+    items = getattr(response, 'items', None)
+    return len(items) if items is not None else 1
+
+
+def instrumented(func):
+    """Record wall time and RPC counts of a ConferenceApi method, and
+    profile the calls chosen by profiler.shouldProfile.
+
+    Apply below @endpoints.method, so the request is already parsed.
+    """
+    ENDPOINTS.append(func.__name__)
+
+    def wrapper(self, request):
+        counters = dict.fromkeys(COUNTERS, 0)
+        counters['calls'] = 1
+        _local.counters = counters
+        start = time.time()
+        try:
+            if profiler.shouldProfile(self):
+                response = profiler.profile(func.__name__, func, self, request)
+            else:
+                response = func(self, request)
+            counters['items'] = _itemCount(response)
+            return response
+        except Exception:
+            counters['errors'] = 1
+            raise
+        finally:
+            counters['totalMs'] = int((time.time() - start) * 1000)
+            _local.counters = None
+            logging.info('endpoint_metrics %s', json.dumps(
+                dict(counters, endpoint=func.__name__), sort_keys=True))
+            record(func.__name__, counters)
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def record(endpoint, counters):
+    """Add counters to the instance aggregate of endpoint; flush to
+    memcache at most every FLUSH_SECONDS."""
+    with _lock:
+        pending = _pending.setdefault(endpoint, dict.fromkeys(COUNTERS, 0))
+        for name, value in counters.items():
+            pending[name] += value
+        if time.time() - _lastFlush[0] < FLUSH_SECONDS:
+            return
+        _lastFlush[0] = time.time()
+        offsets = {}
+        for name, totals in _pending.items():
+            for counter, value in totals.items():
+                if value:
+                    offsets['%s%s:%s' % (MEMCACHE_METRICS_PREFIX, name, counter)] = value
+        _pending.clear()
+    # offset_multi is atomic per key, so every instance adds to the same totals
+    if offsets:
+        memcache.offset_multi(offsets, initial_value=0)
+
+
+def getMetrics():
+    """Return {endpoint: {counter: total}} flushed by all instances."""
+    keys = ['%s%s:%s' % (MEMCACHE_METRICS_PREFIX, endpoint, counter)
+        for endpoint in ENDPOINTS for counter in COUNTERS]
+    values = memcache.get_multi(keys)
+    metrics = {}
+    for endpoint in ENDPOINTS:
+        totals = dict((counter, values.get('%s%s:%s' % (MEMCACHE_METRICS_PREFIX, endpoint, counter), 0))
+            for counter in COUNTERS)
+        if totals['calls']:
+            metrics[endpoint] = totals
+    return metrics
@@ -12,8 +12,6 @@ created/forked from conferences.py by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
-import httplib
-import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
@@ -24,25 +22,33 @@ class BooleanMessage(messages.Message):
     """BooleanMessage-- outbound Boolean value message"""
     data = messages.BooleanField(1)
 
-class ConflictException(endpoints.ServiceException):
-    """ConflictException -- exception mapped to HTTP 409 response"""
-    http_status = httplib.CONFLICT
-
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
     data = messages.StringField(1, required=True)
 
+class AnnouncementForm(messages.Message):
+    """AnnouncementForm -- outbound announcement message, with etag"""
+    data      = messages.StringField(1)
+    etag      = messages.StringField(2)
+    unchanged = messages.BooleanField(3)
+
 
 # - - - Profile classes - - - - - - - - - - - - - - - - -
 
 # replace your existing Profile class with this
 class Profile(ndb.Model):
     """Profile -- User profile object"""
-    displayName            = ndb.StringProperty()
-    mainEmail              = ndb.StringProperty()
-    teeShirtSize           = ndb.StringProperty(default='NOT_SPECIFIED')
-    conferenceKeysToAttend = ndb.StringProperty(repeated=True)
-    wishlist               = ndb.StringProperty(repeated=True)
+    displayName            = ndb.StringProperty(indexed=False)
+    mainEmail              = ndb.StringProperty(indexed=False)
+    teeShirtSize           = ndb.StringProperty(default='NOT_SPECIFIED', indexed=False)
+    conferenceKeysToAttend = ndb.StringProperty(repeated=True, indexed=False)
+    wishlist               = ndb.StringProperty(repeated=True, indexed=False)
+
+class WishlistFlushLease(ndb.Model):
+    """WishlistFlushLease -- held by the one running flush of a user's
+    wishlist; child of Profile, id 'lease'"""
+    token                  = ndb.StringProperty(indexed=False)
+    expires                = ndb.DateTimeProperty(indexed=False)
 
 
 class ProfileMiniForm(messages.Message):
@@ -83,16 +89,23 @@ class TeeShirtSize(messages.Enum):
 class Conference(ndb.Model):
     """Conference -- Conference object"""
     name             = ndb.StringProperty(required=True)
-    description      = ndb.StringProperty()
-    organizerUserId  = ndb.StringProperty()
+    description      = ndb.StringProperty(indexed=False)
+    organizerUserId  = ndb.StringProperty(indexed=False)
     topics           = ndb.StringProperty(repeated=True)
     city             = ndb.StringProperty()
-    startDate        = ndb.DateProperty()
+    startDate        = ndb.DateProperty(indexed=False)
     month            = ndb.IntegerProperty()
-    endDate          = ndb.DateProperty()
+    endDate          = ndb.DateProperty(indexed=False)
     maxAttendees     = ndb.IntegerProperty()
     seatsAvailable   = ndb.IntegerProperty()
-    featuredSpeakers = ndb.StringProperty(repeated=True)
+    featuredSpeakers = ndb.StringProperty(repeated=True, indexed=False)
+    waitlistHead     = ndb.IntegerProperty(default=0, indexed=False)
+    waitlistTail     = ndb.IntegerProperty(default=0, indexed=False)
+    revision         = ndb.IntegerProperty(default=0, indexed=False)
+    updated          = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+    def _pre_put_hook(self):
+        self.revision += 1
 
 class ConferenceForm(messages.Message):
     """ConferenceForm -- Conference outbound form message"""
@@ -108,11 +121,44 @@ class ConferenceForm(messages.Message):
     endDate              = messages.StringField(10)
     websafeKey           = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    revision             = messages.IntegerField(13)
+    etag                 = messages.StringField(14)
+    unchanged            = messages.BooleanField(15)
+    # change counter to start watchConferences from
+    watchVersion         = messages.IntegerField(16)
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
 
+class ConferenceVersionForm(messages.Message):
+    """ConferenceVersionForm -- last-seen version of a watched Conference"""
+    websafeConferenceKey = messages.StringField(1)
+    version              = messages.IntegerField(2)
+
+class ConferenceWatchForm(messages.Message):
+    """ConferenceWatchForm -- inbound list of watched Conferences"""
+    items = messages.MessageField(ConferenceVersionForm, 1, repeated=True)
+
+class ConferenceChangeForm(messages.Message):
+    """ConferenceChangeForm -- outbound live fields of a changed Conference"""
+    websafeConferenceKey = messages.StringField(1)
+    version              = messages.IntegerField(2)
+    seatsAvailable       = messages.IntegerField(3, variant=messages.Variant.INT32)
+    featuredSpeakers     = messages.StringField(4, repeated=True)
+
+class ConferenceChangeForms(messages.Message):
+    """ConferenceChangeForms -- multiple ConferenceChangeForm outbound form message"""
+    items      = messages.MessageField(ConferenceChangeForm, 1, repeated=True)
+    retryAfter = messages.IntegerField(2, variant=messages.Variant.INT32)
+
+class ConferenceImportResultForm(messages.Message):
+    """ConferenceImportResultForm -- outbound bulk import result message"""
+    imported             = messages.IntegerField(1, variant=messages.Variant.INT32)
+    errors               = messages.StringField(2, repeated=True)
+    seconds              = messages.FloatField(3)
+    conferencesPerSecond = messages.FloatField(4)
+
 class ConferenceQueryForm(messages.Message):
     """ConferenceQueryForm -- Conference query inbound form message"""
     field = messages.StringField(1)
@@ -124,6 +170,122 @@ class ConferenceQueryForms(messages.Message):
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
 
 
+class PendingCountChanges(ndb.Model):
+    """PendingCountChanges -- facet and autocomplete count changes of an
+    import chunk, stored with its conferences until queued; child of
+    Profile"""
+    facets           = ndb.JsonProperty(compressed=True)
+    autocomplete     = ndb.JsonProperty(compressed=True)
+
+class FacetCounts(ndb.Model):
+    """FacetCounts -- shard of the conference counts per value of one
+    facet, under a selection of the other facets; id is json [facet,
+    selected, selected], followed by '#shard' for shards other than 0"""
+    counts           = ndb.JsonProperty()
+    # ids of the latest change tasks applied, so retried tasks are skipped
+    applied          = ndb.StringProperty(repeated=True, indexed=False)
+
+class ConferenceFacetForm(messages.Message):
+    """ConferenceFacetForm -- number of conferences with one facet value"""
+    field                = messages.StringField(1)
+    value                = messages.StringField(2)
+    count                = messages.IntegerField(3, variant=messages.Variant.INT32)
+
+class ConferenceFacetForms(messages.Message):
+    """ConferenceFacetForms -- multiple ConferenceFacetForm outbound form message"""
+    items = messages.MessageField(ConferenceFacetForm, 1, repeated=True)
+
+
+# - - - Organizer dashboard - - - - - - - - - - - - - - - - - - - - - -
+
+class ConferenceSummary(ndb.Model):
+    """ConferenceSummary -- per-conference dashboard totals; child of
+    Conference, id is 'summary'"""
+    websafeConferenceKey = ndb.StringProperty(indexed=False)
+    name                 = ndb.StringProperty(indexed=False)
+    maxAttendees         = ndb.IntegerProperty(default=0, indexed=False)
+    seatsSold            = ndb.IntegerProperty(default=0, indexed=False)
+    sessions             = ndb.IntegerProperty(default=0, indexed=False)
+
+class OrganizerSummary(ndb.Model):
+    """OrganizerSummary -- organizer dashboard totals; child of Profile,
+    in the same entity group as the organizer's Conferences and their
+    ConferenceSummary entities"""
+    conferenceCount = ndb.IntegerProperty(default=0, indexed=False)
+    totalSeats      = ndb.IntegerProperty(default=0, indexed=False)
+    seatsSold       = ndb.IntegerProperty(default=0, indexed=False)
+
+class ConferenceSummaryForm(messages.Message):
+    """ConferenceSummaryForm -- outbound per-conference dashboard totals"""
+    websafeConferenceKey = messages.StringField(1)
+    name                 = messages.StringField(2)
+    maxAttendees         = messages.IntegerField(3, variant=messages.Variant.INT32)
+    seatsSold            = messages.IntegerField(4, variant=messages.Variant.INT32)
+    sessions             = messages.IntegerField(5, variant=messages.Variant.INT32)
+
+class OrganizerDashboardForm(messages.Message):
+    """OrganizerDashboardForm -- outbound organizer dashboard message"""
+    conferenceCount = messages.IntegerField(1, variant=messages.Variant.INT32)
+    totalSeats      = messages.IntegerField(2, variant=messages.Variant.INT32)
+    seatsSold       = messages.IntegerField(3, variant=messages.Variant.INT32)
+    conferences     = messages.MessageField(ConferenceSummaryForm, 4, repeated=True)
+
+
+# - - - Attendee roster - - - - - - - - - - - - - - - - - - - - - - - -
+
+class Registration(ndb.Model):
+    """Registration -- reverse index of a registered user; child of
+    Conference, id is userId"""
+    displayName     = ndb.StringProperty(indexed=False)
+    mainEmail       = ndb.StringProperty(indexed=False)
+    created         = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+class AttendeeForm(messages.Message):
+    """AttendeeForm -- outbound conference attendee message"""
+    userId          = messages.StringField(1)
+    displayName     = messages.StringField(2)
+    mainEmail       = messages.StringField(3)
+
+class AttendeeForms(messages.Message):
+    """AttendeeForms -- one page of AttendeeForm outbound form message"""
+    items           = messages.MessageField(AttendeeForm, 1, repeated=True)
+    nextPageToken   = messages.StringField(2)
+
+
+# - - - Conference waitlist - - - - - - - - - - - - - - - - - - - - - -
+
+class WaitlistEntry(ndb.Model):
+    """WaitlistEntry -- one user waiting for a seat; child of Conference, id is userId"""
+    userId          = ndb.StringProperty(indexed=False)
+    ticket          = ndb.IntegerProperty()
+    created         = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+class WaitlistPositionForm(messages.Message):
+    """WaitlistPositionForm -- outbound waitlist position message"""
+    websafeConferenceKey = messages.StringField(1)
+    position             = messages.IntegerField(2, variant=messages.Variant.INT32)
+
+
+# - - - Seat holds - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class SeatHold(ndb.Model):
+    """SeatHold -- short-lived seat claim holding one seat token; root
+    entity keyed 'websafeConferenceKey:userId'"""
+    websafeConferenceKey = ndb.StringProperty(indexed=False)
+    userId               = ndb.StringProperty(indexed=False)
+    expires              = ndb.DateTimeProperty()
+
+class SeatTokenShard(ndb.Model):
+    """SeatTokenShard -- share of a conference's seats neither sold nor
+    held; root entity keyed 'websafeConferenceKey:shard'"""
+    available            = ndb.IntegerProperty(default=0, indexed=False)
+
+class SeatHoldForm(messages.Message):
+    """SeatHoldForm -- outbound seat hold message"""
+    websafeConferenceKey = messages.StringField(1)
+    expires              = messages.StringField(2)
+
+
 # - - - Conference sessions - - - - - - - - - - - - - - - - - - - - - -
 
 class Session(ndb.Model):
@@ -136,6 +298,11 @@ class Session(ndb.Model):
     #date            = ndb.DateProperty()
     #startTime       = ndb.TimeProperty()
     dateTime        = ndb.DateTimeProperty()
+    revision        = ndb.IntegerProperty(default=0, indexed=False)
+    updated         = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+    def _pre_put_hook(self):
+        self.revision += 1
 
 class SessionForm(messages.Message):
     """SessionForm -- Session outbound form message"""
@@ -151,7 +318,9 @@ class SessionForm(messages.Message):
 
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
-    items = messages.MessageField(SessionForm, 1, repeated=True)
+    items     = messages.MessageField(SessionForm, 1, repeated=True)
+    etag      = messages.StringField(2)
+    unchanged = messages.BooleanField(3)
 
 class SessionQueryForm(messages.Message):
     """SessionQueryForm -- Session query inbound form message"""
@@ -161,4 +330,103 @@ class SessionQueryForm(messages.Message):
 
 class SessionQueryForms(messages.Message):
     """SessionQueryForms -- multiple SessionQueryForm inbound form message"""
-    filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
\ No newline at end of file
+    filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+
+
+# - - - Outbound notifications - - - - - - - - - - - - - - - - - - - -
+
+class EmailOutcome(ndb.Model):
+    """EmailOutcome -- record of one batched confirmation email attempt"""
+    recipient       = ndb.StringProperty(indexed=False)
+    conferenceNames = ndb.StringProperty(repeated=True, indexed=False)
+    status          = ndb.StringProperty(indexed=False)
+    attempts        = ndb.IntegerProperty(indexed=False)
+    created         = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+
+# - - - Speaker announcements - - - - - - - - - - - - - - - - - - - - -
+
+class SpeakerAnnouncement(ndb.Model):
+    """SpeakerAnnouncement -- featured speaker announcement, one per Conference"""
+    announcement    = ndb.TextProperty()
+
+class SpeakerAnnouncementForm(messages.Message):
+    """SpeakerAnnouncementForm -- SpeakerAnnouncement outbound form message"""
+    websafeConferenceKey = messages.StringField(1)
+    announcement         = messages.StringField(2)
+
+class SpeakerAnnouncementForms(messages.Message):
+    """SpeakerAnnouncementForms -- multiple SpeakerAnnouncement outbound form message"""
+    items = messages.MessageField(SpeakerAnnouncementForm, 1, repeated=True)
+
+
+# - - - Full-text search - - - - - - - - - - - - - - - - - - - - - - -
+
+class SearchEntry(ndb.Model):
+    """SearchEntry -- one posting of a search term, without properties;
+    id is 'kind:term:rank:websafeKey', rank sorting by descending frequency"""
+
+class SearchTermCount(ndb.Model):
+    """SearchTermCount -- shard of the number of documents of a kind
+    with a term; id is 'kind:term:shard'"""
+    documents       = ndb.IntegerProperty(default=0, indexed=False)
+
+class SearchDocument(ndb.Model):
+    """SearchDocument -- terms indexed for one entity; id is its websafe key"""
+    terms           = ndb.StringProperty(repeated=True, indexed=False)
+    counts          = ndb.IntegerProperty(repeated=True, indexed=False)
+
+class SearchIndexLease(ndb.Model):
+    """SearchIndexLease -- held by the one run indexing a document; child
+    of SearchDocument, id 'lease'; terms and counts are the postings the
+    run writes"""
+    token           = ndb.StringProperty(indexed=False)
+    expires         = ndb.DateTimeProperty(indexed=False)
+    terms           = ndb.StringProperty(repeated=True, indexed=False)
+    counts          = ndb.IntegerProperty(repeated=True, indexed=False)
+
+class SearchStats(ndb.Model):
+    """SearchStats -- shard of the number of indexed documents of a
+    kind; id is 'kind:shard'"""
+    documents       = ndb.IntegerProperty(default=0, indexed=False)
+
+class SearchForm(messages.Message):
+    """SearchForm -- full-text search inbound form message"""
+    query           = messages.StringField(1)
+    pageSize        = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken       = messages.StringField(3)
+
+class ConferenceSearchForms(messages.Message):
+    """ConferenceSearchForms -- one page of Conference search results"""
+    items           = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken   = messages.StringField(2)
+
+class SessionSearchForms(messages.Message):
+    """SessionSearchForms -- one page of Session search results"""
+    items           = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken   = messages.StringField(2)
+
+
+# - - - Autocomplete - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class AutocompleteTerm(ndb.Model):
+    """AutocompleteTerm -- distinct city/topic/speaker; id is 'field:lowercased value'"""
+    value           = ndb.StringProperty(indexed=False)
+    count           = ndb.IntegerProperty(default=0, indexed=False)
+    # ids of the latest change tasks applied, so retried tasks are skipped
+    applied         = ndb.StringProperty(repeated=True, indexed=False)
+
+class AutocompleteForm(messages.Message):
+    """AutocompleteForm -- autocomplete inbound form message"""
+    field           = messages.StringField(1)
+    prefix          = messages.StringField(2)
+    limit           = messages.IntegerField(3, variant=messages.Variant.INT32)
+
+class AutocompleteItemForm(messages.Message):
+    """AutocompleteItemForm -- one suggested value with its usage count"""
+    value           = messages.StringField(1)
+    count           = messages.IntegerField(2, variant=messages.Variant.INT32)
+
+class AutocompleteForms(messages.Message):
+    """AutocompleteForms -- multiple AutocompleteItemForm outbound form message"""
+    items           = messages.MessageField(AutocompleteItemForm, 1, repeated=True)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+"""planner.py
+
+Udacity conference server-side Python App Engine query planner;
+    checks a filter set against the composite indexes declared in
+    index.yaml (as generated into indexes.py) and falls back to
+    merge-join plus an in-memory sort when no composite index can
+    serve the query
+
+"""
+
+import logging
+import operator
+import os
+from collections import namedtuple
+
+import yaml
+
+from google.appengine.ext import ndb
+
+INDEX_YAML = os.path.join(os.path.dirname(__file__), 'index.yaml')
+INDEXES_PY = os.path.join(os.path.dirname(__file__), 'indexes.py')
+
+# most entities a fallback plan will sort in memory
+FALLBACK_LIMIT = 1000
+
+BUILTIN = 'builtin'
+COMPOSITE = 'composite'
+MERGE_JOIN_SORT = 'merge-join+sort'
+
+QueryPlan = namedtuple('QueryPlan', ['kind', 'strategy', 'ancestor', 'equalities', 'postfix', 'indexes'])
+
+COMPARATORS = {
+    '>':  operator.gt,
+    '>=': operator.ge,
+    '<':  operator.lt,
+    '<=': operator.le,
+    '!=': operator.ne,
+}
+
+_indexes = None
+
+
+class QueryTooBroadError(Exception):
+    """A fallback plan matched more than FALLBACK_LIMIT entities."""
+
+
+def yamlIndexes():
+    """Return [(kind, ancestor, (properties...))] declared in index.yaml.
+
+    index.yaml is not uploaded with the app; use declaredIndexes() at runtime.
+    """
+    with open(INDEX_YAML) as f:
+        config = yaml.safe_load(f) or {}
+    return [(index['kind'], bool(index.get('ancestor')),
+        tuple(prop['name'] for prop in index.get('properties') or []
+            if prop.get('direction', 'asc') == 'asc'))
+        for index in config.get('indexes') or []]
+
+
+def declaredIndexes():
+    """Return [(kind, ancestor, (properties...))] declared in index.yaml,
+    from the indexes module querycatalog.py generates alongside it."""
+    global _indexes
+    if _indexes is None:
+        try:
+            import indexes
+            _indexes = [(kind, ancestor, tuple(props))
+                for kind, ancestor, props in indexes.INDEXES]
+        except ImportError:
+            # no composites known: every composite query plans as a fallback
+            logging.warning('indexes.py is missing; run querycatalog.py')
+            _indexes = []
+    return _indexes
+
+
+def needsComposite(ancestor, equalities, postfix):
+    """Return True if the datastore needs a composite index for the query.
+
+    Equality-only queries are served by merge-joining the built-in
+    single-property indexes; a sort/inequality on a single property
+    without other filters uses its built-in index.
+    """
+    if not postfix:
+        return False
+    return bool(ancestor or equalities or len(set(postfix)) > 1)
+
+
+def findIndexes(kind, ancestor, equalities, postfix):
+    """Return declared indexes serving the query, or None.
+
+    Either one index has all equality properties followed by postfix,
+    or the datastore merge-joins one (equality property, postfix...)
+    index per equality filter.
+    """
+    size = len(equalities)
+    candidates = [props for indexKind, indexAncestor, props in declaredIndexes()
+        if indexKind == kind and indexAncestor == ancestor]
+
+    for props in candidates:
+        if sorted(props[:size]) == sorted(equalities) and list(props[size:]) == list(postfix):
+            return [props]
+
+    if size > 1:
+        merged = [(field,) + tuple(postfix) for field in equalities]
+        if all(props in candidates for props in merged):
+            return merged
+    return None
+
+
+def plan(kind, ancestor, filters, order):
+    """Choose a QueryPlan for filters (dicts of field, operator, value)
+    sorted by the inequality field, if any, then by order.
+    """
+    equalities = sorted(set(f['field'] for f in filters if f['operator'] == '='))
+    postfix = []
+    for f in filters:
+        if f['operator'] != '=' and f['field'] not in postfix:
+            postfix.append(f['field'])
+    # the datastore drops sort orders on properties with an equality filter
+    if order not in postfix and order not in equalities:
+        postfix.append(order)
+
+    if not needsComposite(ancestor, equalities, postfix):
+        return QueryPlan(kind, BUILTIN, ancestor, equalities, postfix, None)
+    indexes = findIndexes(kind, ancestor, equalities, postfix)
+    if indexes:
+        return QueryPlan(kind, COMPOSITE, ancestor, equalities, postfix, indexes)
+    return QueryPlan(kind, MERGE_JOIN_SORT, ancestor, equalities, postfix, None)
+
+
+def _matches(entity, f):
+    values = getattr(entity, f['field'])
+    if not isinstance(values, list):
+        values = [values]
+    compare = COMPARATORS[f['operator']]
+    return any(compare(value, f['value']) for value in values if value is not None)
+
+
+def _sortValue(entity, field):
+    value = getattr(entity, field)
+    if isinstance(value, list):
+        # the datastore sorts repeated properties by their smallest value
+        value = min(value) if value else None
+    return value
+
+
+def execute(model, filters, order, ancestor=None):
+    """Run a query for filters sorted by the inequality field, then order.
+
+    Returns (queryPlan, entities, scanned). entities is a datastore query
+    when an index can serve it, else a list sorted in memory from an
+    equality-only query; scanned counts the entities that query read,
+    or is None for a datastore query, which reads only its results.
+    """
+    queryPlan = plan(model._get_kind(), ancestor is not None, filters, order)
+    logging.debug('query plan: %s', queryPlan)
+
+    q = model.query(ancestor=ancestor)
+    if queryPlan.strategy != MERGE_JOIN_SORT:
+        for field in queryPlan.postfix:
+            q = q.order(ndb.GenericProperty(field))
+        for f in filters:
+            q = q.filter(ndb.query.FilterNode(f['field'], f['operator'], f['value']))
+        return queryPlan, q, None
+
+    for f in filters:
+        if f['operator'] == '=':
+            q = q.filter(ndb.query.FilterNode(f['field'], f['operator'], f['value']))
+    entities = q.fetch(FALLBACK_LIMIT + 1)
+    scanned = len(entities)
+    if scanned > FALLBACK_LIMIT:
+        raise QueryTooBroadError(
+            'Query matches more than %d entities and has no index.' % FALLBACK_LIMIT)
+
+    inequalities = [f for f in filters if f['operator'] != '=']
+    entities = [entity for entity in entities
+        if all(_matches(entity, f) for f in inequalities)
+        and all(_sortValue(entity, field) is not None for field in queryPlan.postfix)]
+    entities.sort(key=lambda entity: [_sortValue(entity, field) for field in queryPlan.postfix])
+    return queryPlan, entities, scanned
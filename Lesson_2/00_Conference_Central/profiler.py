@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""profiler.py
+
+Udacity conference server-side Python App Engine sampling profiler;
+    runs cProfile around sampled ConferenceApi calls and aggregates the
+    top functions per endpoint in memcache
+
+"""
+
+import cProfile
+import hmac
+import logging
+import os
+import pstats
+import random
+
+from google.appengine.api import memcache
+from google.appengine.api import users
+
+from settings import PROFILE_SECRET
+
+# fraction of calls profiled; a request sending PROFILE_HEADER is always
+# profiled if it comes from an admin or the header's value is PROFILE_SECRET
+PROFILE_SAMPLE_RATE = 0.01
+PROFILE_HEADER = 'X-Conference-Profile'
+
+# functions kept per profiled call and per endpoint aggregate
+TOP_FUNCTIONS = 30
+AGGREGATE_FUNCTIONS = 100
+
+MEMCACHE_PROFILE_PREFIX = 'PROFILE:'
+CAS_RETRIES = 5
+
+
+def shouldProfile(service):
+    """Return True if this call of the service should be profiled."""
+    try:
+        requested = service.request_state.headers.get(PROFILE_HEADER)
+    except AttributeError:
+        requested = None
+    # anyone else could make any call cost a full profile
+    if requested and (users.is_current_user_admin() or _isProfileSecret(requested)):
+        return True
+    return random.random() < PROFILE_SAMPLE_RATE
+
+
+def _isProfileSecret(value):
+    if not PROFILE_SECRET:
+        return False
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return hmac.compare_digest(value, PROFILE_SECRET)
+
+
+def _label(filename, line, function):
+    """Function label with the last two path components of its file."""
+    if filename == '~':
+        # built-in functions, e.g. <method 'strptime' ...>
+        return function
+    return '%s:%d(%s)' % (os.path.join(*filename.split(os.sep)[-2:]), line, function)
+
+
+def profile(endpoint, func, *args):
+    """Call func(*args) under cProfile and add its top functions to the
+    aggregate of endpoint."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        try:
+            _aggregate(endpoint, topFunctions(profiler))
+        except Exception:
+            # never fail the request over its profile
+            logging.exception('could not aggregate profile of %s', endpoint)
+
+
+def topFunctions(profiler):
+    """Return {label: [calls, own seconds, cumulative seconds]} of the
+    TOP_FUNCTIONS functions with the most own time."""
+    stats = pstats.Stats(profiler).stats
+    ranked = sorted(stats.items(), key=lambda item: -item[1][2])[:TOP_FUNCTIONS]
+    return dict((_label(*function), [calls, tottime, cumtime])
+        for function, (primitive, calls, tottime, cumtime, callers) in ranked)
+
+
+def _aggregate(endpoint, functions):
+    """Merge functions into the endpoint aggregate with compare-and-set."""
+    client = memcache.Client()
+    key = MEMCACHE_PROFILE_PREFIX + endpoint
+    for _ in range(CAS_RETRIES):
+        aggregate = client.gets(key)
+        if aggregate is None:
+            if client.add(key, {'samples': 1, 'functions': functions}):
+                return
+            continue
+        aggregate['samples'] += 1
+        merged = aggregate['functions']
+        for label, (calls, tottime, cumtime) in functions.items():
+            total = merged.setdefault(label, [0, 0.0, 0.0])
+            total[0] += calls
+            total[1] += tottime
+            total[2] += cumtime
+        if len(merged) > AGGREGATE_FUNCTIONS:
+            kept = sorted(merged.items(), key=lambda item: -item[1][1])[:AGGREGATE_FUNCTIONS]
+            aggregate['functions'] = dict(kept)
+        if client.cas(key, aggregate):
+            return
+    logging.warning('dropped profile of %s after %d contended updates', endpoint, CAS_RETRIES)
+
+
+def getProfiles(endpoints):
+    """Return {endpoint: {'samples': n, 'functions': {label: totals}}}."""
+    profiles = memcache.get_multi(endpoints, key_prefix=MEMCACHE_PROFILE_PREFIX)
+    return dict((endpoint, aggregate) for endpoint, aggregate in profiles.items() if aggregate)
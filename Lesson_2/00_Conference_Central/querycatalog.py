@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""querycatalog.py
+
+Udacity conference server-side Python App Engine query catalog;
+    enumerates every query shape the API can run and generates the
+    minimal set of composite indexes covering them
+
+usage:
+    querycatalog.py           rewrite index.yaml and indexes.py
+    querycatalog.py --check   exit 1 if a reachable query lacks an index,
+                              or indexes.py is out of date
+
+"""
+
+import sys
+from collections import namedtuple
+from itertools import combinations
+
+import planner
+from logic import CONF_FIELDS
+from logic import OPERATORS
+from logic import SESS_FIELDS
+
+QueryShape = namedtuple('QueryShape', ['source', 'kind', 'ancestor', 'equalities', 'postfix'])
+
+HEADER = '''indexes:
+
+# Generated by querycatalog.py from the query shapes the API can run;
+# do not edit by hand. Run "python querycatalog.py" after changing a
+# query, and "python querycatalog.py --check" to verify coverage.
+'''
+
+MODULE_HEADER = '''#!/usr/bin/env python
+
+"""indexes.py
+
+Udacity conference server-side Python App Engine declared indexes;
+    the composite indexes of index.yaml, which is not uploaded with the
+    app, for the query planner. Generated by querycatalog.py; do not
+    edit by hand
+
+"""
+
+# (kind, ancestor, (properties...))
+INDEXES = [
+'''
+
+
+def _filterShapes(source, kind, ancestor, fields, order):
+    """Shapes of user filters: any set of equality fields, plus at
+    most one inequality field that is sorted first.
+    """
+    fields = sorted(set(fields.values()))
+    inequalities = [None]
+    if any(operator != '=' for operator in OPERATORS.values()):
+        inequalities += fields
+    for inequality in inequalities:
+        rest = [field for field in fields if field != inequality]
+        for size in range(len(rest) + 1):
+            for equalities in combinations(rest, size):
+                postfix = (inequality,) if inequality else ()
+                # the datastore drops sort orders on properties with an equality filter
+                if order not in postfix and order not in equalities:
+                    postfix += (order,)
+                yield QueryShape(source, kind, ancestor, equalities, postfix)
+
+
+def queryShapes():
+    """Yield every QueryShape reachable from the API and handlers."""
+    for shape in _filterShapes('_getQuery', 'Conference', False, CONF_FIELDS, 'name'):
+        yield shape
+    for shape in _filterShapes('_getConferenceSessionQuery', 'Session', True,
+            SESS_FIELDS, 'sessionName'):
+        yield shape
+    yield QueryShape('getConferenceSessions', 'Session', True, (), ('sessionName',))
+    yield QueryShape('getConferenceSessionsByType', 'Session', True,
+        ('typeOfSession',), ('sessionName',))
+    yield QueryShape('getSessionsBySpeaker', 'Session', False,
+        ('speaker',), ('sessionName',))
+    # inequality on seatsAvailable with a projection on name
+    yield QueryShape('_cacheAnnouncement', 'Conference', False, (),
+        ('seatsAvailable', 'name'))
+    yield QueryShape('_promoteFromWaitlist', 'WaitlistEntry', True, (), ('ticket',))
+    yield QueryShape('_expireSeatHolds', 'SeatHold', False, (), ('expires',))
+    yield QueryShape('getOrganizerDashboard', 'ConferenceSummary', True, (), ())
+
+
+def requiredIndexes(shapes):
+    """Return sorted (kind, ancestor, properties) composites covering shapes,
+    using one (equality, postfix...) index per equality field so the
+    datastore can merge-join them.
+    """
+    indexes = set()
+    for shape in shapes:
+        if not planner.needsComposite(shape.ancestor, shape.equalities, shape.postfix):
+            continue
+        if shape.equalities:
+            for field in shape.equalities:
+                indexes.add((shape.kind, shape.ancestor, (field,) + tuple(shape.postfix)))
+        else:
+            indexes.add((shape.kind, shape.ancestor, tuple(shape.postfix)))
+    return sorted(indexes)
+
+
+def renderIndexYaml(indexes):
+    """Return index.yaml contents declaring indexes."""
+    lines = [HEADER]
+    for kind, ancestor, props in indexes:
+        lines.append('- kind: %s' % kind)
+        if ancestor:
+            lines.append('  ancestor: yes')
+        lines.append('  properties:')
+        for prop in props:
+            lines.append('  - name: %s' % prop)
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def renderIndexesModule(indexes):
+    """Return indexes.py contents declaring indexes."""
+    lines = [MODULE_HEADER.rstrip('\n')]
+    for kind, ancestor, props in indexes:
+        lines.append('    (%r, %r, %r),' % (kind, ancestor, tuple(props)))
+    lines.append(']')
+    return '\n'.join(lines) + '\n'
+
+
+def uncoveredShapes(shapes):
+    """Return shapes the indexes declared in index.yaml can't serve."""
+    return [shape for shape in shapes
+        if planner.needsComposite(shape.ancestor, shape.equalities, shape.postfix)
+        and not planner.findIndexes(shape.kind, shape.ancestor,
+            shape.equalities, shape.postfix)]
+
+
+def main(argv):
+    shapes = list(queryShapes())
+    if '--check' in argv:
+        missing = uncoveredShapes(shapes)
+        for shape in missing:
+            print('no index for %s' % (shape,))
+        unused = set(planner.declaredIndexes()) - set(requiredIndexes(shapes))
+        for index in sorted(unused):
+            print('unused index %s' % (index,))
+        stale = planner.declaredIndexes() != planner.yamlIndexes()
+        if stale:
+            print('indexes.py does not match index.yaml')
+        return 1 if missing or stale else 0
+
+    indexes = requiredIndexes(shapes)
+    with open(planner.INDEX_YAML, 'w') as f:
+        f.write(renderIndexYaml(indexes))
+    with open(planner.INDEXES_PY, 'w') as f:
+        f.write(renderIndexesModule(indexes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
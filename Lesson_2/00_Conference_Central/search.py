@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+"""search.py
+
+Udacity conference server-side Python App Engine full-text search;
+    inverted index over Conference and Session text fields, stored as
+    one key-only datastore entity per (term, document) posting
+
+"""
+
+import math
+import re
+import uuid
+import zlib
+from datetime import datetime
+from datetime import timedelta
+
+from google.appengine.ext import ndb
+
+from models import SearchDocument
+from models import SearchEntry
+from models import SearchIndexLease
+from models import SearchStats
+from models import SearchTermCount
+
+# searchable text fields per kind, with their ranking weight
+SEARCH_FIELDS = {
+    'Conference': {'name': 3, 'topics': 2, 'description': 1},
+    'Session': {'sessionName': 3, 'speaker': 2, 'highlights': 1},
+}
+
+# document and term counters are sharded so indexing spreads its writes
+COUNTER_SHARDS = 16
+
+# most postings a query reads per term, best ranked first
+MAX_POSTINGS_PER_TERM = 1000
+
+# postings rank higher weighted frequencies first; frequencies are capped
+MAX_FREQUENCY = 99999
+
+# one run indexes a document at a time, under a lease of this length
+INDEX_LEASE_SECONDS = 60
+INDEX_LEASE_ID = 'lease'
+
+STOP_WORDS = frozenset([
+    'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'that', 'the', 'to', 'with',
+])
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+class IndexInProgressError(Exception):
+    """Another run holds the document's SearchIndexLease."""
+
+
+def tokenize(text):
+    """Split text into lowercase search terms."""
+    return [term for term in TOKEN_RE.findall(text.lower())
+        if len(term) > 1 and term not in STOP_WORDS]
+
+
+def _termFrequencies(entity):
+    """Return dict of term -> weighted frequency for an entity."""
+    tf = {}
+    for field, weight in SEARCH_FIELDS[entity.key.kind()].items():
+        values = getattr(entity, field)
+        if not isinstance(values, list):
+            values = [values]
+        for text in values:
+            for term in tokenize(text or ''):
+                tf[term] = tf.get(term, 0) + weight
+    return tf
+
+
+def _termId(kind, term):
+    return '%s:%s' % (kind, term)
+
+
+def _entryId(kind, term, count, websafeKey):
+    """Entry ids sort by term, then by descending frequency."""
+    return '%s:%05d:%s' % (_termId(kind, term),
+        MAX_FREQUENCY - min(count, MAX_FREQUENCY), websafeKey)
+
+
+def _shardOf(websafeKey):
+    return (zlib.crc32(websafeKey) & 0xffffffff) % COUNTER_SHARDS
+
+
+def _counterKeys(model, name):
+    return [ndb.Key(model, '%s:%d' % (name, shard)) for shard in range(COUNTER_SHARDS)]
+
+
+@ndb.transactional()
+def _addToCounter(counter_key, model, attribute, delta):
+    counter = counter_key.get() or model(key=counter_key)
+    setattr(counter, attribute, getattr(counter, attribute) + delta)
+    counter.put()
+
+
+def indexDocument(websafeKey):
+    """Bring the index in line with the current text of one entity;
+    only postings of terms that changed are rewritten. Raise
+    IndexInProgressError if another run is indexing the entity.
+
+    Runs of one document are serialized by a SearchIndexLease: the
+    terms read and diffed against the SearchDocument can't change
+    underneath a run, and a run that lost its lease can't commit. A run
+    that dies leaves its lease to expire; the next one also deletes the
+    postings the dead run may have written.
+    """
+    key = ndb.Key(urlsafe=websafeKey)
+    kind = key.kind()
+    token = uuid.uuid4().hex
+    entity, doc, new, pending = _acquireIndexLease(key, token)
+
+    old = dict(zip(doc.terms, doc.counts)) if doc else {}
+    changed = [term for term in set(old) | set(new) if old.get(term) != new.get(term)]
+    orphaned = [term for term, count in pending.items()
+        if count not in (old.get(term), new.get(term))]
+
+    # one small entity per (term, document): no shared posting list to
+    # grow past the entity size limit or to contend on
+    ndb.delete_multi([ndb.Key(SearchEntry, _entryId(kind, term, old[term], websafeKey))
+        for term in changed if term in old] +
+        [ndb.Key(SearchEntry, _entryId(kind, term, pending[term], websafeKey))
+        for term in orphaned])
+    ndb.put_multi([SearchEntry(id=_entryId(kind, term, new[term], websafeKey))
+        for term in changed if term in new])
+
+    if not _commitIndex(websafeKey, token, new if entity else None):
+        # our lease expired and another run took over
+        raise IndexInProgressError(websafeKey)
+
+    # counted once committed, so a run that lost its lease counts nothing
+    shard = _shardOf(websafeKey)
+    for term in changed:
+        if (term in old) != (term in new):
+            _addToCounter(_counterKeys(SearchTermCount, _termId(kind, term))[shard],
+                SearchTermCount, 'documents', 1 if term in new else -1)
+    if bool(entity) != bool(doc):
+        _addToCounter(_counterKeys(SearchStats, kind)[shard],
+            SearchStats, 'documents', 1 if entity else -1)
+
+
+def _indexLeaseKey(websafeKey):
+    return ndb.Key(SearchDocument, websafeKey, SearchIndexLease, INDEX_LEASE_ID)
+
+
+@ndb.transactional(xg=True)
+def _acquireIndexLease(key, token):
+    """Take the lease of key's document, recording the terms this run
+    will write; return (entity, doc, terms, pending), pending being the
+    terms of a run whose lease expired."""
+    websafeKey = key.urlsafe()
+    lease_key = _indexLeaseKey(websafeKey)
+    entity, doc, lease = ndb.get_multi([key, lease_key.parent(), lease_key])
+    now = datetime.now()
+    if lease and lease.expires > now:
+        raise IndexInProgressError(websafeKey)
+
+    new = _termFrequencies(entity) if entity else {}
+    SearchIndexLease(key=lease_key, token=token,
+        expires=now + timedelta(seconds=INDEX_LEASE_SECONDS),
+        terms=new.keys(), counts=new.values()).put()
+    return entity, doc, new, dict(zip(lease.terms, lease.counts)) if lease else {}
+
+
+@ndb.transactional()
+def _commitIndex(websafeKey, token, terms):
+    """Store the indexed terms, or delete the document if terms is
+    None, and release the lease; return False if it isn't ours."""
+    lease_key = _indexLeaseKey(websafeKey)
+    lease = lease_key.get()
+    if not lease or lease.token != token:
+        return False
+    if terms is not None:
+        SearchDocument(key=lease_key.parent(), terms=terms.keys(), counts=terms.values()).put()
+    else:
+        lease_key.parent().delete()
+    lease_key.delete()
+    return True
+
+
+def _postings(kind, term):
+    """Start fetching the MAX_POSTINGS_PER_TERM best ranked entry keys of term."""
+    prefix = _termId(kind, term) + ':'
+    return SearchEntry.query(SearchEntry.key >= ndb.Key(SearchEntry, prefix),
+        SearchEntry.key < ndb.Key(SearchEntry, prefix + u'\ufffd')).fetch_async(
+        MAX_POSTINGS_PER_TERM, keys_only=True)
+
+
+def search(kind, query, offset, limit):
+    """Return (websafeKeys, more) for one page of ranked results.
+
+    Documents matching more query terms rank first, then by tf-idf.
+    Only the MAX_POSTINGS_PER_TERM most frequent documents of each
+    term are considered, so a query reads a bounded number of keys.
+    """
+    terms = list(set(tokenize(query)))
+    if not terms:
+        return [], False
+
+    futures = [_postings(kind, term) for term in terms]
+    counters = ndb.get_multi(_counterKeys(SearchStats, kind) +
+        [key for term in terms for key in _counterKeys(SearchTermCount, _termId(kind, term))])
+    total = max(sum(counter.documents for counter in counters[:COUNTER_SHARDS] if counter), 1)
+
+    scores = {}
+    matched = {}
+    for i, future in enumerate(futures):
+        shards = counters[(i + 1) * COUNTER_SHARDS:(i + 2) * COUNTER_SHARDS]
+        keys = future.get_result()
+        df = max(sum(counter.documents for counter in shards if counter), len(keys))
+        if not df:
+            continue
+        idf = math.log(1.0 + float(total) / df)
+        for entry_key in keys:
+            rank, doc = entry_key.id()[len(_termId(kind, terms[i])) + 1:].split(':', 1)
+            count = MAX_FREQUENCY - int(rank)
+            scores[doc] = scores.get(doc, 0.0) + count * idf
+            matched[doc] = matched.get(doc, 0) + 1
+
+    ranked = sorted(scores, key=lambda doc: (-matched[doc], -scores[doc], doc))
+    return ranked[offset:offset + limit], offset + limit < len(ranked)
+
@@ -14,3 +14,6 @@ created/forked from conference.py by wesc on 2014 may 24
 # Console or Cloud Console.
 WEB_CLIENT_ID = '590748674077-fc3frkpiea168psa8dk9pj2kjk4ru44a.apps.googleusercontent.com'
 
+# Value of the X-Conference-Profile header that has a call profiled for
+# callers who aren't admins; leave empty to only honor it for admins.
+PROFILE_SECRET = ''
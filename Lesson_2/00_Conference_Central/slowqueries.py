@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""slowqueries.py
+
+Udacity conference server-side Python App Engine slow-query log;
+    records user-filtered queries slower than SLOW_QUERY_MS, with their
+    query plan, in a capped ring buffer in memcache
+
+"""
+
+import logging
+import time
+
+from google.appengine.api import memcache
+
+# queries slower than this are recorded
+SLOW_QUERY_MS = 200
+
+# ring buffer slots; the oldest entry is overwritten once full
+RING_SIZE = 200
+
+MEMCACHE_SLOW_QUERY_PREFIX = 'SLOW QUERY:'
+MEMCACHE_SLOW_QUERY_NEXT_KEY = 'SLOW QUERY NEXT'
+
+
+def normalize(filters, order):
+    """Return the shape of a filter set, values dropped, as a string:
+    filters with the same fields and operators share one shape.
+    """
+    shape = ' AND '.join(sorted('%s %s ?' % (f['field'], f['operator']) for f in filters))
+    return '%s ORDER BY %s' % (shape or '(no filters)', order)
+
+
+def record(endpoint, queryPlan, filters, order, results, scanned, seconds):
+    """Add a query to the ring buffer if it took over SLOW_QUERY_MS."""
+    elapsedMs = int(seconds * 1000)
+    if elapsedMs < SLOW_QUERY_MS:
+        return
+    entry = {
+        'endpoint': endpoint,
+        'kind': queryPlan.kind,
+        'shape': normalize(filters, order),
+        'strategy': queryPlan.strategy,
+        'indexes': [list(index) for index in queryPlan.indexes or ()],
+        'results': results,
+        'scanned': scanned,
+        'ms': elapsedMs,
+        'recorded': time.time(),
+    }
+    logging.warning('slow query: %s', entry)
+    # incr is atomic, so concurrent requests claim distinct slots
+    slot = memcache.incr(MEMCACHE_SLOW_QUERY_NEXT_KEY, initial_value=0)
+    if slot is not None:
+        memcache.set('%s%d' % (MEMCACHE_SLOW_QUERY_PREFIX, slot % RING_SIZE), entry)
+
+
+def recent():
+    """Return the slow queries still in the ring buffer, newest first."""
+    entries = memcache.get_multi(['%s%d' % (MEMCACHE_SLOW_QUERY_PREFIX, slot)
+        for slot in range(RING_SIZE)]).values()
+    return sorted(entries, key=lambda entry: -entry['recorded'])
+
+
+def topOffenders(entries, limit=20):
+    """Group entries by endpoint, kind and shape; return the groups by
+    total time, slowest first.
+    """
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault((entry['endpoint'], entry['kind'], entry['shape']), {
+            'endpoint': entry['endpoint'],
+            'kind': entry['kind'],
+            'shape': entry['shape'],
+            'strategy': entry['strategy'],
+            'count': 0,
+            'totalMs': 0,
+            'maxMs': 0,
+            'results': 0,
+            'scanned': 0,
+        })
+        group['count'] += 1
+        group['totalMs'] += entry['ms']
+        group['maxMs'] = max(group['maxMs'], entry['ms'])
+        group['results'] += entry['results']
+        group['scanned'] += entry['scanned']
+    return sorted(groups.values(), key=lambda group: -group['totalMs'])[:limit]
@@ -17,6 +17,14 @@ var conferenceApp = conferenceApp || {};
  */
 conferenceApp.controllers = angular.module('conferenceControllers', ['ui.bootstrap']);
 
+/**
+ * Conferences last loaded by the conference detail page, by websafeConferenceKey.
+ * Their etag is sent back as ifNoneMatch, so an unchanged conference is not downloaded again.
+ *
+ * @type {{}}
+ */
+conferenceApp.conferenceCache = {};
+
 /**
  * @ngdoc controller
  * @name MyProfileCtrl
@@ -547,11 +555,67 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
  * @description
  * A controller used for the conference detail page.
  */
-conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, $timeout, HTTP_ERRORS) {
     $scope.conference = {};
 
     $scope.isUserAttending = false;
 
+    $scope.conferenceVersion = 0;
+
+    $scope.watching = true;
+
+    /**
+     * Milliseconds to wait before the next watch after a failure; doubles up to
+     * MAX_WATCH_RETRY_MS and resets once a watch succeeds.
+     */
+    var MIN_WATCH_RETRY_MS = 1000;
+    var MAX_WATCH_RETRY_MS = 60000;
+    $scope.watchRetryMs = MIN_WATCH_RETRY_MS;
+
+    $scope.$on('$destroy', function () {
+        $scope.watching = false;
+        $timeout.cancel($scope.watchTimer);
+    });
+
+    /**
+     * Watches again after delayMs, unless the page was left.
+     */
+    $scope.scheduleWatch = function (delayMs) {
+        if ($scope.watching) {
+            $scope.watchTimer = $timeout($scope.watchConference, delayMs);
+        }
+    };
+
+    /**
+     * Long-polls the conference.watchConferences method and updates seatsAvailable and
+     * featuredSpeakers in the $scope when they change, instead of refreshing the page.
+     */
+    $scope.watchConference = function () {
+        gapi.client.conference.watchConferences({
+            items: [{
+                websafeConferenceKey: $routeParams.websafeConferenceKey,
+                version: $scope.conferenceVersion
+            }]
+        }).execute(function (resp) {
+            $scope.$apply(function () {
+                if (resp.error) {
+                    $log.error('Failed to watch the conference : ' + (resp.error.message || ''));
+                    $scope.scheduleWatch($scope.watchRetryMs);
+                    $scope.watchRetryMs = Math.min($scope.watchRetryMs * 2, MAX_WATCH_RETRY_MS);
+                    return;
+                }
+                $scope.watchRetryMs = MIN_WATCH_RETRY_MS;
+                angular.forEach(resp.result.items || [], function (item) {
+                    $scope.conferenceVersion = item.version;
+                    $scope.conference.seatsAvailable = item.seatsAvailable;
+                    $scope.conference.featuredSpeakers = item.featuredSpeakers;
+                });
+                // the server was too busy to hold the poll open
+                $scope.scheduleWatch((resp.result.retryAfter || 0) * 1000);
+            });
+        });
+    };
+
     /**
      * Initializes the conference detail page.
      * Invokes the conference.getConference method and sets the returned conference in the $scope.
@@ -559,8 +623,10 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
      */
     $scope.init = function () {
         $scope.loading = true;
-        gapi.client
-            websafeConferenceKey: $routeParams.websafeConfer.conference.getConference({enceKey
+        var cached = conferenceApp.conferenceCache[$routeParams.websafeConferenceKey];
+        gapi.client.conference.getConference({
+            websafeConferenceKey: $routeParams.websafeConferenceKey,
+            ifNoneMatch: cached ? cached.etag : undefined
         }).execute(function (resp) {
             $scope.$apply(function () {
                 $scope.loading = false;
@@ -574,7 +640,17 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                 } else {
                     // The request has succeeded.
                     $scope.alertStatus = 'success';
-                    $scope.conference = resp.result;
+                    if (resp.result.unchanged && cached) {
+                        // Not modified since the last load; use the cached copy.
+                        $scope.conference = angular.copy(cached);
+                    } else {
+                        $scope.conference = resp.result;
+                        conferenceApp.conferenceCache[$routeParams.websafeConferenceKey] =
+                            angular.copy(resp.result);
+                    }
+                    // Watches for changes made after this read only.
+                    $scope.conferenceVersion = resp.result.watchVersion || 0;
+                    $scope.watchConference();
                 }
             });
         });
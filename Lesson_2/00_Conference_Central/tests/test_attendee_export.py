@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""Attendee roster export and the Registration backfill it reads."""
+
+import testutil
+
+
+class AttendeeExportTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(AttendeeExportTest, self).setUp()
+        from google.appengine.ext import ndb
+        import main
+        from models import Conference
+        from models import Profile
+        self.main = main
+        organizer = ndb.Key(Profile, 'organizer@example.com')
+        self.conf_key = Conference(parent=organizer, name='First',
+            organizerUserId=organizer.id(), maxAttendees=10, seatsAvailable=9).put()
+        self.wsck = self.conf_key.urlsafe()
+        # registered before Registration rows were kept
+        Profile(id='a@example.com', displayName='A', mainEmail='a@example.com',
+            conferenceKeysToAttend=[self.wsck]).put()
+
+    def export(self, wsck):
+        self.login('organizer@example.com')
+        return self.main.app.get_response('/export/attendees?websafeConferenceKey=' + wsck)
+
+    def testBackfilledAttendeeIsExported(self):
+        response = self.main.app.get_response('/tasks/backfill_registrations', method='POST')
+        self.assertEqual(response.status_int, 200)
+        while self.pushTasks('/tasks/backfill_registrations'):
+            self.runPushTasks(self.main.app, '/tasks/backfill_registrations')
+
+        response = self.export(self.wsck)
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.body.splitlines(),
+            ['userId,displayName,mainEmail', 'a@example.com,A,a@example.com'])
+
+    def testMissingOrMalformedKey(self):
+        self.assertEqual(self.export('').status_int, 400)
+        self.assertEqual(self.export('not-a-key').status_int, 404)
+
+    def testUnknownExportCountIsThrottled(self):
+        self.patch(self.main.memcache, 'incr', lambda *args, **kwargs: None)
+
+        response = self.export(self.wsck)
+        self.assertEqual(response.status_int, 503)
+        self.assertIn('Retry-After', response.headers)
+
+    def testLeakedExportCountExpires(self):
+        import time
+        from google.appengine.api import memcache
+        slot = int(time.time()) // self.main.EXPORT_SLOT_SECONDS
+        # left behind by exports killed two minutes ago
+        memcache.set(self.main.MEMCACHE_EXPORTS_RUNNING_PREFIX + str(slot - 2),
+            self.main.EXPORT_MAX_CONCURRENT)
+
+        self.assertEqual(self.export(self.wsck).status_int, 200)
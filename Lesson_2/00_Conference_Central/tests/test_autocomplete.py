@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""Autocomplete term counts, applied by /tasks/update_autocomplete."""
+
+import testutil
+
+
+class AutocompleteTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(AutocompleteTest, self).setUp()
+        import autocomplete
+        self.autocomplete = autocomplete
+
+    def testRetriedChangeIsAppliedOnce(self):
+        changes = {'city': {u'London': 1, u'Paris': 1}}
+        self.autocomplete.updateCounts(changes, 'change-1')
+        self.autocomplete.updateCounts(changes, 'change-1')
+        self.autocomplete.updateCounts({'city': {u'London': 1}}, 'change-2')
+
+        self.assertEqual(self.autocomplete.suggest('city', u'', 10),
+            [(u'London', 2), (u'Paris', 1)])
+
+    def testTermIsDroppedAtZero(self):
+        self.autocomplete.updateCounts({'city': {u'London': 1}}, 'change-1')
+        self.autocomplete.updateCounts({'city': {u'London': -1}}, 'change-2')
+
+        self.assertEqual(self.autocomplete.suggest('city', u'lon', 10), [])
+
+    def testNewConferenceIsCountedOnlyIfStored(self):
+        import conference
+        from models import ConferenceForm
+        self.login('organizer@example.com')
+        api = conference.ConferenceApi()
+
+        def fail(*args):
+            raise RuntimeError('transaction failed')
+        countChanges = conference.facets.countChanges
+        self.patch(conference.facets, 'countChanges', fail)
+        with self.assertRaises(RuntimeError):
+            api.createConference(ConferenceForm(name='Summit', city='London', topics=['Go']))
+        self.assertEqual(self.pushTasks(), [])
+
+        conference.facets.countChanges = countChanges
+        api.createConference(ConferenceForm(name='Summit', city='London', topics=['Go']))
+        self.assertEqual(sorted(task.url for task in self.pushTasks()),
+            ['/tasks/index_document', '/tasks/update_autocomplete', '/tasks/update_facets'])
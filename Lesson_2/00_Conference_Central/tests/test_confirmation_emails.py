@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""Batched confirmation emails sent from the confirmation-emails pull queue."""
+
+import json
+
+import testutil
+
+
+def conferencePayload(email, name):
+    return json.dumps({'email': email, 'conference': {'name': name,
+        'city': 'London', 'topics': ['Web Technologies'], 'startDate': None,
+        'endDate': None, 'maxAttendees': 10}})
+
+
+class SendConfirmationEmailsTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(SendConfirmationEmailsTest, self).setUp()
+        from google.appengine.api import taskqueue
+        import logic
+        import main
+        self.main = main
+        self.queue = taskqueue.Queue(logic.CONFIRMATION_EMAIL_QUEUE)
+        self.taskqueue = taskqueue
+
+    def add(self, payload):
+        self.queue.add(self.taskqueue.Task(payload=payload, method='PULL'))
+
+    def send(self):
+        return self.main.app.get_response('/crons/send_confirmation_emails')
+
+    def queued(self):
+        return self.queue.lease_tasks(60, 100)
+
+    def testOneEmailPerRecipient(self):
+        self.add(conferencePayload('a@example.com', 'First'))
+        self.add(conferencePayload('a@example.com', 'Second'))
+        self.add(conferencePayload('b@example.com', 'Third'))
+
+        self.assertEqual(self.send().status_int, 200)
+
+        messages = dict((message.to, message)
+            for message in self.mailStub.get_sent_messages())
+        self.assertEqual(sorted(messages), ['a@example.com', 'b@example.com'])
+        body = messages['a@example.com'].body.decode()
+        self.assertIn('First', body)
+        self.assertIn('Second', body)
+        self.assertEqual(messages['a@example.com'].subject, 'You created 2 new Conference(s)!')
+        self.assertEqual(self.queued(), [])
+
+    def testMalformedPayloadIsDropped(self):
+        self.add('not json')
+        self.add(json.dumps({'conference': {}}))
+        self.add(conferencePayload('a@example.com', 'First'))
+
+        self.assertEqual(self.send().status_int, 200)
+
+        self.assertEqual([message.to for message in self.mailStub.get_sent_messages()],
+            ['a@example.com'])
+        self.assertEqual(self.queued(), [])
+
+    def testFailedSendIsRetried(self):
+        from models import EmailOutcome
+
+        def fail(*args):
+            raise RuntimeError('mail service unavailable')
+        self.patch(self.main.mail, 'send_mail', fail)
+        self.add(conferencePayload('a@example.com', 'First'))
+
+        self.assertEqual(self.send().status_int, 200)
+
+        self.assertEqual([outcome.status for outcome in EmailOutcome.query()], ['RETRYING'])
+        # still queued, under a backed off lease
+        self.assertEqual(self.queued(), [])
+        self.assertEqual(len(self.taskqueueStub.get_filtered_tasks(
+            queue_names=[self.queue.name])), 1)
+
+    def testLegacyPushTaskIsSent(self):
+        response = self.main.app.get_response('/tasks/send_confirmation_email',
+            method='POST', POST={'email': 'a@example.com', 'conferenceInfo': 'First'})
+
+        self.assertEqual(response.status_int, 200)
+        [message] = self.mailStub.get_sent_messages(to='a@example.com')
+        self.assertIn('First', message.body.decode())
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+"""Sharded facet counts, applied by /tasks/update_facets."""
+
+import testutil
+
+
+class FacetsTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(FacetsTest, self).setUp()
+        import facets
+        self.facets = facets
+
+    def testRetriedChangeIsAppliedOnce(self):
+        changes = {self.facets._countsId('city', {}): {u'London': 1}}
+        self.facets.updateCounts(changes, 'change-1')
+        self.facets.updateCounts(changes, 'change-1')
+
+        self.assertEqual(self.facets.getCounts({})['city'], {u'London': 1})
+
+    def testCountsAreSummedOverShards(self):
+        countsId = self.facets._countsId('city', {})
+        # find change ids landing on different shards
+        changeIds = {}
+        i = 0
+        while len(changeIds) < 3:
+            changeIds.setdefault(self.facets._shardOf('change-%d' % i), 'change-%d' % i)
+            i += 1
+        first, second, third = changeIds.values()
+        self.facets.updateCounts({countsId: {u'London': 1, u'Paris': 1}}, first)
+        self.facets.updateCounts({countsId: {u'London': 1}}, second)
+        # removed on a shard that never saw the add
+        self.facets.updateCounts({countsId: {u'Paris': -1}}, third)
+
+        self.assertEqual(self.facets.getCounts({})['city'], {u'London': 2})
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""Instance cache bounds and the conference view counts."""
+
+import testutil
+
+
+class HotCacheTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(HotCacheTest, self).setUp()
+        import conference
+        import hotcache
+        self.conference = conference
+        self.hotcache = hotcache
+        hotcache.clear()
+        self.addCleanup(hotcache.clear)
+        self.patch(hotcache, 'MAX_VALUES', 3)
+        # flush every view straight to memcache
+        self.patch(hotcache, 'VIEWS_FLUSH_SECONDS', 0)
+
+    def testLeastRecentlyUsedIsEvicted(self):
+        for key in ('a', 'b', 'c'):
+            self.hotcache.put(key, key, 60)
+        self.hotcache.get('a')
+        self.hotcache.put('d', 'd', 60)
+
+        self.assertEqual([self.hotcache.get(key) for key in ('a', 'b', 'c', 'd')],
+            ['a', None, 'c', 'd'])
+
+    def testMissingConferenceIsNotCounted(self):
+        from google.appengine.ext import ndb
+        from models import Conference
+        from models import Profile
+        missing = ndb.Key(Conference, 1, parent=ndb.Key(Profile, 'a@example.com')).urlsafe()
+        api = self.conference.ConferenceApi()
+        for wsck in ('', 'not-a-key', missing):
+            with self.assertRaises(self.conference.endpoints.NotFoundException):
+                api._getConferenceForm(wsck)
+
+        self.assertEqual(self.hotcache.topViewed(10), [])
+
+    def testWarmupSkipsMalformedKeys(self):
+        from google.appengine.api import memcache
+        memcache.set(self.hotcache.MEMCACHE_CONFERENCE_VIEWS_KEY, {'not-a-key': 5})
+
+        self.assertEqual(self.conference.ConferenceApi._warmup(), 0)
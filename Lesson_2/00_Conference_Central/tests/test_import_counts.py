@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+"""Count changes of an import chunk, queued as tasks under the size limit."""
+
+import testutil
+
+
+class QueueCountChangesTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(QueueCountChangesTest, self).setUp()
+        from google.appengine.ext import ndb
+        import facets
+        import main
+        from models import PendingCountChanges
+        from models import Profile
+        self.facets = facets
+        self.main = main
+        countsId = facets._countsId('city', {})
+        self.pending = PendingCountChanges(parent=ndb.Key(Profile, 'organizer@example.com'),
+            facets={countsId: dict(('City %d' % i, 1) for i in range(100))},
+            autocomplete={'city': dict(('City %d' % i, 1) for i in range(100))})
+        self.pending.put()
+        # a few cities per task
+        self.patch(main, 'COUNT_CHANGES_PAYLOAD_BYTES', 200)
+
+    def queue(self):
+        response = self.main.app.get_response('/tasks/queue_count_changes', method='POST',
+            POST={'websafeKey': self.pending.key.urlsafe()})
+        self.assertEqual(response.status_int, 200)
+
+    def testChangesAreSplitAndAppliedOnce(self):
+        self.queue()
+        # retried after the tasks were queued but before the delete
+        self.pending.put()
+        self.queue()
+        self.assertIsNone(self.pending.key.get())
+
+        tasks = self.pushTasks('/tasks/update_facets')
+        self.assertTrue(len(tasks) > 1)
+        for task in tasks:
+            self.assertTrue(len(task.payload) < 1000)
+        self.runPushTasks(self.main.app, '/tasks/update_facets')
+
+        counts = self.facets.getCounts({})['city']
+        self.assertEqual(len(counts), 100)
+        self.assertEqual(set(counts.values()), set([1]))
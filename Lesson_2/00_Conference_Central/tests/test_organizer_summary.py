@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+"""Organizer dashboard totals, kept per conference plus one totals entity."""
+
+import testutil
+
+
+class OrganizerSummaryTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(OrganizerSummaryTest, self).setUp()
+        from google.appengine.ext import ndb
+        import conference
+        from models import Conference
+        from models import Profile
+        self.ndb = ndb
+        self.api = conference.ConferenceApi()
+        self.organizer = ndb.Key(Profile, 'organizer@example.com')
+        self.confs = [Conference(parent=self.organizer, name=name,
+            organizerUserId=self.organizer.id(), maxAttendees=10, seatsAvailable=10)
+            for name in ('First', 'Second')]
+        ndb.put_multi(self.confs)
+
+    def update(self, confs, sessions=0):
+        self.ndb.transaction(lambda: self.api._updateOrganizerSummary(confs, sessions))
+
+    def dashboard(self):
+        from protorpc import message_types
+        self.login(self.organizer.id())
+        return self.api.getOrganizerDashboard(message_types.VoidMessage())
+
+    def testTotalsFollowUpdates(self):
+        self.update(self.confs)
+        self.confs[0].seatsAvailable = 7
+        self.update([self.confs[0]], sessions=1)
+
+        dashboard = self.dashboard()
+        self.assertEqual((dashboard.conferenceCount, dashboard.totalSeats,
+            dashboard.seatsSold), (2, 20, 3))
+        self.assertEqual(sorted((entry.name, entry.seatsSold, entry.sessions)
+            for entry in dashboard.conferences), [('First', 3, 1), ('Second', 0, 0)])
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Query plans chosen against the declared indexes, and the in-memory
+fallback when none serves a query."""
+
+import testutil
+
+
+def eq(field, value):
+    return {'field': field, 'operator': '=', 'value': value}
+
+
+class PlannerTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(PlannerTest, self).setUp()
+        import planner
+        self.planner = planner
+        self.declare()
+
+    def declare(self, *indexes):
+        self.patch(self.planner, '_indexes', [('Conference', False, props) for props in indexes])
+
+    def plan(self, filters, order):
+        return self.planner.plan('Conference', False, filters, order)
+
+    def conferences(self, *specs):
+        from models import Conference
+        for name, city, maxAttendees in specs:
+            Conference(name=name, city=city, maxAttendees=maxAttendees).put()
+
+    def testEqualitiesAndSingleSortUseBuiltinIndexes(self):
+        plan = self.plan([eq('city', 'London'), eq('topics', 'Go')], 'city')
+        self.assertEqual((plan.strategy, plan.postfix), (self.planner.BUILTIN, []))
+
+        plan = self.plan([{'field': 'maxAttendees', 'operator': '>', 'value': 10}], 'maxAttendees')
+        self.assertEqual((plan.strategy, plan.postfix), (self.planner.BUILTIN, ['maxAttendees']))
+
+    def testDeclaredIndexServesQuery(self):
+        self.declare(('city', 'name'))
+        plan = self.plan([eq('city', 'London')], 'name')
+        self.assertEqual((plan.strategy, plan.indexes), (self.planner.COMPOSITE, [('city', 'name')]))
+
+    def testEqualitiesMergeJoinDeclaredIndexes(self):
+        self.declare(('city', 'name'), ('topics', 'name'))
+        plan = self.plan([eq('topics', 'Go'), eq('city', 'London')], 'name')
+        self.assertEqual((plan.strategy, plan.indexes),
+            (self.planner.COMPOSITE, [('city', 'name'), ('topics', 'name')]))
+
+    def testUndeclaredIndexFallsBack(self):
+        self.declare(('city', 'month'))
+        plan = self.plan([eq('city', 'London')], 'name')
+        self.assertEqual((plan.strategy, plan.indexes), (self.planner.MERGE_JOIN_SORT, None))
+
+    def testInequalitySortsBeforeOrder(self):
+        from models import Conference
+        self.conferences(('b', 'London', 50), ('a', 'London', 50), ('c', 'London', 20),
+            ('d', 'London', 5), ('e', 'Paris', 90))
+        filters = [eq('city', 'London'), {'field': 'maxAttendees', 'operator': '>', 'value': 10}]
+
+        plan, entities, scanned = self.planner.execute(Conference, filters, 'name')
+        self.assertEqual((plan.strategy, plan.postfix),
+            (self.planner.MERGE_JOIN_SORT, ['maxAttendees', 'name']))
+        self.assertEqual([conf.name for conf in entities], ['c', 'a', 'b'])
+        self.assertEqual(scanned, 4)
+
+    def testFallbackRefusesMoreThanLimit(self):
+        from models import Conference
+        self.patch(self.planner, 'FALLBACK_LIMIT', 2)
+        self.conferences(('a', 'London', 10), ('b', 'London', 20))
+
+        plan, entities, scanned = self.planner.execute(Conference, [eq('city', 'London')], 'name')
+        self.assertEqual(([conf.name for conf in entities], scanned), (['a', 'b'], 2))
+
+        self.conferences(('c', 'London', 30))
+        with self.assertRaises(self.planner.QueryTooBroadError):
+            self.planner.execute(Conference, [eq('city', 'London')], 'name')
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+"""The profile header is honored only for admins or with the secret."""
+
+import testutil
+
+
+class Service(object):
+
+    def __init__(self, headers):
+        self.request_state = type('RequestState', (), {'headers': headers})()
+
+
+class ShouldProfileTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(ShouldProfileTest, self).setUp()
+        import profiler
+        self.profiler = profiler
+        self.patch(profiler, 'PROFILE_SAMPLE_RATE', 0)
+        self.patch(profiler, 'PROFILE_SECRET', 'letmein')
+        self.login('a@example.com')
+
+    def requested(self, value):
+        return self.profiler.shouldProfile(Service({self.profiler.PROFILE_HEADER: value}))
+
+    def testHeaderIsIgnoredForOtherUsers(self):
+        self.assertFalse(self.requested('1'))
+        self.assertFalse(self.profiler.shouldProfile(Service({})))
+
+    def testHeaderIsHonoredForAdmins(self):
+        self.testbed.setup_env(USER_IS_ADMIN='1', overwrite=True)
+        self.assertTrue(self.requested('1'))
+
+    def testHeaderIsHonoredWithTheSecret(self):
+        self.assertTrue(self.requested('letmein'))
+
+    def testEmptySecretMatchesNothing(self):
+        self.patch(self.profiler, 'PROFILE_SECRET', '')
+        self.assertFalse(self.requested(''))
+        self.assertFalse(self.requested('1'))
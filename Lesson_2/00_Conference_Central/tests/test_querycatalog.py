@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+"""Every query the API can run is served by a declared index."""
+
+import testutil
+
+
+class QueryCatalogTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(QueryCatalogTest, self).setUp()
+        import planner
+        import querycatalog
+        self.planner = planner
+        self.querycatalog = querycatalog
+        self.shapes = list(querycatalog.queryShapes())
+
+    def testEveryQueryHasAnIndex(self):
+        self.assertEqual(self.querycatalog.uncoveredShapes(self.shapes), [])
+
+    def testIndexYamlIsUpToDate(self):
+        with open(self.planner.INDEX_YAML) as f:
+            self.assertEqual(f.read(), self.querycatalog.renderIndexYaml(
+                self.querycatalog.requiredIndexes(self.shapes)))
+
+    def testIndexesModuleMatchesIndexYaml(self):
+        self.assertEqual(self.planner.declaredIndexes(), self.planner.yamlIndexes())
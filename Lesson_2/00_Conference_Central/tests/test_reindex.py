@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""Re-putting entities under the indexing policy, one task chain per kind."""
+
+import testutil
+
+
+class ReindexTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(ReindexTest, self).setUp()
+        import indexpolicy
+        import main
+        self.main = main
+        self.patch(indexpolicy, 'REINDEX_BATCH_SIZE', 1)
+        self.patch(main.ReindexHandler, 'kinds', ('Profile',))
+
+    def testGetDoesNotStart(self):
+        response = self.main.app.get_response('/tasks/reindex')
+        self.assertEqual(response.status_int, 405)
+        self.assertEqual(self.pushTasks('/tasks/reindex'), [])
+
+    def testRetriedBatchDoesNotFork(self):
+        from models import Profile
+        for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+            Profile(id=email, mainEmail=email).put()
+        self.main.app.get_response('/tasks/reindex', method='POST')
+
+        [start] = self.pushTasks('/tasks/reindex')
+        for _ in range(2):
+            # a retry of the same batch chains the same named task
+            self.main.app.get_response('/tasks/reindex', method='POST',
+                POST=start.payload, headers=dict(start.headers))
+        self.assertEqual(len(self.pushTasks('/tasks/reindex')), 2)
+
+    def testReputKeepsRevision(self):
+        import indexpolicy
+        from models import Conference
+        key = Conference(name='Summit').put()
+        revision = key.get().revision
+
+        indexpolicy.reindexBatch('Conference')
+        self.assertEqual(key.get().revision, revision)
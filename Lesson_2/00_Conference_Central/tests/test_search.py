@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""Inverted index kept by search.indexDocument and read by search.search."""
+
+import testutil
+
+
+class SearchTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(SearchTest, self).setUp()
+        import search
+        self.search = search
+
+    def conference(self, name, description=''):
+        from models import Conference
+        key = Conference(name=name, description=description).put()
+        self.search.indexDocument(key.urlsafe())
+        return key
+
+    def results(self, query):
+        websafeKeys, more = self.search.search('Conference', query, 0, 10)
+        return websafeKeys
+
+    def testRanksByMatchedTermsThenFrequency(self):
+        both = self.conference('Python Datastore')
+        name = self.conference('Python Summit')
+        described = self.conference('Summit', 'all about python')
+
+        self.assertEqual(self.results('python datastore'),
+            [both.urlsafe(), name.urlsafe(), described.urlsafe()])
+
+    def testChangedTextReplacesPostings(self):
+        key = self.conference('Python Summit')
+        conf = key.get()
+        conf.name = 'Go Summit'
+        conf.put()
+        self.search.indexDocument(key.urlsafe())
+
+        self.assertEqual(self.results('python'), [])
+        self.assertEqual(self.results('go'), [key.urlsafe()])
+
+    def testDeletedEntityLeavesIndex(self):
+        from models import SearchEntry
+        key = self.conference('Python Summit')
+        key.delete()
+        self.search.indexDocument(key.urlsafe())
+
+        self.assertEqual(self.results('python summit'), [])
+        self.assertEqual(SearchEntry.query().count(), 0)
+
+    def testOneRunPerDocument(self):
+        from models import Conference
+        key = Conference(name='Python Summit').put()
+        self.search._acquireIndexLease(key, 'running')
+
+        with self.assertRaises(self.search.IndexInProgressError):
+            self.search.indexDocument(key.urlsafe())
+        self.assertEqual(self.results('python'), [])
+
+    def testDeadRunLeavesNoPostings(self):
+        from datetime import datetime
+        key = self.conference('Python Summit')
+        conf = key.get()
+        conf.name = 'Python Datastore'
+        conf.put()
+
+        def die(*args):
+            raise RuntimeError('instance shut down')
+        commit = self.search._commitIndex
+        self.patch(self.search, '_commitIndex', die)
+        with self.assertRaises(RuntimeError):
+            self.search.indexDocument(key.urlsafe())
+        self.search._commitIndex = commit
+
+        # edited again before the dead run's lease expired
+        conf.name = 'Go Summit'
+        conf.put()
+        lease = self.search._indexLeaseKey(key.urlsafe()).get()
+        lease.expires = datetime.now()
+        lease.put()
+        self.search.indexDocument(key.urlsafe())
+
+        self.assertEqual(self.results('python datastore'), [])
+        self.assertEqual(self.results('go summit'), [key.urlsafe()])
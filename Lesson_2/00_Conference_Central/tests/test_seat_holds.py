@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""Seat holds claim tokens from a conference's seat token shards; the
+conference itself is only written when a hold is confirmed or expires."""
+
+from datetime import datetime
+from datetime import timedelta
+
+import testutil
+
+
+class SeatHoldTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(SeatHoldTest, self).setUp()
+        from google.appengine.ext import ndb
+        import conference
+        import logic
+        from models import Conference
+        from models import Profile
+        self.conference = conference
+        self.logic = logic
+        self.api = conference.ConferenceApi()
+
+        self.organizer = ndb.Key(Profile, 'organizer@example.com')
+        self.conf_key = Conference(parent=self.organizer, name='Tiny',
+            organizerUserId=self.organizer.id(), maxAttendees=1, seatsAvailable=1).put()
+        self.wsck = self.conf_key.urlsafe()
+
+    def request(self):
+        return self.conference.CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck)
+
+    def expireHolds(self):
+        from models import SeatHold
+        for hold in SeatHold.query():
+            hold.expires = datetime.now() - timedelta(seconds=1)
+            hold.put()
+
+    def tokens(self):
+        return self.logic.freeSeats(self.conf_key.get())
+
+    def testHoldDoesNotWriteTheConference(self):
+        revision = self.conf_key.get().revision
+        self.login('a@example.com')
+        self.api.holdSeat(self.request())
+
+        conf = self.conf_key.get()
+        self.assertEqual((conf.revision, conf.seatsAvailable, self.tokens()), (revision, 1, 0))
+
+    def testHeldSeatIsNotSold(self):
+        self.login('a@example.com')
+        self.api.holdSeat(self.request())
+
+        self.login('b@example.com')
+        with self.assertRaises(self.conference.ConflictException):
+            self.api.holdSeat(self.request())
+        with self.assertRaises(self.conference.ConflictException):
+            self.api.registerForConference(self.request())
+
+        self.login('a@example.com')
+        self.assertTrue(self.api.confirmSeatHold(self.request()).data)
+        self.assertEqual((self.conf_key.get().seatsAvailable, self.tokens()), (0, 0))
+
+    def testExpiredHoldIsReleasedOnce(self):
+        self.login('a@example.com')
+        self.api.holdSeat(self.request())
+        self.expireHolds()
+
+        self.assertEqual(self.logic.expireSeatHolds(), 1)
+        self.assertEqual(self.logic.expireSeatHolds(), 0)
+        self.assertEqual((self.conf_key.get().seatsAvailable, self.tokens()), (1, 1))
+
+    def testRenewedExpiredHoldKeepsItsSeat(self):
+        from models import SeatHold
+        self.login('a@example.com')
+        self.api.holdSeat(self.request())
+        self.expireHolds()
+        [hold_key] = SeatHold.query().fetch(keys_only=True)
+
+        # renewed before the cron got to it
+        self.api.holdSeat(self.request())
+        self.assertFalse(self.logic.releaseSeatHold(hold_key))
+        self.assertEqual(self.tokens(), 0)
+
+    def testConfirmForDeletedConference(self):
+        self.login('a@example.com')
+        self.api.holdSeat(self.request())
+        self.conf_key.delete()
+
+        with self.assertRaises(self.conference.endpoints.NotFoundException):
+            self.api.confirmSeatHold(self.request())
+
+    def testExpiredHoldPromotionShowsOnDashboard(self):
+        from protorpc import message_types
+        self.login('a@example.com')
+        self.api.holdSeat(self.request())
+        self.login('b@example.com')
+        self.api.joinWaitlist(self.request())
+        self.expireHolds()
+
+        self.assertEqual(self.logic.expireSeatHolds(), 1)
+
+        self.login(self.organizer.id())
+        dashboard = self.api.getOrganizerDashboard(message_types.VoidMessage())
+        self.assertEqual((dashboard.totalSeats, dashboard.seatsSold), (1, 1))
+        self.assertEqual((self.conf_key.get().seatsAvailable, self.tokens()), (0, 0))
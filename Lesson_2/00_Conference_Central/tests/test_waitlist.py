@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""Conference waitlists: ticket order, positions, promotion and leaving."""
+
+from datetime import datetime
+from datetime import timedelta
+
+import testutil
+
+
+class WaitlistTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(WaitlistTest, self).setUp()
+        from google.appengine.ext import ndb
+        import conference
+        import logic
+        from models import Conference
+        from models import Profile
+        self.conference = conference
+        self.logic = logic
+        self.api = conference.ConferenceApi()
+        organizer = ndb.Key(Profile, 'organizer@example.com')
+        self.conf_key = Conference(parent=organizer, name='Tiny',
+            organizerUserId=organizer.id(), maxAttendees=1, seatsAvailable=1).put()
+        self.wsck = self.conf_key.urlsafe()
+
+    def request(self):
+        return self.conference.CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck)
+
+    def as_(self, email, method):
+        self.login(email)
+        return getattr(self.api, method)(self.request())
+
+    def attending(self, email):
+        from google.appengine.ext import ndb
+        from models import Profile
+        ndb.get_context().clear_cache()
+        return self.wsck in ndb.Key(Profile, email).get().conferenceKeysToAttend
+
+    def testJoinOrderAndPosition(self):
+        self.as_('a@example.com', 'registerForConference')
+        self.assertEqual(self.as_('b@example.com', 'joinWaitlist').position, 1)
+        self.assertEqual(self.as_('c@example.com', 'joinWaitlist').position, 2)
+        # joining again keeps the ticket
+        self.assertEqual(self.as_('b@example.com', 'joinWaitlist').position, 1)
+        self.assertEqual(self.as_('c@example.com', 'getWaitlistPosition').position, 2)
+
+    def testJoinWithFreeSeats(self):
+        with self.assertRaises(self.conference.ConflictException):
+            self.as_('b@example.com', 'joinWaitlist')
+
+    def testUnregisterPromotesTheHead(self):
+        self.as_('a@example.com', 'registerForConference')
+        self.as_('b@example.com', 'joinWaitlist')
+        self.as_('c@example.com', 'joinWaitlist')
+
+        self.as_('a@example.com', 'unregisterFromConference')
+
+        self.assertTrue(self.attending('b@example.com'))
+        self.assertFalse(self.attending('c@example.com'))
+        self.assertEqual(self.as_('c@example.com', 'getWaitlistPosition').position, 1)
+        self.assertEqual(self.conf_key.get().seatsAvailable, 0)
+
+    def testLeaveSkipsTheUser(self):
+        self.as_('a@example.com', 'registerForConference')
+        self.as_('b@example.com', 'joinWaitlist')
+        self.as_('c@example.com', 'joinWaitlist')
+
+        self.assertTrue(self.as_('b@example.com', 'leaveWaitlist').data)
+        self.assertFalse(self.as_('b@example.com', 'leaveWaitlist').data)
+        self.as_('a@example.com', 'unregisterFromConference')
+
+        self.assertFalse(self.attending('b@example.com'))
+        self.assertTrue(self.attending('c@example.com'))
+        # promoted, so no longer on the waitlist
+        self.assertFalse(self.as_('c@example.com', 'leaveWaitlist').data)
+
+    def testExpiredHoldPromotesTheHead(self):
+        from models import SeatHold
+        self.as_('a@example.com', 'holdSeat')
+        self.as_('b@example.com', 'joinWaitlist')
+        for hold in SeatHold.query():
+            hold.expires = datetime.now() - timedelta(seconds=1)
+            hold.put()
+
+        self.assertEqual(self.logic.expireSeatHolds(), 1)
+        self.assertTrue(self.attending('b@example.com'))
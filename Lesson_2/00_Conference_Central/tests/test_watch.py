@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+"""Long polls of watched conferences."""
+
+import testutil
+
+
+class WatchConferencesTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(WatchConferencesTest, self).setUp()
+        from google.appengine.ext import ndb
+        import conference
+        import logic
+        from models import Conference
+        from models import Profile
+        self.conference = conference
+        self.logic = logic
+        self.api = conference.ConferenceApi()
+        organizer = ndb.Key(Profile, 'organizer@example.com')
+        self.wsck = Conference(parent=organizer, name='First', organizerUserId=organizer.id(),
+            maxAttendees=10, seatsAvailable=10).put().urlsafe()
+        self.patch(conference, 'LONG_POLL_SECONDS', 0)
+
+    def watch(self, wsck, version):
+        from models import ConferenceVersionForm
+        from models import ConferenceWatchForm
+        return self.api.watchConferences(ConferenceWatchForm(
+            items=[ConferenceVersionForm(websafeConferenceKey=wsck, version=version)]))
+
+    def testWatchStartsFromTheVersionRead(self):
+        self.logic.bumpConferenceVersion(self.wsck)
+        form = self.api.getConference(self.conference.CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck))
+        self.assertEqual(form.watchVersion, 1)
+
+        self.assertEqual(self.watch(self.wsck, form.watchVersion).items, [])
+        self.logic.bumpConferenceVersion(self.wsck)
+        [item] = self.watch(self.wsck, form.watchVersion).items
+        self.assertEqual((item.version, item.seatsAvailable), (2, 10))
+
+    def testMalformedKeyIsRejected(self):
+        with self.assertRaises(self.conference.endpoints.BadRequestException):
+            self.watch('not-a-key', 0)
+
+    def testBusyInstanceAsksToRetry(self):
+        self.patch(self.conference, 'LONG_POLL_MAX_WAITERS', 0)
+        self.assertEqual(self.watch(self.wsck, 0).retryAfter,
+            self.conference.LONG_POLL_RETRY_SECONDS)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Buffered wishlist mutations, flushed into the Profile in order."""
+
+import testutil
+
+
+class WishlistFlushTest(testutil.AppTestCase):
+
+    def setUp(self):
+        super(WishlistFlushTest, self).setUp()
+        import wishlist
+        from models import Profile
+        self.wishlist = wishlist
+        self.profile_key = Profile(id='a@example.com', mainEmail='a@example.com').put()
+
+    def stored(self):
+        from google.appengine.ext import ndb
+        ndb.get_context().clear_cache()
+        return self.profile_key.get().wishlist
+
+    def evictLog(self):
+        from google.appengine.api import memcache
+        memcache.delete(self.wishlist.MEMCACHE_WISHLIST_LOG_PREFIX + 'a@example.com')
+
+    def testEvictedLogLosesNoMutation(self):
+        self.wishlist.record('a@example.com', self.wishlist.ADD, 's1')
+        self.wishlist.record('a@example.com', self.wishlist.ADD, 's2')
+        self.evictLog()
+        self.wishlist.record('a@example.com', self.wishlist.REMOVE, 's1')
+        self.evictLog()
+
+        self.assertEqual(self.wishlist.flush('a@example.com'), 3)
+        self.assertEqual(self.stored(), ['s2'])
+
+    def testFailedFlushIsNotAppliedOverNewerMutations(self):
+        self.wishlist.record('a@example.com', self.wishlist.ADD, 's1')
+
+        def fail(*args):
+            raise RuntimeError('datastore unavailable')
+        replay = self.wishlist.replay
+        self.patch(self.wishlist, 'replay', fail)
+        with self.assertRaises(RuntimeError):
+            self.wishlist.flush('a@example.com')
+        self.wishlist.replay = replay
+
+        # the failed flush returned its mutation, and released its lease
+        self.wishlist.record('a@example.com', self.wishlist.REMOVE, 's1')
+        self.assertEqual(self.wishlist.flush('a@example.com'), 2)
+        self.assertEqual(self.stored(), [])
+
+    def testOneFlushPerUser(self):
+        self.wishlist.record('a@example.com', self.wishlist.ADD, 's1')
+        self.wishlist._acquireFlushLease('a@example.com', 'running')
+
+        with self.assertRaises(self.wishlist.FlushInProgressError):
+            self.wishlist.flush('a@example.com')
+        self.assertEqual(self.stored(), [])
+
+        self.wishlist._releaseFlushLease('a@example.com', 'running')
+        self.assertEqual(self.wishlist.flush('a@example.com'), 1)
+        self.assertEqual(self.stored(), ['s1'])
+
+    def testRecordingOrderWinsOverTheClock(self):
+        import itertools
+        # instances' clocks disagree; each later call reads an earlier time
+        ticks = itertools.count()
+        self.patch(self.wishlist, 'time', type('Clock', (), {
+            'time': staticmethod(lambda: 10000.0 - next(ticks))}))
+        self.wishlist.record('a@example.com', self.wishlist.ADD, 's1')
+        self.wishlist.record('a@example.com', self.wishlist.REMOVE, 's1')
+
+        self.assertEqual(self.wishlist.flush('a@example.com'), 2)
+        self.assertEqual(self.stored(), [])
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""testutil.py
+
+Udacity conference server-side Python App Engine test support;
+    puts the App Engine SDK named by $APPENGINE_SDK on sys.path and
+    runs each test against fresh testbed service stubs
+
+usage (from the app directory):
+    APPENGINE_SDK=PATH python -m unittest discover -s tests
+
+"""
+
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SDK = os.environ.get('APPENGINE_SDK')
+if not SDK:
+    raise unittest.SkipTest('$APPENGINE_SDK is not set')
+
+sys.path.insert(0, SDK)
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, APP_DIR)
+
+
+class AppTestCase(unittest.TestCase):
+    """Test case with datastore, memcache, task queue and mail stubs."""
+
+    def setUp(self):
+        from google.appengine.datastore import datastore_stub_util
+        from google.appengine.ext import ndb
+        from google.appengine.ext import testbed
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        # root_path picks up queue.yaml for the pull queues
+        self.testbed.init_taskqueue_stub(root_path=APP_DIR)
+        self.testbed.init_mail_stub()
+        self.testbed.init_user_stub()
+        self.testbed.init_app_identity_stub()
+        ndb.get_context().clear_cache()
+
+        self.taskqueueStub = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        self.mailStub = self.testbed.get_stub(testbed.MAIL_SERVICE_NAME)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def login(self, email):
+        """Make endpoints.get_current_user() return email."""
+        self.testbed.setup_env(USER_EMAIL=email, ENDPOINTS_AUTH_EMAIL=email,
+            ENDPOINTS_AUTH_DOMAIN='example.com', overwrite=True)
+
+    def patch(self, owner, name, value):
+        """Replace owner.name with value for the rest of the test."""
+        original = getattr(owner, name)
+        setattr(owner, name, value)
+        self.addCleanup(setattr, owner, name, original)
+
+    def pushTasks(self, url=None):
+        """Return queued push tasks, optionally only those for url."""
+        tasks = self.taskqueueStub.get_filtered_tasks(queue_names=['default'])
+        return [task for task in tasks if url is None or task.url == url]
+
+    def runPushTasks(self, app, url):
+        """Run the queued push tasks for url against app once each,
+        returning the responses."""
+        responses = []
+        for task in self.pushTasks(url):
+            self.taskqueueStub.DeleteTask('default', task.name)
+            responses.append(app.get_response(task.url, method='POST',
+                POST=task.payload, headers=dict(task.headers)))
+        return responses
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""wishlist.py
+
+Udacity conference server-side Python App Engine wishlist buffer;
+    write-behind buffering of wishlist adds and removes, flushed into
+    the Profile with one put per user every WISHLIST_FLUSH_SECONDS
+
+Durability: a mutation is acknowledged only once it is stored as a task
+in the WISHLIST_QUEUE pull queue, tagged with the user id. The queue is
+durable, so an acknowledged mutation is never lost. The flush task
+applies a user's queued mutations in order in one Profile transaction
+and deletes them only after it commits. A failed flush leaves them
+queued for the next flush, and replays are idempotent: adding a
+present session or removing an absent one changes nothing.
+
+Reads: pending mutations are also appended to a memcache log that
+reads merge over the stored wishlist, so users see their own changes
+at once. If memcache evicts the log, reads fall back to the stored
+wishlist until the next flush, at most WISHLIST_FLUSH_SECONDS plus
+task latency later. Mutations are never lost, only briefly invisible.
+The log expires WISHLIST_LOG_SECONDS after its last change, by when the
+mutations it shows have been flushed, so a user who stops changing
+their wishlist doesn't pin an entry in memcache.
+
+Ordering: one flush per user runs at a time, under a WishlistFlushLease
+that outlives the task leases it takes. A flush that fails returns its
+tasks to the queue at once; one that dies keeps them until their lease
+expires, before its flush lease does. Either way the next flush leases
+the old mutations together with any newer ones and applies them all in
+the order they were recorded, so older mutations never land on top of
+newer ones. A flush whose lease expired can no longer commit. The order
+is a per-user memcache counter rather than the clock, which differs
+between instances; the counter starts from the current time in
+milliseconds, so one restarted after an eviction still sorts after the
+mutations numbered before it.
+
+"""
+
+import hashlib
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from datetime import timedelta
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import WishlistFlushLease
+
+WISHLIST_QUEUE = 'wishlist-mutations'
+WISHLIST_FLUSH_SECONDS = 10
+WISHLIST_LEASE_SECONDS = 60
+# a flush lease outlives the task leases taken under it by this much
+WISHLIST_FLUSH_LEASE_MARGIN = 15
+WISHLIST_FLUSH_LEASE_ID = 'lease'
+WISHLIST_MAX_MUTATIONS = 1000
+# a logged mutation is flushed within one window and one task lease
+WISHLIST_LOG_SECONDS = WISHLIST_FLUSH_SECONDS + WISHLIST_LEASE_SECONDS
+
+MEMCACHE_WISHLIST_LOG_PREFIX = 'WISHLIST LOG:'
+MEMCACHE_WISHLIST_SEQUENCE_PREFIX = 'WISHLIST SEQUENCE:'
+CAS_RETRIES = 5
+
+ADD = 'add'
+REMOVE = 'remove'
+
+
+class FlushInProgressError(Exception):
+    """Another flush holds the user's wishlist flush lease."""
+
+
+def merged(profile):
+    """Return the wishlist of profile with its pending mutations applied."""
+    return replay(profile.wishlist,
+        memcache.get(MEMCACHE_WISHLIST_LOG_PREFIX + profile.key.id()) or [])
+
+
+def replay(wishlist, mutations):
+    """Return wishlist with mutations (dicts of op, websafeSessionKey)
+    applied in order; idempotent, so replays are harmless."""
+    wishlist = list(wishlist)
+    for mutation in mutations:
+        wsk = mutation['websafeSessionKey']
+        if mutation['op'] == ADD and wsk not in wishlist:
+            wishlist.append(wsk)
+        elif mutation['op'] == REMOVE and wsk in wishlist:
+            wishlist.remove(wsk)
+    return wishlist
+
+
+def record(userId, op, websafeSessionKey):
+    """Durably queue a wishlist mutation of a user, show it to the user's
+    reads, and schedule the flush of the user's wishlist."""
+    mutation = {'id': uuid.uuid4().hex, 'op': op,
+        'websafeSessionKey': websafeSessionKey, 'seq': _nextSequence(userId)}
+    taskqueue.Queue(WISHLIST_QUEUE).add(taskqueue.Task(
+        payload=json.dumps(mutation), method='PULL', tag=userId))
+    _updateLog(userId, lambda log: log + [mutation])
+    _scheduleFlush(userId)
+
+
+def _nextSequence(userId):
+    """Return the next number of a user's mutations, in recording order."""
+    now = int(time.time() * 1000)
+    seq = memcache.incr(MEMCACHE_WISHLIST_SEQUENCE_PREFIX + userId, initial_value=now)
+    # without memcache, the clock is the best order left
+    return seq if seq is not None else now
+
+
+def _updateLog(userId, change):
+    """Replace the memcache log of a user with change(log)."""
+    client = memcache.Client()
+    key = MEMCACHE_WISHLIST_LOG_PREFIX + userId
+    for _ in range(CAS_RETRIES):
+        log = client.gets(key)
+        if log is None:
+            if client.add(key, change([]), time=WISHLIST_LOG_SECONDS):
+                return True
+            continue
+        if client.cas(key, change(log), time=WISHLIST_LOG_SECONDS):
+            return True
+    # the queued mutation is still durable; only read-your-writes is lost
+    logging.warning('could not update the wishlist log of %s', userId)
+    return False
+
+
+def _scheduleFlush(userId):
+    """Add one flush task per user and WISHLIST_FLUSH_SECONDS window, due
+    after the window closes, so it sees every mutation of the window."""
+    window = int(time.time() // WISHLIST_FLUSH_SECONDS)
+    try:
+        taskqueue.add(url='/tasks/flush_wishlist', params={'userId': userId},
+            name='wishlist-%s-%d' % (hashlib.md5(userId.encode('utf-8')).hexdigest(), window),
+            countdown=(window + 1) * WISHLIST_FLUSH_SECONDS - time.time() + 1)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def flush(userId):
+    """Apply a user's queued mutations to the Profile, one put per batch
+    of WISHLIST_MAX_MUTATIONS, then delete them from the queue and the
+    memcache log; return how many were applied. Raise
+    FlushInProgressError if another flush of the user is running."""
+    queue = taskqueue.Queue(WISHLIST_QUEUE)
+    token = uuid.uuid4().hex
+    flushed = 0
+    try:
+        while True:
+            # renewed before each lease, so it always outlives the task leases
+            _acquireFlushLease(userId, token)
+            tasks = queue.lease_tasks_by_tag(WISHLIST_LEASE_SECONDS, WISHLIST_MAX_MUTATIONS, tag=userId)
+            if not tasks:
+                return flushed
+            flushed += _flushBatch(queue, userId, tasks, token)
+    finally:
+        _releaseFlushLease(userId, token)
+
+
+def _flushLeaseKey(userId):
+    return ndb.Key(WishlistFlushLease, WISHLIST_FLUSH_LEASE_ID, parent=ndb.Key(Profile, userId))
+
+
+@ndb.transactional()
+def _acquireFlushLease(userId, token):
+    key = _flushLeaseKey(userId)
+    lease = key.get()
+    now = datetime.now()
+    if lease and lease.token != token and lease.expires > now:
+        raise FlushInProgressError(userId)
+    WishlistFlushLease(key=key, token=token, expires=now + timedelta(
+        seconds=WISHLIST_LEASE_SECONDS + WISHLIST_FLUSH_LEASE_MARGIN)).put()
+
+
+@ndb.transactional()
+def _releaseFlushLease(userId, token):
+    lease = _flushLeaseKey(userId).get()
+    if lease and lease.token == token:
+        lease.key.delete()
+
+
+def _releaseTasks(queue, tasks):
+    """End the leases of tasks now, so the next flush applies them."""
+    for task in tasks:
+        try:
+            queue.modify_task_lease(task, 0)
+        except taskqueue.Error:
+            # leased again since; the new lease holder applies them
+            logging.warning('could not release wishlist mutation %s', task.name)
+
+
+def _flushBatch(queue, userId, tasks, token):
+    mutations = sorted((json.loads(task.payload) for task in tasks),
+        key=lambda mutation: mutation['seq'])
+
+    @ndb.transactional()
+    def applyMutations():
+        profile, lease = ndb.get_multi([ndb.Key(Profile, userId), _flushLeaseKey(userId)])
+        # fenced: once the lease expires, a newer flush may have applied
+        # later mutations, which these must not be applied over
+        if not lease or lease.token != token or lease.expires <= datetime.now():
+            raise FlushInProgressError(userId)
+        if not profile:
+            return
+        wishlist = replay(profile.wishlist, mutations)
+        if wishlist != profile.wishlist:
+            profile.wishlist = wishlist
+            profile.put()
+    try:
+        applyMutations()
+    except Exception:
+        _releaseTasks(queue, tasks)
+        raise
+
+    queue.delete_tasks(tasks)
+    applied = set(mutation['id'] for mutation in mutations)
+    _updateLog(userId, lambda log: [mutation for mutation in log if mutation['id'] not in applied])
+    return len(mutations)